@@ -0,0 +1,3 @@
+"""Headless benchmarks for Natter."""
+
+### __init__.py ends here
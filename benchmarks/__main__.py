@@ -0,0 +1,151 @@
+"""Run the benchmarks.
+
+Results are written as JSON Lines, one result per benchmark, so that they
+can be collected and compared over time.
+"""
+
+##############################################################################
+# Python imports.
+from argparse import ArgumentParser, FileType, Namespace
+from asyncio import run
+from importlib.util import find_spec
+from json import dumps
+from os import environ
+from sys import stdout
+from tempfile import mkdtemp
+from typing import TextIO
+
+##############################################################################
+# Local imports.
+from .fake_ollama import ReplyShape
+
+
+##############################################################################
+def get_args() -> Namespace:
+    """Get the command line arguments.
+
+    Returns:
+        The arguments.
+    """
+    parser = ArgumentParser(
+        prog="benchmarks", description="Headless benchmarks for Natter."
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=FileType("a"),
+        default=stdout,
+        help="Where to write results",
+    )
+    parser.add_argument(
+        "--tokens", type=int, default=2_000, help="Tokens in a streamed reply"
+    )
+    parser.add_argument(
+        "--token-rate",
+        type=float,
+        default=0.0,
+        help="Tokens per second to stream at (0 for as fast as possible)",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=1, help="Tokens in each streamed part"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds before a reply starts"
+    )
+    parser.add_argument(
+        "--render-cost",
+        type=float,
+        default=0.0,
+        help="Extra seconds each render of a streamed reply should take",
+    )
+    parser.add_argument(
+        "--history",
+        type=int,
+        nargs="+",
+        default=[10, 100, 500],
+        help="Turns of saved history to test startup and saving with",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Numbers of prompts to run at once when testing batches",
+    )
+    parser.add_argument(
+        "--slots",
+        type=int,
+        default=4,
+        help="The number of chats the server handles at once when testing batches",
+    )
+    return parser.parse_args()
+
+
+##############################################################################
+async def benchmark(args: Namespace, output: TextIO) -> None:
+    """Run the benchmarks.
+
+    Args:
+        args: The command line arguments.
+        output: Where to write the results.
+    """
+    # Imported here so that Natter only looks for its configuration once
+    # the environment has been set up.
+    from .scenarios import (
+        accumulation,
+        batch,
+        cancellation,
+        failover,
+        library,
+        memory,
+        recall,
+        save,
+        startup,
+        streaming,
+    )
+
+    def report(result: dict[str, object]) -> None:
+        output.write(f"{dumps(result)}\n")
+        output.flush()
+
+    report(
+        await streaming(
+            ReplyShape(
+                tokens=args.tokens,
+                token_rate=args.token_rate,
+                chunk_size=args.chunk_size,
+                latency=args.latency,
+            ),
+            args.render_cost,
+        )
+    )
+    report(await accumulation([1_000, 10_000, 100_000]))
+    report(await cancellation(ReplyShape(tokens=10_000, token_rate=100)))
+    history_reply = ReplyShape(tokens=500)
+    for turns in args.history:
+        report(await startup(turns, history_reply))
+    for turns in args.history:
+        report(await save(turns, history_reply))
+    report(await library(500, 50, history_reply))
+    report(await memory(200, 50, history_reply))
+    if find_spec("numpy") is not None:
+        report(await recall(1_000, 200_000, 768))
+    report(await failover(ReplyShape(tokens=50)))
+    batch_reply = ReplyShape(tokens=200, token_rate=1_000)
+    for concurrency in args.concurrency:
+        report(await batch(batch_reply, 16, concurrency, args.slots))
+
+
+##############################################################################
+def main() -> None:
+    """Main entry point for the benchmarks."""
+    args = get_args()
+    environ["XDG_CONFIG_HOME"] = mkdtemp(prefix="natter-benchmark-config-")
+    run(benchmark(args, args.output))
+
+
+##############################################################################
+if __name__ == "__main__":
+    main()
+
+### __main__.py ends here
@@ -0,0 +1,385 @@
+"""A local stand-in for an Ollama server, for benchmarking against."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from asyncio import (
+    FIRST_COMPLETED,
+    CancelledError,
+    IncompleteReadError,
+    Semaphore,
+    Server,
+    StreamReader,
+    StreamWriter,
+    create_task,
+    new_event_loop,
+    run_coroutine_threadsafe,
+    sleep,
+    start_server,
+    wait,
+)
+from collections.abc import Iterator
+from contextlib import AsyncExitStack, contextmanager, suppress
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from hashlib import blake2b
+from json import dumps, loads
+from threading import Thread
+from time import perf_counter
+from types import TracebackType
+from typing import Any, Final
+
+##############################################################################
+# Typing extensions imports.
+from typing_extensions import Self
+
+
+##############################################################################
+@dataclass
+class ReplyShape:
+    """The shape of the replies the fake server streams."""
+
+    tokens: int = 2_000
+    """The number of tokens in a reply."""
+
+    token_rate: float = 0.0
+    """The number of tokens to stream per second; `0` means no limit."""
+
+    chunk_size: int = 1
+    """The number of tokens to send in each part of the stream."""
+
+    latency: float = 0.0
+    """How long to wait before starting to stream a reply."""
+
+    paragraph: int = 40
+    """How many tokens to put in each paragraph of the reply."""
+
+    code_every: int = 5
+    """Put a code fence after every this many paragraphs; `0` for none."""
+
+    def token(self, index: int) -> str:
+        """Get a token of the reply.
+
+        Args:
+            index: The index of the token.
+
+        Returns:
+            The text of the token.
+        """
+        token = f"token{index} "
+        if (index + 1) % self.paragraph == 0:
+            paragraph = (index + 1) // self.paragraph
+            token += "\n\n"
+            if self.code_every and paragraph % self.code_every == 0:
+                token += f"```python\ndef paragraph_{paragraph}():\n    return {index}\n```\n\n"
+        return token
+
+
+##############################################################################
+class FakeOllama:
+    """A local stand-in for an Ollama server.
+
+    Implements just enough of the Ollama API for Natter to talk to it:
+    `/api/chat` (streaming or not), `/api/generate`, `/api/embed`,
+    `/api/ps` and `/api/version`.
+    """
+
+    EMBEDDING_DIMENSIONS: Final[int] = 64
+    """The number of dimensions of the embeddings the server makes."""
+
+    def __init__(self, shape: ReplyShape | None = None, slots: int = 0) -> None:
+        """Initialise the server.
+
+        Args:
+            shape: The shape of the replies to stream.
+            slots: The number of chats to handle at once; `0` means no limit.
+        """
+        self.shape = shape or ReplyShape()
+        """The shape of the replies to stream."""
+        self._slots = Semaphore(slots) if slots else None
+        """Limits how many chats are handled at once, like Ollama does."""
+        self.requests: list[tuple[str, dict[str, Any]]] = []
+        """The path and body of each request received."""
+        self.disconnects: list[float] = []
+        """When each client that went away part way through a reply was noticed."""
+        self._server: Server | None = None
+
+    @property
+    def url(self) -> str:
+        """The URL of the server."""
+        assert self._server is not None
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def __aenter__(self) -> Self:
+        self._server = await start_server(self._connection, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        del exc_type, exc_val, exc_traceback
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    @staticmethod
+    def _part(**values: Any) -> dict[str, Any]:
+        """Create a part of a response.
+
+        Args:
+            values: The values specific to the part.
+
+        Returns:
+            The part of the response.
+        """
+        return {
+            "model": "natter-benchmark",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **values,
+        }
+
+    @staticmethod
+    async def _send(writer: StreamWriter, body: dict[str, Any]) -> None:
+        """Send a complete JSON response.
+
+        Args:
+            writer: The writer to send the response with.
+            body: The body of the response.
+        """
+        data = dumps(body).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            b"Content-Length: %d\r\n\r\n%s" % (len(data), data)
+        )
+        await writer.drain()
+
+    async def _generate(self, writer: StreamWriter, key: str) -> None:
+        """Generate a reply, streaming it as it is generated.
+
+        Args:
+            writer: The writer to stream the reply with.
+            key: The key that holds the content in each part.
+        """
+
+        async def chunk(part: dict[str, Any]) -> None:
+            data = f"{dumps(part)}\n".encode()
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+
+        shape = self.shape
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        await sleep(shape.latency)
+        interval = (shape.chunk_size / shape.token_rate) if shape.token_rate else 0
+        # Each part is due at a set time from the start, so that the reply
+        # keeps to the token rate even if the odd part is sent late.
+        started = perf_counter()
+        for part, start in enumerate(range(0, shape.tokens, shape.chunk_size)):
+            text = "".join(
+                shape.token(index)
+                for index in range(start, min(start + shape.chunk_size, shape.tokens))
+            )
+            content = (
+                {"message": {"role": "assistant", "content": text}}
+                if key == "message"
+                else {"response": text}
+            )
+            await chunk(self._part(**content, done=False))
+            await sleep(max(0, started + ((part + 1) * interval) - perf_counter()))
+        await chunk(
+            self._part(
+                **(
+                    {"message": {"role": "assistant", "content": ""}}
+                    if key == "message"
+                    else {"response": ""}
+                ),
+                done=True,
+                done_reason="stop",
+                eval_count=shape.tokens,
+                eval_duration=int(interval * shape.tokens * 1e9 / shape.chunk_size),
+            )
+        )
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _stream(
+        self, reader: StreamReader, writer: StreamWriter, key: str
+    ) -> None:
+        """Stream a reply, stopping if the client goes away.
+
+        Args:
+            reader: The reader for the connection.
+            writer: The writer to stream the reply with.
+            key: The key that holds the content in each part.
+
+        Raises:
+            ConnectionResetError: If the client went away during the reply.
+        """
+        generating = create_task(self._generate(writer, key))
+        # The client won't send anything more while the reply is streaming,
+        # so anything coming back from a read means it has gone away.
+        closed = create_task(reader.read(1))
+        await wait((generating, closed), return_when=FIRST_COMPLETED)
+        if generating.done():
+            closed.cancel()
+            with suppress(CancelledError):
+                await closed
+            await generating
+        else:
+            # This is the point at which Ollama would stop generating.
+            self.disconnects.append(perf_counter())
+            generating.cancel()
+            raise ConnectionResetError("Client went away during the reply")
+
+    async def _chat(
+        self, reader: StreamReader, writer: StreamWriter, body: dict[str, Any]
+    ) -> None:
+        """Reply to a chat request.
+
+        Args:
+            reader: The reader for the connection.
+            writer: The writer for the response.
+            body: The body of the request.
+        """
+        if body.get("stream", True):
+            await self._stream(reader, writer, "message")
+        else:
+            await self._send(
+                writer,
+                self._part(
+                    message={
+                        "role": "assistant",
+                        "content": "".join(
+                            self.shape.token(index)
+                            for index in range(self.shape.tokens)
+                        ),
+                    },
+                    done=True,
+                ),
+            )
+
+    @classmethod
+    def embedding(cls, text: str) -> list[float]:
+        """Make a stand-in embedding of some text.
+
+        Args:
+            text: The text to embed.
+
+        Returns:
+            The embedding.
+
+        Note:
+            Each word is hashed into one of the dimensions, so texts that
+            share words are similar, which is enough to test recall with.
+        """
+        embedding = [0.0] * cls.EMBEDDING_DIMENSIONS
+        for word in text.lower().split():
+            digest = blake2b(word.strip(".,!?").encode(), digest_size=4).digest()
+            embedding[int.from_bytes(digest, "big") % cls.EMBEDDING_DIMENSIONS] += 1.0
+        return embedding
+
+    async def _request(self, reader: StreamReader, writer: StreamWriter) -> None:
+        """Handle a single request.
+
+        Args:
+            reader: The reader for the request.
+            writer: The writer for the response.
+        """
+        head = (await reader.readuntil(b"\r\n\r\n")).decode()
+        request_line, *headers = head.split("\r\n")
+        length = 0
+        for header in headers:
+            name, _, value = header.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        body = loads(await reader.readexactly(length)) if length else {}
+        path = request_line.split()[1]
+        self.requests.append((path, body))
+        if path == "/api/chat":
+            async with AsyncExitStack() as slot:
+                if self._slots is not None:
+                    await slot.enter_async_context(self._slots)
+                await self._chat(reader, writer, body)
+        elif path == "/api/generate":
+            if body.get("stream", True):
+                await self._stream(reader, writer, "response")
+            else:
+                await self._send(writer, self._part(response="", done=True))
+        elif path == "/api/embed":
+            texts = body.get("input", [])
+            await self._send(
+                writer,
+                {
+                    "model": body.get("model", ""),
+                    "embeddings": [
+                        self.embedding(text)
+                        for text in ([texts] if isinstance(texts, str) else texts)
+                    ],
+                },
+            )
+        elif path == "/api/ps":
+            await self._send(writer, {"models": []})
+        else:
+            await self._send(writer, {"version": "0.0.0-natter-benchmark"})
+
+    async def _connection(self, reader: StreamReader, writer: StreamWriter) -> None:
+        """Handle a connection from a client.
+
+        Args:
+            reader: The reader for the connection.
+            writer: The writer for the connection.
+        """
+        try:
+            while not reader.at_eof():
+                await self._request(reader, writer)
+        except (IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+##############################################################################
+@contextmanager
+def threaded_fake_ollama(
+    shape: ReplyShape | None = None, slots: int = 0
+) -> Iterator[FakeOllama]:
+    """Run a fake Ollama server in a thread of its own.
+
+    Args:
+        shape: The shape of the replies to stream.
+        slots: The number of chats to handle at once; `0` means no limit.
+
+    Yields:
+        The server.
+
+    Note:
+        With its own thread, and so its own event loop, the server streams
+        at its own pace however busy the event loop of the client is, just
+        as a real server would.
+    """
+    server = FakeOllama(shape, slots)
+    loop = new_event_loop()
+    thread = Thread(target=loop.run_forever, name="fake-ollama", daemon=True)
+    thread.start()
+    try:
+        run_coroutine_threadsafe(server.__aenter__(), loop).result()
+        try:
+            yield server
+        finally:
+            run_coroutine_threadsafe(server.__aexit__(None, None, None), loop).result()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+### fake_ollama.py ends here
@@ -0,0 +1,720 @@
+"""The benchmark scenarios."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from collections.abc import Callable
+from contextlib import closing, contextmanager
+from gc import collect
+from io import StringIO
+from os import environ
+from socket import socket
+from sqlite3 import connect
+from statistics import median, quantiles
+from sys import getsizeof
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+from tracemalloc import get_traced_memory, start, stop
+from typing import Any, Iterator
+
+##############################################################################
+# Local imports.
+from natter.app import Natter
+from natter.backend import ChatStream, ClientPool, HostPool, embed
+from natter.batch import Batch, Prompt
+from natter.data import (
+    ConversationData,
+    ConversationJournal,
+    ConversationLibrary,
+    library_file,
+    ongoing_journal,
+    recall_dir,
+)
+from natter.screens import Main
+from natter.widgets import Assistant, Conversation
+from natter.widgets.output.conversation import Interaction
+
+from .fake_ollama import FakeOllama, ReplyShape, threaded_fake_ollama
+
+##############################################################################
+Result = dict[str, Any]
+"""The type of the result of a benchmark."""
+
+
+##############################################################################
+@contextmanager
+def isolated_data() -> Iterator[None]:
+    """Run with a fresh, empty, data directory."""
+    previous = environ.get("XDG_DATA_HOME")
+    with TemporaryDirectory(prefix="natter-benchmark-") as data:
+        environ["XDG_DATA_HOME"] = data
+        try:
+            yield
+        finally:
+            if previous is None:
+                del environ["XDG_DATA_HOME"]
+            else:
+                environ["XDG_DATA_HOME"] = previous
+
+
+##############################################################################
+@contextmanager
+def timed_flushes(cost: float = 0.0) -> Iterator[list[tuple[float, float]]]:
+    """Time every render of a streamed response.
+
+    Args:
+        cost: Extra time, in seconds, to block the event loop for during
+            each render, to simulate an expensive render.
+
+    Yields:
+        A list that collects the start and end time of every render.
+    """
+    flushes: list[tuple[float, float]] = []
+    original = Interaction._flush
+
+    async def flush(interaction: Interaction) -> None:
+        started = perf_counter()
+        if cost:
+            sleep(cost)
+        await original(interaction)
+        flushes.append((started, perf_counter()))
+
+    setattr(Interaction, "_flush", flush)
+    try:
+        yield flushes
+    finally:
+        setattr(Interaction, "_flush", original)
+
+
+##############################################################################
+@contextmanager
+def timed_receipts() -> Iterator[list[float]]:
+    """Time the receipt of every part of a streamed response.
+
+    Yields:
+        A list that collects the time each part was received.
+    """
+    receipts: list[float] = []
+    original = Interaction.update_response
+
+    def update_response(interaction: Interaction, response: str) -> None:
+        receipts.append(perf_counter())
+        original(interaction, response)
+
+    setattr(Interaction, "update_response", update_response)
+    try:
+        yield receipts
+    finally:
+        setattr(Interaction, "update_response", original)
+
+
+##############################################################################
+def _milliseconds(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+##############################################################################
+def _distribution(samples: list[float]) -> dict[str, float]:
+    """Summarise a collection of timings.
+
+    Args:
+        samples: The timings, in seconds.
+
+    Returns:
+        The median, 95th percentile and maximum, in milliseconds.
+    """
+    if not samples:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    return {
+        "p50_ms": _milliseconds(median(samples)),
+        "p95_ms": _milliseconds(
+            quantiles(samples, n=20, method="inclusive")[-1]
+            if len(samples) > 1
+            else samples[0]
+        ),
+        "max_ms": _milliseconds(max(samples)),
+    }
+
+
+##############################################################################
+def _history(turns: int, reply: ReplyShape) -> ConversationData:
+    """Create a conversation with a given number of turns.
+
+    Args:
+        turns: The number of turns to create.
+        reply: The shape of each of the assistant's replies.
+
+    Returns:
+        The conversation.
+    """
+    text = "".join(reply.token(index) for index in range(reply.tokens))
+    conversation = ConversationData("Benchmark", "natter-benchmark")
+    for turn in range(turns):
+        conversation.record({"role": "user", "content": f"Question {turn}"})
+        conversation.record({"role": "assistant", "content": text})
+    return conversation
+
+
+##############################################################################
+async def accumulation(chunk_counts: list[int], repeats: int = 5) -> Result:
+    """Benchmark recording a streamed reply in the history, a chunk at a time.
+
+    Args:
+        chunk_counts: The numbers of chunks to stream into the reply.
+        repeats: The number of times to record each reply.
+
+    Returns:
+        The result of the benchmark.
+
+    Note:
+        If recording is linear in the number of chunks, the time taken per
+        chunk should stay the same however many chunks there are.
+    """
+    reply = ReplyShape()
+    metrics: dict[str, dict[str, float]] = {}
+    for chunks in chunk_counts:
+        parts = [
+            {"role": "assistant", "content": reply.token(index)}
+            for index in range(chunks)
+        ]
+        timings: list[float] = []
+        for _ in range(repeats):
+            conversation = ConversationData("Benchmark", "natter-benchmark")
+            conversation.record({"role": "user", "content": "Question"})
+            started = perf_counter()
+            for part in parts:
+                conversation.record(part)
+            # Looking at the history is what brings the chunks together.
+            for _ in conversation:
+                pass
+            timings.append(perf_counter() - started)
+        metrics[str(chunks)] = {
+            "record_ms": _milliseconds(median(timings)),
+            "per_chunk_us": round(median(timings) / chunks * 1_000_000, 3),
+        }
+    return {
+        "benchmark": "accumulation",
+        "parameters": {"chunks": chunk_counts, "repeats": repeats},
+        "metrics": metrics,
+    }
+
+
+##############################################################################
+async def streaming(shape: ReplyShape, render_cost: float = 0.0) -> Result:
+    """Benchmark streaming a reply into the conversation.
+
+    Args:
+        shape: The shape of the reply to stream.
+        render_cost: Extra time, in seconds, that each render should take.
+
+    Returns:
+        The result of the benchmark.
+    """
+    with isolated_data():
+        with threaded_fake_ollama(shape) as server:
+            app = Natter()
+            async with app.run_test() as pilot:
+                await pilot.pause()
+                assert isinstance(main := app.screen, Main)
+                await main.process_command(f"host {server.url}")
+                await app.workers.wait_for_complete()
+                with (
+                    timed_flushes(render_cost) as flushes,
+                    timed_receipts() as receipts,
+                ):
+                    started = perf_counter()
+                    main.process_input("Benchmark prompt")
+                    await pilot.pause()
+                    await app.workers.wait_for_complete()
+                    finished = perf_counter()
+                await pilot.pause()
+                assistant = main.query_one(Conversation).query(Assistant).last()
+                rendered = len(assistant.raw_text)
+                assert main._metrics is not None
+                loop_lag = main._metrics.loop_lag
+    return {
+        "benchmark": "streaming",
+        "parameters": {
+            "tokens": shape.tokens,
+            "token_rate": shape.token_rate,
+            "chunk_size": shape.chunk_size,
+            "latency": shape.latency,
+            "render_cost_ms": _milliseconds(render_cost),
+        },
+        "metrics": {
+            "time_to_first_paint_ms": _milliseconds(
+                (flushes[0][1] if flushes else finished) - started
+            ),
+            "received_ms": _milliseconds(
+                (receipts[-1] if receipts else finished) - started
+            ),
+            "total_ms": _milliseconds(finished - started),
+            "tokens_per_second": round(shape.tokens / (finished - started), 1),
+            "renders": len(flushes),
+            "render_latency": _distribution([end - start for start, end in flushes]),
+            "rendered_characters": rendered,
+            "worst_loop_lag_ms": _milliseconds(loop_lag),
+        },
+    }
+
+
+##############################################################################
+async def cancellation(shape: ReplyShape, after: float = 0.25) -> Result:
+    """Benchmark stopping a reply part way through.
+
+    Args:
+        shape: The shape of the reply to stream; it should take longer than
+            `after` to stream.
+        after: How long to let the reply stream for before stopping it.
+
+    Returns:
+        The result of the benchmark.
+    """
+    with isolated_data():
+        with threaded_fake_ollama(shape) as server:
+            app = Natter()
+            async with app.run_test() as pilot:
+                await pilot.pause()
+                assert isinstance(main := app.screen, Main)
+                await main.process_command(f"host {server.url}")
+                await app.workers.wait_for_complete()
+                main.process_input("Benchmark prompt")
+                await pilot.pause(after)
+                stopped = perf_counter()
+                main.stop_interaction()
+                while not server.disconnects and perf_counter() - stopped < 5:
+                    await pilot.pause(0.001)
+                await pilot.pause()
+            reply = list(ConversationJournal(ongoing_journal()).load())[-1]
+    return {
+        "benchmark": "cancellation",
+        "parameters": {
+            "tokens": shape.tokens,
+            "token_rate": shape.token_rate,
+            "chunk_size": shape.chunk_size,
+            "after_ms": _milliseconds(after),
+        },
+        "metrics": {
+            "connection_closed": bool(server.disconnects),
+            "close_ms": _milliseconds(server.disconnects[0] - stopped)
+            if server.disconnects
+            else None,
+            "kept_characters": len(reply["content"])
+            if ConversationData.is_assistant(reply)
+            else 0,
+            "marked_interrupted": ConversationData.is_interrupted(reply),
+        },
+    }
+
+
+##############################################################################
+async def startup(turns: int, reply: ReplyShape) -> Result:
+    """Benchmark starting up with a large saved conversation.
+
+    Args:
+        turns: The number of turns in the saved conversation.
+        reply: The shape of each of the assistant's replies.
+
+    Returns:
+        The result of the benchmark.
+    """
+    with isolated_data():
+        ConversationJournal(ongoing_journal()).snapshot(_history(turns, reply))
+        started = perf_counter()
+        app = Natter()
+        async with app.run_test() as pilot:
+            await pilot.pause()
+            first_paint = perf_counter() - started
+            mounted = len(app.screen.query_one(Conversation).children)
+            assert isinstance(screen := app.screen, Main)
+            await screen._history_loaded()
+            history_loaded = perf_counter() - started
+    return {
+        "benchmark": "startup",
+        "parameters": {"turns": turns, "reply_tokens": reply.tokens},
+        "metrics": {
+            "time_to_first_paint_ms": _milliseconds(first_paint),
+            "history_loaded_ms": _milliseconds(history_loaded),
+            "mounted_widgets": mounted,
+        },
+    }
+
+
+##############################################################################
+async def save(turns: int, reply: ReplyShape, repeats: int = 20) -> Result:
+    """Benchmark saving a conversation after each turn.
+
+    Args:
+        turns: The number of turns already in the conversation.
+        reply: The shape of each of the assistant's replies.
+        repeats: The number of turns to add and save.
+
+    Returns:
+        The result of the benchmark.
+    """
+    with isolated_data():
+        conversation = _history(turns, reply)
+        journal = ConversationJournal(ongoing_journal())
+        journal.snapshot(conversation)
+        text = "".join(reply.token(index) for index in range(reply.tokens))
+        timings: list[float] = []
+        for turn in range(repeats):
+            conversation.record({"role": "user", "content": f"More {turn}"})
+            conversation.record({"role": "assistant", "content": text})
+            started = perf_counter()
+            journal.save(conversation)
+            timings.append(perf_counter() - started)
+    return {
+        "benchmark": "save",
+        "parameters": {"turns": turns, "reply_tokens": reply.tokens},
+        "metrics": {"save": _distribution(timings)},
+    }
+
+
+##############################################################################
+async def library(conversations: int, turns: int, reply: ReplyShape) -> Result:
+    """Benchmark listing, opening and searching conversations in the library.
+
+    Args:
+        conversations: The number of conversations in the library.
+        turns: The number of turns in each conversation.
+        reply: The shape of each of the assistant's replies.
+
+    Returns:
+        The result of the benchmark.
+    """
+    with isolated_data():
+        stored = ConversationLibrary(library_file())
+        for conversation in range(conversations):
+            stored.store(_history(turns, reply))
+        started = perf_counter()
+        entries = stored.entries()
+        listing = perf_counter() - started
+        timings: list[float] = []
+        for entry in entries[:: max(1, len(entries) // 20)]:
+            started = perf_counter()
+            stored.load(entry.id)
+            timings.append(perf_counter() - started)
+        searches: list[float] = []
+        for turn in range(0, turns, max(1, turns // 20)):
+            started = perf_counter()
+            stored.search(["question", str(turn)])
+            searches.append(perf_counter() - started)
+        # Storing a conversation again after another turn should only need
+        # the new messages to be indexed.
+        changed = stored.load(entries[0].id)
+        assert changed is not None
+        changed.record({"role": "user", "content": "One more question"})
+        changed.record({"role": "assistant", "content": "One more answer"})
+        started = perf_counter()
+        stored.store(changed)
+        storing = perf_counter() - started
+    return {
+        "benchmark": "library",
+        "parameters": {
+            "conversations": conversations,
+            "turns": turns,
+            "reply_tokens": reply.tokens,
+        },
+        "metrics": {
+            "list_ms": _milliseconds(listing),
+            "open": _distribution(timings),
+            "search": _distribution(searches),
+            "store_turn_ms": _milliseconds(storing),
+        },
+    }
+
+
+##############################################################################
+def _allocated(load: Callable[[], object]) -> int:
+    """Find how much memory is held on to by what something loads.
+
+    Args:
+        load: The function that does the loading.
+
+    Returns:
+        The number of bytes allocated by the loading that are still in use
+        while what was loaded is held on to.
+    """
+    collect()
+    start()
+    try:
+        loaded = load()
+        allocated, _ = get_traced_memory()
+    finally:
+        stop()
+    del loaded
+    return allocated
+
+
+##############################################################################
+async def memory(conversations: int, turns: int, reply: ReplyShape) -> Result:
+    """Benchmark the memory taken by loading many conversations at once.
+
+    Args:
+        conversations: The number of conversations to load.
+        turns: The number of turns in each conversation.
+        reply: The shape of each of the assistant's replies.
+
+    Returns:
+        The result of the benchmark.
+
+    Note:
+        For comparison, the same messages are also loaded as the plain
+        dictionaries that the history of a conversation used to be made of.
+    """
+    with isolated_data():
+        stored = ConversationLibrary(library_file())
+        for _ in range(conversations):
+            stored.store(_history(turns, reply))
+        identities = [entry.id for entry in stored.entries()]
+
+        def load_messages() -> list[ConversationData | None]:
+            return [stored.load(identity) for identity in identities]
+
+        def load_dictionaries() -> list[list[dict[str, str]]]:
+            with closing(connect(library_file())) as database:
+                return [
+                    [
+                        {"role": role, "content": content}
+                        | ({"done_reason": done_reason} if done_reason else {})
+                        for role, content, done_reason in database.execute(
+                            "SELECT role, content, done_reason FROM messages "
+                            "WHERE conversation = ? ORDER BY position",
+                            (identity,),
+                        )
+                    ]
+                    for identity in identities
+                ]
+
+        messages = _allocated(load_messages)
+        dictionaries = _allocated(load_dictionaries)
+        loaded = [
+            conversation for conversation in load_messages() if conversation is not None
+        ]
+        count = sum(len(conversation.history) for conversation in loaded)
+        content = sum(
+            getsizeof(message.content)
+            for conversation in loaded
+            for message in conversation
+        )
+    return {
+        "benchmark": "memory",
+        "parameters": {
+            "conversations": conversations,
+            "turns": turns,
+            "reply_tokens": reply.tokens,
+        },
+        "metrics": {
+            "messages": count,
+            "content_bytes": content,
+            "message_bytes": messages,
+            "dictionary_bytes": dictionaries,
+            "overhead_per_message": round((messages - content) / count, 1),
+            "dictionary_overhead_per_message": round(
+                (dictionaries - content) / count, 1
+            ),
+        },
+    }
+
+
+##############################################################################
+async def recall(messages: int, indexed: int, dimensions: int) -> Result:
+    """Benchmark remembering and recalling messages.
+
+    Args:
+        messages: The number of messages to embed through the server.
+        indexed: The number of messages in the index to search.
+        dimensions: The number of dimensions of the embeddings to search.
+
+    Returns:
+        The result of the benchmark.
+
+    Note:
+        This needs NumPy, which is an optional dependency of Natter.
+    """
+    import numpy as np
+
+    from natter.data.recall_index import RecallIndex
+
+    async with FakeOllama() as server:
+        clients = ClientPool()
+        started = perf_counter()
+        await embed(
+            HostPool([server.url]),
+            clients,
+            "natter-benchmark",
+            [f"Message {message} about nothing much" for message in range(messages)],
+        )
+        embedding = perf_counter() - started
+        await clients.close()
+        requests = sum(path == "/api/embed" for path, _ in server.requests)
+    with isolated_data():
+        index = RecallIndex(recall_dir("natter-benchmark"))
+        vectors = np.random.default_rng(42).standard_normal(
+            (10_000, dimensions), dtype=np.float32
+        )
+        for _ in range(indexed // len(vectors)):
+            index.add(
+                vectors,
+                [
+                    {
+                        "title": "Benchmark",
+                        "library_id": None,
+                        "role": "user",
+                        "content": "",
+                    }
+                ]
+                * len(vectors),
+            )
+        timings: list[float] = []
+        for query in vectors[:20]:
+            started = perf_counter()
+            index.search(query, 5)
+            timings.append(perf_counter() - started)
+        size = len(index)
+    return {
+        "benchmark": "recall",
+        "parameters": {
+            "messages": messages,
+            "indexed": size,
+            "dimensions": dimensions,
+        },
+        "metrics": {
+            "embed_ms": _milliseconds(embedding),
+            "embed_requests": requests,
+            "search": _distribution(timings),
+        },
+    }
+
+
+##############################################################################
+async def batch(
+    shape: ReplyShape, prompts: int, concurrency: int, slots: int
+) -> Result:
+    """Benchmark running a batch of prompts.
+
+    Args:
+        shape: The shape of the reply to each prompt.
+        prompts: The number of prompts in the batch.
+        concurrency: The number of prompts to run at once.
+        slots: The number of chats the server handles at once.
+
+    Returns:
+        The result of the benchmark.
+    """
+    async with FakeOllama(shape, slots) as server:
+        runner = Batch("natter-benchmark", server.url, concurrency)
+        started = perf_counter()
+        await runner.run(
+            (Prompt(prompt, f"Prompt {prompt}") for prompt in range(prompts)),
+            StringIO(),
+        )
+        elapsed = perf_counter() - started
+    return {
+        "benchmark": "batch",
+        "parameters": {
+            "prompts": prompts,
+            "concurrency": concurrency,
+            "slots": slots,
+            "tokens": shape.tokens,
+            "token_rate": shape.token_rate,
+        },
+        "metrics": {
+            "total_ms": _milliseconds(elapsed),
+            "prompts_per_second": round(prompts / elapsed, 2),
+            "failures": runner.failures,
+        },
+    }
+
+
+##############################################################################
+def _unreachable_host() -> str:
+    """Get a host that nothing is listening on.
+
+    Returns:
+        The URL of the host.
+    """
+    with socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{unused.getsockname()[1]}"
+
+
+##############################################################################
+async def _chat_repeatedly(
+    hosts: HostPool, requests: int
+) -> tuple[list[float], list[str]]:
+    """Chat repeatedly with a pool of hosts.
+
+    Args:
+        hosts: The pool of hosts to chat with.
+        requests: The number of chats to have.
+
+    Returns:
+        The time each chat took to start replying, including any time spent
+        failing over, and the host that served each chat.
+    """
+    clients = ClientPool()
+    first_tokens: list[float] = []
+    served_by: list[str] = []
+    try:
+        for request in range(requests):
+            started = perf_counter()
+            async with ChatStream(
+                hosts,
+                clients,
+                model="natter-benchmark",
+                messages=[{"role": "user", "content": f"Request {request}"}],
+            ) as chat:
+                async for _ in chat:
+                    if len(first_tokens) == request:
+                        first_tokens.append(perf_counter() - started)
+                served_by.append(chat.host or "")
+    finally:
+        await clients.close()
+    return first_tokens, served_by
+
+
+##############################################################################
+async def failover(shape: ReplyShape, requests: int = 20) -> Result:
+    """Benchmark failing over from a host that can't be reached.
+
+    Args:
+        shape: The shape of the reply to each request.
+        requests: The number of requests to make.
+
+    Returns:
+        The result of the benchmark.
+
+    Note:
+        The same requests are made to the live host on its own, for
+        comparison, and then to a pool where a host that can't be reached
+        comes first; only the first request should have to fail over, as
+        from then on the host that can't be reached is known to be
+        unhealthy and is tried last.
+    """
+    async with FakeOllama(shape) as server:
+        live = server.url
+        direct, _ = await _chat_repeatedly(HostPool([live]), requests)
+        hosts = HostPool([_unreachable_host(), live])
+        failing_over, served_by = await _chat_repeatedly(hosts, requests)
+    return {
+        "benchmark": "failover",
+        "parameters": {"requests": requests, "tokens": shape.tokens},
+        "metrics": {
+            "served_by_live_host": served_by.count(live),
+            "dead_host_healthy": hosts.states[0].healthy,
+            "direct_first_token": _distribution(direct),
+            "failover_first_token_ms": _milliseconds(failing_over[0]),
+            # The first request in each case has to connect to the live
+            # host, so those are the two to compare.
+            "failover_cost_ms": _milliseconds(failing_over[0] - direct[0]),
+            "after_failover_first_token": _distribution(failing_over[1:]),
+        },
+    }
+
+
+### scenarios.py ends here
@@ -1,14 +1,76 @@
 """Main entry point for the application."""
 
+##############################################################################
+# Python imports.
+from argparse import ArgumentParser, FileType, Namespace
+from asyncio import run as run_async
+from sys import exit as sys_exit
+from sys import stdout
+
 ##############################################################################
 # Local imports.
 from .app import Natter
+from .batch import Batch, read_prompts
+from .data import ConversationJournal, ongoing_journal
+
+
+##############################################################################
+def get_args() -> Namespace:
+    """Get the command line arguments.
+
+    Returns:
+        The arguments.
+    """
+    parser = ArgumentParser(
+        prog="natter", description="A terminal-based ollama chat interface."
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        type=FileType("r", encoding="utf-8"),
+        help="Run the prompts in a file (or - for stdin) rather than chatting",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=4,
+        help="The number of batch prompts to run at once",
+    )
+    parser.add_argument(
+        "-m", "--model", help="The model to use for a batch (default: as chatting)"
+    )
+    parser.add_argument(
+        "--host", help="The host(s) to use for a batch (default: as chatting)"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=FileType("a", encoding="utf-8"),
+        default=stdout,
+        help="Where to write the results of a batch",
+    )
+    return parser.parse_args()
 
 
 ##############################################################################
 def run() -> None:
     """Run the application."""
-    Natter().run()
+    args = get_args()
+    if args.batch is None:
+        Natter().run()
+        return
+    model, host = "llama3", ""
+    if (journal := ConversationJournal(ongoing_journal())).exists():
+        conversation = journal.load_tail(0)
+        model, host = conversation.model, conversation.host
+    batch = Batch(
+        args.model or model,
+        host if args.host is None else args.host,
+        args.concurrency,
+    )
+    run_async(batch.run(read_prompts(args.batch), args.output))
+    sys_exit(1 if batch.failures else 0)
 
 
 ##############################################################################
@@ -0,0 +1,31 @@
+"""Code for talking to Ollama servers."""
+
+##############################################################################
+# Local imports.
+from .chat_stream import ChatStream
+from .client_pool import ClientPool, ConnectionTiming, HostStatistics
+from .embeddings import embed
+from .host_pool import (
+    CONNECTION_ERRORS,
+    ROUTING_STRATEGIES,
+    HostPool,
+    HostState,
+    RoutingStrategy,
+)
+
+##############################################################################
+# Exports.
+__all__ = [
+    "CONNECTION_ERRORS",
+    "ROUTING_STRATEGIES",
+    "ChatStream",
+    "ClientPool",
+    "ConnectionTiming",
+    "HostPool",
+    "HostState",
+    "HostStatistics",
+    "RoutingStrategy",
+    "embed",
+]
+
+### __init__.py ends here
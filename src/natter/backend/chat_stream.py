@@ -0,0 +1,137 @@
+"""Provides a streaming chat with one of a pool of hosts."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from collections.abc import AsyncGenerator, AsyncIterator, Mapping, Sequence
+from time import monotonic
+from types import TracebackType
+from typing import Any
+
+##############################################################################
+# Ollama imports.
+from ollama import ChatResponse, Message
+
+##############################################################################
+# Typing extensions imports.
+from typing_extensions import Self
+
+##############################################################################
+# Local imports.
+from .client_pool import ClientPool
+from .host_pool import CONNECTION_ERRORS, HostPool
+
+
+##############################################################################
+class ChatStream:
+    """Context manager for a streaming chat with one of a pool of hosts.
+
+    The hosts in the pool are tried in the order the pool prefers; if a host
+    can't be reached before it starts replying, the next host is tried.
+    """
+
+    def __init__(
+        self,
+        hosts: HostPool,
+        clients: ClientPool,
+        *,
+        model: str,
+        messages: Sequence[Mapping[str, Any] | Message],
+        keep_alive: float | str | None = None,
+    ) -> None:
+        """Initialise the chat.
+
+        Args:
+            hosts: The pool of hosts to chat with.
+            clients: The pool of clients for talking to the hosts.
+            model: The model to chat with.
+            messages: The messages to send.
+            keep_alive: How long the model should stay loaded afterwards.
+        """
+        self._hosts = hosts
+        self._clients = clients
+        self._model = model
+        self._messages = messages
+        self._keep_alive = keep_alive
+        self._stream: AsyncIterator[ChatResponse] | None = None
+        self._first: ChatResponse | None = None
+        self.host: str | None = None
+        """The host that is replying, once one has started replying."""
+        self.time_to_first_token = 0.0
+        """The time it took for the host to start replying."""
+        self.connect_time = 0.0
+        """The part of the time to first token spent setting up a connection."""
+
+    async def _start(self, host: str) -> None:
+        """Start the chat with a given host.
+
+        Args:
+            host: The host to start the chat with.
+        """
+        started = monotonic()
+        with self._clients.timing() as timing:
+            self._stream = await (await self._clients.client(host)).chat(
+                model=self._model,
+                messages=self._messages,
+                stream=True,
+                keep_alive=self._keep_alive,
+            )
+            self._first = await anext(self._stream, None)
+        self.time_to_first_token = monotonic() - started
+        self.connect_time = timing.connect_time
+        self._hosts.first_token(host, self.time_to_first_token)
+
+    async def __aenter__(self) -> Self:
+        """Start the chat with the first host that can be reached.
+
+        Raises:
+            ConnectError: If none of the hosts could be reached.
+            ConnectionError: If none of the hosts could be reached.
+            ResponseError: If the host that was reached reported an error.
+        """
+        for host in self._hosts.candidates():
+            self._hosts.started(host)
+            try:
+                await self._start(host)
+            except CONNECTION_ERRORS as error:
+                self._hosts.finished(host)
+                self._hosts.failed(host)
+                failure = error
+            except BaseException:
+                self._hosts.finished(host)
+                raise
+            else:
+                self.host = host
+                return self
+        raise failure
+
+    async def __aiter__(self) -> AsyncIterator[ChatResponse]:
+        """Iterate over the parts of the reply."""
+        if self._first is not None:
+            yield self._first
+        if self._stream is not None:
+            async for part in self._stream:
+                yield part
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        """Close down the chat.
+
+        Closing the chat also closes the connection the reply is being
+        streamed over, if it is still open.
+        """
+        del exc_type, exc_val, exc_traceback
+        if isinstance(self._stream, AsyncGenerator):
+            await self._stream.aclose()
+        if self.host is not None:
+            self._hosts.finished(self.host)
+
+
+### chat_stream.py ends here
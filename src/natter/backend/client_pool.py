@@ -0,0 +1,283 @@
+"""Provides a pool of Ollama clients, one per host."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from importlib.util import find_spec
+from time import monotonic
+from typing import Any, Final
+
+##############################################################################
+# httpx imports.
+from httpx import (
+    AsyncBaseTransport,
+    AsyncByteStream,
+    AsyncHTTPTransport,
+    Limits,
+    Request,
+    Response,
+)
+
+##############################################################################
+# Ollama imports.
+from ollama import AsyncClient
+
+
+##############################################################################
+@dataclass
+class HostStatistics:
+    """Statistics about the connections made to a host."""
+
+    requests: int = 0
+    """The number of requests made to the host."""
+
+    connections: int = 0
+    """The number of connections opened to the host."""
+
+    connect_time: float = 0.0
+    """The total time spent setting up connections to the host."""
+
+    @property
+    def reused(self) -> int:
+        """The number of requests that reused an existing connection."""
+        return max(self.requests - self.connections, 0)
+
+    def __str__(self) -> str:
+        """A summary of the statistics."""
+        return (
+            f"{self.requests} requests over {self.connections} connections "
+            f"({self.reused} reused), "
+            f"{self.connect_time * 1000:.0f}ms spent connecting"
+        )
+
+
+##############################################################################
+@dataclass
+class ConnectionTiming:
+    """The time spent setting up connections for some requests."""
+
+    connect_time: float = 0.0
+    """The time spent setting up connections for the requests, in seconds."""
+
+
+##############################################################################
+_CONNECTION_TIMING: Final[ContextVar[ConnectionTiming | None]] = ContextVar(
+    "natter_connection_timing", default=None
+)
+"""The timing of connections for the requests currently being made, if any."""
+
+
+##############################################################################
+class ReleasingStream(AsyncByteStream):
+    """A response stream that lets its transport know when it's closed."""
+
+    def __init__(self, stream: AsyncByteStream, transport: InstrumentedTransport):
+        """Initialise the stream.
+
+        Args:
+            stream: The stream of the response.
+            transport: The transport that made the request.
+        """
+        self._stream = stream
+        self._transport: InstrumentedTransport | None = transport
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        """Iterate over the body of the response."""
+        async for part in self._stream:
+            yield part
+
+    async def aclose(self) -> None:
+        """Close the stream."""
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._transport is not None:
+                self._transport.in_flight -= 1
+                self._transport = None
+
+
+##############################################################################
+class InstrumentedTransport(AsyncBaseTransport):
+    """A transport that records statistics about the connections it makes."""
+
+    _CONNECTING: Final[tuple[str, ...]] = ("connection.connect_tcp.started",)
+    """The trace events that mark the start of setting up a connection."""
+
+    _CONNECTED: Final[tuple[str, ...]] = (
+        "connection.connect_tcp.complete",
+        "connection.start_tls.complete",
+    )
+    """The trace events that mark progress in setting up a connection."""
+
+    def __init__(self, transport: AsyncHTTPTransport, statistics: HostStatistics):
+        """Initialise the transport.
+
+        Args:
+            transport: The transport that will actually make the requests.
+            statistics: The statistics to record to.
+        """
+        self._transport = transport
+        self._statistics = statistics
+        self.in_flight = 0
+        """The number of requests whose responses have yet to be closed."""
+
+    async def handle_async_request(self, request: Request) -> Response:
+        """Handle a request, recording connection statistics along the way.
+
+        Args:
+            request: The request to handle.
+
+        Returns:
+            The response to the request.
+        """
+        statistics = self._statistics
+        statistics.requests += 1
+        timing = _CONNECTION_TIMING.get()
+        mark = 0.0
+
+        async def trace(event: str, _: dict[str, Any]) -> None:
+            nonlocal mark
+            if event in self._CONNECTING:
+                mark = monotonic()
+                statistics.connections += 1
+            elif event in self._CONNECTED:
+                statistics.connect_time += (elapsed := (now := monotonic()) - mark)
+                if timing is not None:
+                    timing.connect_time += elapsed
+                mark = now
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.in_flight += 1
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        assert isinstance(response.stream, AsyncByteStream)
+        response.stream = ReleasingStream(response.stream, self)
+        return response
+
+    async def aclose(self) -> None:
+        """Close the transport."""
+        await self._transport.aclose()
+
+
+##############################################################################
+class ClientPool:
+    """A pool of Ollama clients, one per host.
+
+    Each client keeps its connections to its host alive between requests,
+    so moving back and forth between a handful of hosts reuses connections
+    that have already been established. The least recently used client is
+    closed when the pool grows beyond its limit; a client that still has
+    requests in flight is never closed, so for a while the pool can hold
+    more clients than its limit.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_clients: int = 4,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 5,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+    ) -> None:
+        """Initialise the pool.
+
+        Args:
+            max_clients: The maximum number of hosts to hold clients for.
+            max_connections: The maximum number of connections per host.
+            max_keepalive_connections: The maximum idle connections per host.
+            keepalive_expiry: How long an idle connection is kept alive for.
+            http2: Should HTTP/2 be used where the host supports it?
+
+        Note:
+            HTTP/2 support requires the optional `h2` package; if it isn't
+            installed HTTP/1.1 will be used.
+        """
+        self._max_clients = max(max_clients, 1)
+        self._limits = Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._http2 = http2 and find_spec("h2") is not None
+        self._clients: OrderedDict[str, tuple[AsyncClient, InstrumentedTransport]] = (
+            OrderedDict()
+        )
+        self._statistics: dict[str, HostStatistics] = {}
+
+    async def client(self, host: str) -> AsyncClient:
+        """Get the client for a host.
+
+        Args:
+            host: The host to get the client for.
+
+        Returns:
+            The client for the host.
+        """
+        if host in self._clients:
+            self._clients.move_to_end(host)
+            return self._clients[host][0]
+        transport = InstrumentedTransport(
+            AsyncHTTPTransport(http2=self._http2, limits=self._limits),
+            self._statistics.setdefault(host, HostStatistics()),
+        )
+        self._clients[host] = (
+            AsyncClient(host or None, transport=transport),
+            transport,
+        )
+        for idle in [
+            idle
+            for idle, (_, transport) in self._clients.items()
+            if idle != host and not transport.in_flight
+        ][: max(len(self._clients) - self._max_clients, 0)]:
+            await self._clients.pop(idle)[1].aclose()
+        return self._clients[host][0]
+
+    @staticmethod
+    @contextmanager
+    def timing() -> Iterator[ConnectionTiming]:
+        """Time setting up connections for the requests made within.
+
+        Yields:
+            The timing, which is filled in as requests are made.
+
+        Note:
+            The timing is only of requests made by the task that is doing
+            the timing, so requests made at the same time by other tasks
+            don't get counted.
+        """
+        token = _CONNECTION_TIMING.set(timing := ConnectionTiming())
+        try:
+            yield timing
+        finally:
+            _CONNECTION_TIMING.reset(token)
+
+    def statistics(self, host: str) -> HostStatistics:
+        """Get the connection statistics for a host.
+
+        Args:
+            host: The host to get the statistics for.
+
+        Returns:
+            The statistics for the host.
+        """
+        return self._statistics.setdefault(host, HostStatistics())
+
+    async def close(self) -> None:
+        """Close all of the clients in the pool."""
+        while self._clients:
+            await self._clients.popitem()[1][1].aclose()
+
+
+### client_pool.py ends here
@@ -0,0 +1,70 @@
+"""Provides embedding of text with one of a pool of hosts."""
+
+##############################################################################
+# Python imports.
+from collections.abc import Sequence
+from typing import Final
+
+##############################################################################
+# Local imports.
+from .client_pool import ClientPool
+from .host_pool import CONNECTION_ERRORS, HostPool
+
+##############################################################################
+EMBEDDING_BATCH: Final[int] = 32
+"""The most pieces of text to embed with a single request."""
+
+
+##############################################################################
+async def embed(
+    hosts: HostPool,
+    clients: ClientPool,
+    model: str,
+    texts: Sequence[str],
+    keep_alive: float | str | None = None,
+) -> list[Sequence[float]]:
+    """Embed some text with a model.
+
+    Args:
+        hosts: The pool of hosts to use.
+        clients: The pool of clients for talking to the hosts.
+        model: The embedding model to use.
+        texts: The pieces of text to embed.
+        keep_alive: How long the model should stay loaded afterwards.
+
+    Returns:
+        The embedding of each piece of text.
+
+    Raises:
+        ConnectError: If none of the hosts could be reached.
+        ConnectionError: If none of the hosts could be reached.
+        ResponseError: If the host that was reached reported an error.
+
+    Note:
+        The text is sent in batches of up to `EMBEDDING_BATCH` pieces at a
+        time. As with chats, if a host can't be reached the next host in
+        the pool is tried.
+    """
+    embeddings: list[Sequence[float]] = []
+    for start in range(0, len(texts), EMBEDDING_BATCH):
+        batch = list(texts[start : start + EMBEDDING_BATCH])
+        for host in hosts.candidates():
+            hosts.started(host)
+            try:
+                response = await (await clients.client(host)).embed(
+                    model=model, input=batch, keep_alive=keep_alive
+                )
+            except CONNECTION_ERRORS as error:
+                hosts.failed(host)
+                failure = error
+            else:
+                embeddings.extend(response.embeddings)
+                break
+            finally:
+                hosts.finished(host)
+        else:
+            raise failure
+    return embeddings
+
+
+### embeddings.py ends here
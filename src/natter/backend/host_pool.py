@@ -0,0 +1,213 @@
+"""Provides a pool of Ollama hosts to spread work across."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from asyncio import TimeoutError as AsyncTimeoutError
+from asyncio import gather, wait_for
+from dataclasses import dataclass
+from itertools import count
+from random import choices
+from typing import Final, Literal, get_args
+
+##############################################################################
+# httpx imports.
+from httpx import ConnectError, TimeoutException
+
+##############################################################################
+# Ollama imports.
+from ollama import ResponseError
+
+##############################################################################
+# Local imports.
+from .client_pool import ClientPool
+
+##############################################################################
+RoutingStrategy = Literal["round-robin", "least-outstanding", "latency"]
+"""The strategies for picking which host in a pool to use."""
+
+ROUTING_STRATEGIES: Final[tuple[str, ...]] = get_args(RoutingStrategy)
+"""The names of all of the routing strategies."""
+
+CONNECTION_ERRORS: Final = (ConnectError, ConnectionError, TimeoutException)
+"""The errors that indicate that a host couldn't be reached."""
+
+
+##############################################################################
+@dataclass
+class HostState:
+    """The state of a host in a pool."""
+
+    host: str
+    """The host."""
+
+    healthy: bool = True
+    """Did the host look healthy the last time it was used or checked?"""
+
+    outstanding: int = 0
+    """The number of requests currently being handled by the host."""
+
+    time_to_first_token: float | None = None
+    """The smoothed time the host has taken to start replying, if known."""
+
+    def __str__(self) -> str:
+        return (
+            f"{self.host or 'default host'}: "
+            f"{'healthy' if self.healthy else 'unhealthy'}, "
+            f"{self.outstanding} outstanding"
+            + (
+                ""
+                if self.time_to_first_token is None
+                else f", {self.time_to_first_token * 1000:.0f}ms to first token"
+            )
+        )
+
+
+##############################################################################
+class HostPool:
+    """A pool of Ollama hosts to spread work across.
+
+    The pool decides which order hosts should be tried in for a request,
+    based on its routing strategy and what it knows about the health and
+    performance of each host.
+    """
+
+    SMOOTHING: Final[float] = 0.3
+    """The weight given to the latest time to first token when smoothing."""
+
+    def __init__(
+        self, hosts: list[str], strategy: RoutingStrategy = "round-robin"
+    ) -> None:
+        """Initialise the pool.
+
+        Args:
+            hosts: The hosts in the pool.
+            strategy: The routing strategy to use.
+        """
+        self._hosts = {host: HostState(host) for host in hosts or [""]}
+        self.strategy: RoutingStrategy = strategy
+        """The routing strategy in use."""
+        self._turn = count()
+
+    @property
+    def hosts(self) -> list[str]:
+        """The hosts in the pool."""
+        return list(self._hosts)
+
+    @property
+    def states(self) -> list[HostState]:
+        """The states of the hosts in the pool."""
+        return list(self._hosts.values())
+
+    def _preferred(self, states: list[HostState]) -> list[HostState]:
+        """Order hosts by preference according to the routing strategy.
+
+        Args:
+            states: The states of the hosts to order.
+
+        Returns:
+            The states, most preferred first.
+        """
+        if len(states) < 2:
+            return states
+        if self.strategy == "least-outstanding":
+            return sorted(states, key=lambda state: state.outstanding)
+        if self.strategy == "latency":
+            known = [
+                state.time_to_first_token
+                for state in states
+                if state.time_to_first_token is not None
+            ]
+            # Hosts we've not measured yet get the same chance as the best
+            # host we have measured, so that they do get measured.
+            best = min(known, default=1.0) or 1e-3
+            weights = [1 / (state.time_to_first_token or best) for state in states]
+            first = choices(states, weights=weights)[0]
+            return [first] + sorted(
+                (state for state in states if state is not first),
+                key=lambda state: state.time_to_first_token or best,
+            )
+        turn = next(self._turn) % len(states)
+        return states[turn:] + states[:turn]
+
+    def candidates(self) -> list[str]:
+        """Get the hosts to try for a request, in the order to try them.
+
+        Returns:
+            The hosts to try; healthy hosts come before unhealthy hosts.
+        """
+        states = self.states
+        return [
+            state.host
+            for state in self._preferred([state for state in states if state.healthy])
+            + [state for state in states if not state.healthy]
+        ]
+
+    def started(self, host: str) -> None:
+        """Record that a request to a host has started.
+
+        Args:
+            host: The host.
+        """
+        self._hosts[host].outstanding += 1
+
+    def first_token(self, host: str, elapsed: float) -> None:
+        """Record that a host has started replying.
+
+        Args:
+            host: The host.
+            elapsed: The time since the request started.
+        """
+        state = self._hosts[host]
+        state.healthy = True
+        state.time_to_first_token = (
+            elapsed
+            if state.time_to_first_token is None
+            else (self.SMOOTHING * elapsed)
+            + ((1 - self.SMOOTHING) * state.time_to_first_token)
+        )
+
+    def failed(self, host: str) -> None:
+        """Record that a host couldn't be reached.
+
+        Args:
+            host: The host.
+        """
+        self._hosts[host].healthy = False
+
+    def finished(self, host: str) -> None:
+        """Record that a request to a host has finished.
+
+        Args:
+            host: The host.
+        """
+        state = self._hosts[host]
+        state.outstanding = max(state.outstanding - 1, 0)
+
+    async def check_health(self, clients: ClientPool, timeout: float = 5.0) -> None:
+        """Check the health of all of the hosts in the pool.
+
+        Args:
+            clients: The pool of clients to use to talk to the hosts.
+            timeout: How long to give each host to respond.
+        """
+
+        async def check(state: HostState) -> None:
+            try:
+                await wait_for((await clients.client(state.host)).ps(), timeout)
+            except (*CONNECTION_ERRORS, AsyncTimeoutError):
+                state.healthy = False
+            except ResponseError:
+                # The host is there and talking to us, even if it didn't
+                # like what we asked.
+                state.healthy = True
+            else:
+                state.healthy = True
+
+        await gather(*(check(state) for state in self.states))
+
+
+### host_pool.py ends here
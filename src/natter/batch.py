@@ -0,0 +1,197 @@
+"""Run prompts through a model without the user interface."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from asyncio import gather
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from json import JSONDecodeError, dumps, loads
+from time import monotonic
+from typing import Any, TextIO, cast
+
+##############################################################################
+# httpx imports.
+from httpx import TransportError
+
+##############################################################################
+# Ollama imports.
+from ollama import ResponseError
+
+##############################################################################
+# Local imports.
+from .backend import (
+    CONNECTION_ERRORS,
+    ROUTING_STRATEGIES,
+    ChatStream,
+    ClientPool,
+    HostPool,
+    RoutingStrategy,
+)
+from .data import ConversationData, load_configuration
+
+
+##############################################################################
+@dataclass
+class Prompt:
+    """A prompt to run through a model."""
+
+    id: str | int
+    """The ID of the prompt, used to match it up with its result."""
+
+    text: str
+    """The text of the prompt."""
+
+    model: str | None = None
+    """The model to use for this prompt, if not the default."""
+
+    error: str | None = None
+    """Why the prompt couldn't be read, if it couldn't."""
+
+
+##############################################################################
+def read_prompts(source: TextIO) -> Iterator[Prompt]:
+    """Read prompts from a source.
+
+    Args:
+        source: The source to read from.
+
+    Yields:
+        The prompts.
+
+    Note:
+        Each line of the source is either plain text, which is taken as the
+        prompt, or JSON. A JSON string is taken as the prompt; a JSON object
+        must have a `prompt`, and may also have an `id` and a `model`. If
+        no ID is given, the line number is used. Blank lines are skipped.
+
+        A JSON object without a prompt is still yielded, identified by its
+        line number and with the reason it couldn't be read, so that it
+        shows up in the results rather than stopping the batch.
+    """
+    for line_number, line in enumerate(source, start=1):
+        if not (line := line.strip()):
+            continue
+        try:
+            data = loads(line) if line[0] in '{"' else line
+        except JSONDecodeError:
+            data = line
+        if isinstance(data, dict):
+            if not isinstance(text := data.get("prompt"), str):
+                yield Prompt(
+                    line_number, "", error=f"Line {line_number} doesn't have a prompt"
+                )
+            else:
+                yield Prompt(data.get("id", line_number), text, data.get("model"))
+        else:
+            yield Prompt(line_number, str(data))
+
+
+##############################################################################
+class Batch:
+    """Runs a batch of prompts through a model.
+
+    Each prompt is asked as the start of a fresh conversation. Up to a given
+    number of prompts are run at once, across the hosts being used, and
+    the result of each prompt is written as a line of JSON as soon as it
+    completes.
+    """
+
+    def __init__(self, model: str, host: str, concurrency: int) -> None:
+        """Initialise the batch.
+
+        Args:
+            model: The model to use for prompts that don't name one.
+            host: The host, or space-separated hosts, to use.
+            concurrency: The maximum number of prompts to run at once.
+        """
+        self._model = model
+        self._host = host
+        self._concurrency = max(concurrency, 1)
+        configuration = load_configuration()
+        self._clients = ClientPool(
+            max_clients=configuration.max_clients,
+            # Make sure each host can be given as much work as we want to
+            # have on the go.
+            max_connections=max(configuration.max_connections, self._concurrency),
+            max_keepalive_connections=max(
+                configuration.max_keepalive_connections, self._concurrency
+            ),
+            keepalive_expiry=configuration.keepalive_expiry,
+            http2=configuration.http2,
+        )
+        self._hosts = HostPool(
+            host.split(),
+            cast(RoutingStrategy, configuration.routing)
+            if configuration.routing in ROUTING_STRATEGIES
+            else "round-robin",
+        )
+        self.failures = 0
+        """The number of prompts that couldn't be run."""
+
+    async def _ask(self, prompt: Prompt) -> dict[str, Any]:
+        """Run a prompt through the model.
+
+        Args:
+            prompt: The prompt to run.
+
+        Returns:
+            The result of running the prompt.
+        """
+        if prompt.error is not None:
+            self.failures += 1
+            return {"id": prompt.id, "error": prompt.error}
+        configuration = load_configuration()
+        model = prompt.model or self._model
+        conversation = ConversationData(f"Prompt {prompt.id}", model, host=self._host)
+        conversation.record({"role": "user", "content": prompt.text})
+        result: dict[str, Any] = {"id": prompt.id}
+        started = monotonic()
+        try:
+            async with ChatStream(
+                self._hosts,
+                self._clients,
+                model=model,
+                messages=conversation.context(
+                    configuration.context_budget(model), configuration.system_prompt
+                ),
+                keep_alive=configuration.model_keep_alive,
+            ) as chat:
+                result["served_by"] = chat.host
+                result["time_to_first_token"] = chat.time_to_first_token
+                result["connect_time"] = chat.connect_time
+                async for part in chat:
+                    if content := part["message"]["content"]:
+                        conversation.record(
+                            {"role": part["message"]["role"], "content": content}
+                        )
+        except (ResponseError, TransportError, *CONNECTION_ERRORS) as error:
+            self.failures += 1
+            result["error"] = str(error)
+        result["duration"] = monotonic() - started
+        return {**result, **conversation.json}
+
+    async def run(self, prompts: Iterable[Prompt], output: TextIO) -> None:
+        """Run the prompts.
+
+        Args:
+            prompts: The prompts to run.
+            output: Where to write the results.
+        """
+        pending = iter(prompts)
+
+        async def worker() -> None:
+            for prompt in pending:
+                output.write(f"{dumps(await self._ask(prompt))}\n")
+                output.flush()
+
+        try:
+            await gather(*(worker() for _ in range(self._concurrency)))
+        finally:
+            await self._clients.close()
+
+
+### batch.py ends here
@@ -2,11 +2,48 @@
 
 ##############################################################################
 # Local imports.
-from .conversation_data import ConversationData
-from .locations import conversations_dir, data_dir
+from .chat_message import ChatMessage, GenerationStats
+from .config import Configuration, load_configuration, update_configuration
+from .conversation_data import Branch, ConversationData
+from .journal import ConversationJournal
+from .library import ConversationLibrary, LibraryEntry, SearchHit
+from .locations import (
+    cache_dir,
+    conversations_dir,
+    data_dir,
+    library_file,
+    ongoing_journal,
+    recall_dir,
+)
+from .metrics import EventLoopLag, InteractionMetrics
+from .response_cache import ResponseCache
+
+# Note that the recall index isn't imported here, as it needs the optional
+# NumPy; import it from `.recall_index` once it's known to be available.
 
 ##############################################################################
 # Exports.
-__all__ = ["ConversationData", "conversations_dir", "data_dir"]
+__all__ = [
+    "Branch",
+    "ChatMessage",
+    "Configuration",
+    "ConversationData",
+    "ConversationJournal",
+    "ConversationLibrary",
+    "EventLoopLag",
+    "GenerationStats",
+    "InteractionMetrics",
+    "LibraryEntry",
+    "ResponseCache",
+    "SearchHit",
+    "cache_dir",
+    "conversations_dir",
+    "data_dir",
+    "library_file",
+    "load_configuration",
+    "ongoing_journal",
+    "recall_dir",
+    "update_configuration",
+]
 
 ### __init__.py ends here
@@ -0,0 +1,189 @@
+"""The messages that make up a conversation."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from collections.abc import Iterator, Mapping
+from dataclasses import asdict, dataclass
+from sys import intern
+from typing import Any
+
+##############################################################################
+# Ollama imports.
+from ollama import Message
+
+##############################################################################
+# Local imports.
+from .metrics import InteractionMetrics
+
+
+##############################################################################
+@dataclass(frozen=True, slots=True)
+class GenerationStats:
+    """Statistics for the generation of a message by a model."""
+
+    model: str
+    """The model that generated the message."""
+
+    host: str = ""
+    """The host the model was running on."""
+
+    eval_count: int | None = None
+    """The number of tokens the server reported generating."""
+
+    eval_duration: int | None = None
+    """The time the server reported spending generating, in nanoseconds."""
+
+    prompt_eval_count: int | None = None
+    """The number of prompt tokens the server reported evaluating."""
+
+    prompt_eval_duration: int | None = None
+    """The time the server reported evaluating the prompt, in nanoseconds."""
+
+    @classmethod
+    def from_metrics(cls, metrics: InteractionMetrics) -> GenerationStats:
+        """Create the statistics from the metrics of an interaction.
+
+        Args:
+            metrics: The metrics to create the statistics from.
+
+        Returns:
+            The statistics.
+        """
+        return cls(
+            metrics.model,
+            metrics.host,
+            metrics.eval_count,
+            metrics.eval_duration,
+            metrics.prompt_eval_count,
+            metrics.prompt_eval_duration,
+        )
+
+    @property
+    def json(self) -> dict[str, Any]:
+        """The statistics as a JSON-friendly structure."""
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+
+##############################################################################
+class ChatMessage(Mapping[str, Any]):
+    """A message in a conversation.
+
+    Messages are kept as small objects with a fixed set of slots, rather than
+    as dictionaries, and the role of each message is interned, so that every
+    message with the same role shares the one string.
+
+    Looked at as a mapping, a message is just its role and its content,
+    which is all that the Ollama client needs; it can be handed straight to
+    the client without being converted first.
+    """
+
+    __slots__ = ("role", "content", "done_reason", "created", "tokens", "stats")
+
+    def __init__(
+        self,
+        role: str,
+        content: str = "",
+        done_reason: str | None = None,
+        created: float | None = None,
+        stats: GenerationStats | None = None,
+    ) -> None:
+        """Initialise the message.
+
+        Args:
+            role: The role of the message.
+            content: The content of the message.
+            done_reason: Why the message finished, if it was cut short.
+            created: When the message was created, as a timestamp.
+            stats: The statistics for the generation of the message.
+        """
+        self.role = intern(role)
+        """The role of the message."""
+        self.content = content
+        """The content of the message."""
+        self.done_reason = done_reason
+        """Why the message finished, if it was cut short."""
+        self.created = created
+        """When the message was created, as a timestamp, if known."""
+        self.tokens: int | None = None
+        """The number of tokens in the message, once known or estimated."""
+        self.stats = stats
+        """The statistics for the generation of the message, if it was generated."""
+
+    @classmethod
+    def of(
+        cls, message: Message | Mapping[str, Any], created: float | None = None
+    ) -> ChatMessage:
+        """Make a message from another message.
+
+        Args:
+            message: The message to make the message from.
+            created: When the message was created, as a timestamp.
+
+        Returns:
+            A new message, with the role and content of the given message.
+        """
+        return cls(message["role"], message["content"] or "", created=created)
+
+    def copy(self) -> ChatMessage:
+        """Make a copy of the message.
+
+        Returns:
+            A copy of the message.
+        """
+        copy = ChatMessage(
+            self.role, self.content, self.done_reason, self.created, self.stats
+        )
+        copy.tokens = self.tokens
+        return copy
+
+    @property
+    def json(self) -> dict[str, Any]:
+        """The message as a JSON-friendly structure."""
+        return {
+            "role": self.role,
+            "content": self.content,
+            **({} if self.done_reason is None else {"done_reason": self.done_reason}),
+            **({} if self.created is None else {"created": self.created}),
+            **({} if self.stats is None else {"stats": self.stats.json}),
+        }
+
+    @classmethod
+    def from_json(cls, data: Mapping[str, Any]) -> ChatMessage:
+        """Create a message from JSON data.
+
+        Args:
+            data: The data to create it from.
+
+        Returns:
+            The message.
+        """
+        return cls(
+            data["role"],
+            data["content"] or "",
+            data.get("done_reason"),
+            data.get("created"),
+            None if (stats := data.get("stats")) is None else GenerationStats(**stats),
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(("role", "content"))
+
+    def __len__(self) -> int:
+        return 2
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.role!r}, {self.content!r})"
+
+
+### chat_message.py ends here
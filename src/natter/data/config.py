@@ -0,0 +1,176 @@
+"""Code relating to the application's configuration file."""
+
+##############################################################################
+# Python imports.
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from json import dumps, loads
+from pathlib import Path
+from typing import Iterator
+
+##############################################################################
+# Local imports.
+from .locations import config_dir
+
+
+##############################################################################
+@dataclass
+class Configuration:
+    """The configuration data for the application."""
+
+    default_context_budget: int = 4096
+    """The default number of tokens of history to send to a model."""
+
+    context_budgets: dict[str, int] = field(default_factory=dict)
+    """The number of tokens of history to send to specific models."""
+
+    system_prompt: str = ""
+    """A system prompt to always send at the start of the history."""
+
+    keep_alive: str = "5m"
+    """How long the server should keep the model loaded after it is used.
+
+    This is either a duration (for example `30m` or `1h`), or a number of
+    seconds, where a negative number means to keep the model loaded
+    forever.
+    """
+
+    max_clients: int = 4
+    """The maximum number of hosts to keep connections open to."""
+
+    max_connections: int = 10
+    """The maximum number of connections to open to each host."""
+
+    max_keepalive_connections: int = 5
+    """The maximum number of idle connections to keep open to each host."""
+
+    keepalive_expiry: float = 30.0
+    """How many seconds an idle connection to a host is kept open for."""
+
+    http2: bool = False
+    """Should HTTP/2 be used with hosts that support it?"""
+
+    routing: str = "round-robin"
+    """The strategy for picking which of a pool of hosts to use."""
+
+    health_check_interval: float = 30.0
+    """How often, in seconds, to check the health of a pool of hosts."""
+
+    show_status_bar: bool = False
+    """Should the status bar, with performance metrics, be shown?"""
+
+    metrics_log: str = ""
+    """The path to a file to append interaction metrics to, if any."""
+
+    response_cache: bool = False
+    """Should replies be cached, and reused when a request is repeated?"""
+
+    response_cache_size: int = 50 * 1024 * 1024
+    """The maximum size of the reply cache, in bytes."""
+
+    response_cache_ttl: float = 7 * 24 * 60 * 60
+    """How long, in seconds, a reply is kept in the cache."""
+
+    recall: bool = False
+    """Should messages be embedded as they're recorded, so they can be recalled?"""
+
+    recall_model: str = "nomic-embed-text"
+    """The model to use to embed messages for recall."""
+
+    recall_context: int = 0
+    """The number of recalled messages to add to the context of each request."""
+
+    @property
+    def model_keep_alive(self) -> float | str:
+        """The keep-alive value in the form the Ollama client expects."""
+        try:
+            return float(self.keep_alive)
+        except ValueError:
+            return self.keep_alive
+
+    def context_budget(self, model: str) -> int:
+        """Get the context budget for a given model.
+
+        Args:
+            model: The model to get the budget for.
+
+        Returns:
+            The number of tokens of history to send to the model.
+        """
+        return self.context_budgets.get(model, self.default_context_budget)
+
+
+##############################################################################
+def configuration_file() -> Path:
+    """The path to the file that holds the application configuration.
+
+    Returns:
+        The path to the configuration file.
+    """
+    return config_dir() / "configuration.json"
+
+
+##############################################################################
+def save_configuration(configuration: Configuration) -> Configuration:
+    """Save the given configuration.
+
+    Args:
+        configuration: The configuration to save.
+
+    Returns:
+        The configuration.
+    """
+    load_configuration.cache_clear()
+    configuration_file().write_text(
+        dumps(asdict(configuration), indent=4), encoding="utf-8"
+    )
+    return load_configuration()
+
+
+##############################################################################
+@lru_cache(maxsize=None)
+def load_configuration() -> Configuration:
+    """Load the configuration.
+
+    Returns:
+        The configuration.
+
+    Note:
+        As a side-effect, if the configuration doesn't exist a default one
+        will be saved to storage.
+
+        This function is designed so that it's safe and low-cost to
+        repeatedly call it. The configuration is cached and will only be
+        loaded from storage when a configuration is saved.
+    """
+    source_file = configuration_file()
+    return (
+        Configuration(**loads(source_file.read_text(encoding="utf-8")))
+        if source_file.exists()
+        else save_configuration(Configuration())
+    )
+
+
+##############################################################################
+@contextmanager
+def update_configuration() -> Iterator[Configuration]:
+    """Context manager for updating the configuration.
+
+    Loads the configuration and makes it available, then ensures it is
+    saved.
+
+    Example:
+        ```python
+        with update_configuration() as config:
+            config.system_prompt = "You are a helpful assistant."
+        ```
+    """
+    configuration = load_configuration()
+    try:
+        yield configuration
+    finally:
+        save_configuration(configuration)
+
+
+### config.py ends here
@@ -6,8 +6,11 @@ from __future__ import annotations
 
 ##############################################################################
 # Python imports.
+from collections.abc import Mapping
 from dataclasses import dataclass, field
-from typing import Any, Iterator
+from math import ceil
+from time import time
+from typing import Any, ClassVar, Iterator
 
 ##############################################################################
 # Ollama imports.
@@ -17,6 +20,25 @@ from ollama import Message
 # Typing extensions imports.
 from typing_extensions import Self
 
+##############################################################################
+# Local imports.
+from .chat_message import ChatMessage, GenerationStats
+
+
+##############################################################################
+@dataclass
+class Branch:
+    """A branch of a conversation that isn't the one being followed."""
+
+    parent: int
+    """The ID of the branch that this branch forks from."""
+
+    fork: int
+    """The position in the history at which this branch forks from its parent."""
+
+    messages: list[ChatMessage]
+    """The messages of this branch from where it forks onwards."""
+
 
 ##############################################################################
 @dataclass
@@ -29,14 +51,42 @@ class ConversationData:
     model: str
     """The name of the model in use with this conversation."""
 
-    history: list[Message | dict[str, str]] = field(default_factory=list)
+    history: list[ChatMessage] = field(default_factory=list)
     """The history of the conversation."""
 
     host: str = ""
     """The host the conversation is being held with."""
 
+    library_id: int | None = None
+    """The ID of the conversation in the library, if it has been stored there."""
+
+    branch: int = 0
+    """The ID of the branch of the conversation being followed."""
+
+    branches: dict[int, Branch] = field(default_factory=dict)
+    """The other branches of the conversation, keyed by their IDs.
+
+    Each branch only holds the messages from where it forks from its parent
+    onwards; everything before that is shared with the parent, and so with
+    the history, rather than being copied.
+    """
+
+    _parts: list[str] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+    """Streamed content yet to be added to the last message in the history."""
+
+    CHARACTERS_PER_TOKEN: ClassVar[int] = 4
+    """The rough number of characters that make up a token."""
+
+    MESSAGE_TOKENS: ClassVar[int] = 4
+    """The rough number of tokens of overhead for each message."""
+
+    INTERRUPTED: ClassVar[str] = "interrupted"
+    """The reason given for a reply that was stopped before it was done."""
+
     @staticmethod
-    def is_user(message: Message | dict[str, str]) -> bool:
+    def is_user(message: ChatMessage) -> bool:
         """Is the given message from the user?
 
         Args:
@@ -45,10 +95,10 @@ class ConversationData:
         Returns:
             `True` if it's from the user, `False` if not.
         """
-        return message["role"] == "user"
+        return message.role == "user"
 
     @staticmethod
-    def is_assistant(message: Message | dict[str, str]) -> bool:
+    def is_assistant(message: ChatMessage) -> bool:
         """Is the given message from the assistant?
 
         Args:
@@ -57,9 +107,21 @@ class ConversationData:
         Returns:
             `True` if it's from the assistant, `False` if not.
         """
-        return message["role"] == "assistant"
+        return message.role == "assistant"
 
-    def record(self, message: Message | dict[str, str]) -> Self:
+    @classmethod
+    def is_interrupted(cls, message: ChatMessage) -> bool:
+        """Is the given message a reply that was interrupted?
+
+        Args:
+            message: The message to check.
+
+        Returns:
+            `True` if it was interrupted, `False` if not.
+        """
+        return message.done_reason == cls.INTERRUPTED
+
+    def record(self, message: Message | Mapping[str, Any]) -> Self:
         """Record the given message in the history.
 
         Args:
@@ -69,22 +131,218 @@ class ConversationData:
             Self.
         """
         # If the role of the given message is the same as the previous role...
-        if self.history and message["role"] == self.history[-1]["role"]:
-            # ...accumulate the content into the last message in the
-            # history.
-            self.history[-1]["content"] += message["content"]
+        if self.history and message["role"] == self.history[-1].role:
+            # ...hold on to the content so it can be accumulated into the
+            # last message in the history when it's next needed.
+            self._parts.append(message["content"] or "")
         else:
             # Otherwise start a new message.
-            self.history.append(dict(message))
+            self._settle()
+            self.history.append(ChatMessage.of(message, time()))
+        return self
+
+    def record_stats(self, stats: GenerationStats) -> Self:
+        """Record how the reply at the end of the history was generated.
+
+        Args:
+            stats: The statistics to record.
+
+        Returns:
+            Self.
+
+        Note:
+            If the history doesn't end with a reply from the assistant,
+            nothing is recorded.
+        """
+        self._settle()
+        if self.history and self.is_assistant(reply := self.history[-1]):
+            reply.stats = stats
+            if stats.eval_count is not None:
+                reply.tokens = stats.eval_count + self.MESSAGE_TOKENS
         return self
 
+    def prepend(self, messages: list[ChatMessage]) -> Self:
+        """Add older messages to the start of the history.
+
+        Args:
+            messages: The messages to add.
+
+        Returns:
+            Self.
+        """
+        self.history[:0] = messages
+        return self
+
+    def fork(self, position: int) -> Self:
+        """Start a new branch of the conversation.
+
+        Args:
+            position: The position in the history to branch from.
+
+        Returns:
+            Self.
+
+        Note:
+            The history from the given position onwards is set aside as a
+            branch of its own, and the history then carries on from that
+            position as the new branch. If there's nothing in the history
+            from the given position onwards, no branch is made.
+        """
+        self._settle()
+        if position >= len(self.history):
+            return self
+        previous, self.branch = self.branch, max([self.branch, *self.branches]) + 1
+        # Branches that forked from the previous branch before where it's
+        # being forked now share everything they need with the new branch.
+        for branch in self.branches.values():
+            if branch.parent == previous and branch.fork <= position:
+                branch.parent = self.branch
+        self.branches[previous] = Branch(self.branch, position, self.history[position:])
+        del self.history[position:]
+        return self
+
+    def switch(self, branch: int) -> int:
+        """Switch to following a different branch of the conversation.
+
+        Args:
+            branch: The ID of the branch to follow.
+
+        Returns:
+            The position in the history from which the branches differ.
+
+        Raises:
+            KeyError: If there is no branch with that ID.
+        """
+        self._settle()
+        if branch == self.branch:
+            return len(self.history)
+        # Work out the chain of branches from the one being followed to the
+        # one being switched to.
+        chain = [branch]
+        while (parent := self.branches[chain[-1]].parent) != self.branch:
+            chain.append(parent)
+        chain.reverse()
+        forks = [self.branches[link].fork for link in chain]
+        # The branch being followed, and each branch in the chain but the
+        # last, become branches of the branch being switched to, forking
+        # from where the next branch in the chain forked from them.
+        history = self.history
+        stashed = {self.branch: Branch(branch, forks[0], history[forks[0] :])}
+        for link, fork in zip(chain, forks[1:]):
+            messages = self.branches[link].messages
+            stashed[link] = Branch(
+                branch, fork, messages[fork - self.branches[link].fork :]
+            )
+        for link in chain:
+            history = history[: self.branches[link].fork] + self.branches[link].messages
+        # Any other branch that forked from one of those branches before
+        # the point where it now forks shares all it needs with the branch
+        # being switched to.
+        for other in self.branches.values():
+            if other.parent in stashed and other.fork <= stashed[other.parent].fork:
+                other.parent = branch
+        del self.branches[branch]
+        self.branches.update(stashed)
+        self.history, self.branch = history, branch
+        return forks[0]
+
+    def interrupt(self) -> Self:
+        """Mark the reply at the end of the history as interrupted.
+
+        Returns:
+            Self.
+
+        Note:
+            If the history ends with input from the user, the reply was
+            interrupted before any of it arrived; an empty interrupted reply
+            is recorded so that the next input from the user isn't run on
+            from the input that went unanswered.
+        """
+        self._settle()
+        if self.history and self.history[-1].role == "user":
+            self.history.append(ChatMessage("assistant", created=time()))
+        if self.history and self.is_assistant(self.history[-1]):
+            self.history[-1].done_reason = self.INTERRUPTED
+        return self
+
+    def _settle(self) -> None:
+        """Accumulate any streamed content into the last message in the history.
+
+        Note:
+            Streamed content is gathered up and only joined onto the last
+            message when the history is actually looked at; this avoids
+            copying an ever-growing string for every part of a streamed
+            reply.
+        """
+        if self._parts:
+            self.history[-1].content += "".join(self._parts)
+            self.history[-1].tokens = None
+            self._parts.clear()
+
+    @classmethod
+    def estimate_tokens(cls, message: ChatMessage) -> int:
+        """Estimate the number of tokens a message will take up.
+
+        Args:
+            message: The message to estimate the token count of.
+
+        Returns:
+            The estimated number of tokens.
+        """
+        return (
+            ceil(len(message.content) / cls.CHARACTERS_PER_TOKEN) + cls.MESSAGE_TOKENS
+        )
+
+    def tokens(self, index: int) -> int:
+        """Get the estimated number of tokens in a message in the history.
+
+        Args:
+            index: The index of the message in the history.
+
+        Returns:
+            The estimated number of tokens in the message.
+        """
+        self._settle()
+        if (tokens := (message := self.history[index]).tokens) is None:
+            tokens = message.tokens = self.estimate_tokens(message)
+        return tokens
+
+    def context(self, budget: int, system_prompt: str = "") -> list[ChatMessage]:
+        """Get the part of the history that fits within a token budget.
+
+        Args:
+            budget: The number of tokens the context can take up.
+            system_prompt: An optional system prompt to start the context.
+
+        Returns:
+            The messages that make up the context.
+
+        Note:
+            The newest messages in the history are given priority, and the
+            most recent message is always included, even if it doesn't fit
+            on its own. The context never starts part way through a turn.
+        """
+        self._settle()
+        pinned = [ChatMessage("system", system_prompt)] if system_prompt else []
+        budget -= sum(self.estimate_tokens(message) for message in pinned)
+        start = len(self.history)
+        while start > 0 and (
+            start == len(self.history) or (budget - self.tokens(start - 1)) >= 0
+        ):
+            start -= 1
+            budget -= self.tokens(start)
+        while start < len(self.history) - 1 and not self.is_user(self.history[start]):
+            start += 1
+        return pinned + self.history[start:]
+
     @property
     def json(self) -> dict[str, Any]:
         """The conversation data as a JSON-friendly structure."""
+        self._settle()
         return {
             "title": self.title,
             "model": self.model,
-            "history": self.history,
+            "history": [message.json for message in self.history],
             "host": self.host,
         }
 
@@ -109,11 +367,12 @@ class ConversationData:
         return cls(
             data.get("title", "Untitled"),
             data.get("model", "llama3"),
-            data.get("history", []),
+            [ChatMessage.from_json(message) for message in data.get("history", [])],
             data.get("host", ""),
         )
 
-    def __iter__(self) -> Iterator[Message | dict[str, str]]:
+    def __iter__(self) -> Iterator[ChatMessage]:
+        self._settle()
         return iter(self.history)
 
 
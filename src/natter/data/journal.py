@@ -0,0 +1,488 @@
+"""Append-only journal storage for a conversation."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from json import JSONDecodeError, dumps, loads
+from os import SEEK_END, fsync, replace
+from pathlib import Path
+from typing import Any, BinaryIO, Final, Iterator, TextIO
+
+##############################################################################
+# Local imports.
+from .chat_message import ChatMessage, GenerationStats
+from .conversation_data import Branch, ConversationData
+
+
+##############################################################################
+class ConversationJournal:
+    """Append-only journal storage for a conversation.
+
+    Rather than rewriting the whole of a conversation each time it is saved,
+    the journal appends a record for each message that has been added (or
+    changed) since the last save. The conversation is rebuilt by replaying
+    the records in the journal. Every so often the journal is compacted by
+    atomically replacing it with a fresh snapshot of the conversation.
+
+    Records for messages are only ever written in order of their position
+    in the history, and the details of the conversation are written again
+    every so often, so the most recent part of a conversation can be loaded
+    by reading just the end of the journal.
+
+    The other branches of the conversation only change when the branch
+    being followed changes, which always takes a fresh snapshot, so they
+    are written once, as a single record, as part of each snapshot.
+    """
+
+    COMPACT_SLACK: Final[int] = 100
+    """How many superseded records are allowed before the journal is compacted."""
+
+    DETAILS_INTERVAL: Final[int] = 50
+    """The most records that are written before the details are written again."""
+
+    READ_SIZE: Final[int] = 64 * 1024
+    """The size of the blocks the journal is read in when reading from the end."""
+
+    def __init__(self, path: Path) -> None:
+        """Initialise the journal.
+
+        Args:
+            path: The path to the journal file.
+        """
+        self._path = path
+        """The path to the journal file."""
+        self._details: tuple[str, str, str, int | None] | None = None
+        """The details of the conversation as last written."""
+        self._signatures: list[tuple[int, str | None, GenerationStats | None]] = []
+        """The signature of each message as last written."""
+        self._branch = 0
+        """The ID of the branch being followed as last written."""
+        self._records = 0
+        """The number of records in the journal."""
+        self._since_details = 0
+        """The number of records in the journal since the details were last written."""
+        self._head: int | None = None
+        """The length of the start of the journal that has yet to be loaded."""
+        self._first = 0
+        """The index of the first message that has been loaded."""
+        self._damaged = False
+        """Was a damaged record found while loading the journal?"""
+
+    def exists(self) -> bool:
+        """Does the journal exist?
+
+        Returns:
+            `True` if the journal exists, `False` if not.
+        """
+        return self._path.exists()
+
+    @staticmethod
+    def _details_of(
+        conversation: ConversationData,
+    ) -> tuple[str, str, str, int | None]:
+        """Get the details of a conversation that aren't part of the history.
+
+        Args:
+            conversation: The conversation to get the details of.
+
+        Returns:
+            The title, model, host and library ID of the conversation.
+        """
+        return (
+            conversation.title,
+            conversation.model,
+            conversation.host,
+            conversation.library_id,
+        )
+
+    @staticmethod
+    def _details_record(conversation: ConversationData) -> dict[str, Any]:
+        """Create a record of the details of a conversation.
+
+        Args:
+            conversation: The conversation to make the record for.
+
+        Returns:
+            The record.
+        """
+        return {
+            "type": "details",
+            "title": conversation.title,
+            "model": conversation.model,
+            "host": conversation.host,
+            **(
+                {}
+                if conversation.library_id is None
+                else {"library_id": conversation.library_id}
+            ),
+        }
+
+    @staticmethod
+    def _signature(
+        message: ChatMessage,
+    ) -> tuple[int, str | None, GenerationStats | None]:
+        """Get a signature of a message, to tell if it has changed.
+
+        Args:
+            message: The message to get the signature of.
+
+        Returns:
+            The length of the content of the message, why it finished and
+            the statistics of its generation.
+
+        Note:
+            Content is only ever added to the end of a message, so its
+            length is enough to tell if it has changed.
+        """
+        return (len(message.content), message.done_reason, message.stats)
+
+    @staticmethod
+    def _message_record(index: int, message: ChatMessage) -> dict[str, Any]:
+        """Create a record of a message in a conversation.
+
+        Args:
+            index: The index of the message in the history.
+            message: The message to make the record for.
+
+        Returns:
+            The record.
+        """
+        return {"type": "message", "index": index, **message.json}
+
+    @staticmethod
+    def _branches_record(conversation: ConversationData) -> dict[str, Any]:
+        """Create a record of the other branches of a conversation.
+
+        Args:
+            conversation: The conversation to make the record for.
+
+        Returns:
+            The record.
+        """
+        return {
+            "type": "branches",
+            "branch": conversation.branch,
+            "branches": [
+                {
+                    "id": branch_id,
+                    "parent": branch.parent,
+                    "fork": branch.fork,
+                    "messages": [message.json for message in branch.messages],
+                }
+                for branch_id, branch in conversation.branches.items()
+            ],
+        }
+
+    @staticmethod
+    def _write(journal: TextIO, records: list[dict[str, Any]]) -> None:
+        """Write records to the journal and ensure they're on disk.
+
+        Args:
+            journal: The journal file to write to.
+            records: The records to write.
+        """
+        journal.write("".join(f"{dumps(record)}\n" for record in records))
+        journal.flush()
+        fsync(journal.fileno())
+
+    def load(self) -> ConversationData:
+        """Load the conversation by replaying the journal.
+
+        Returns:
+            The conversation held in the journal.
+
+        Note:
+            If the journal ends with a damaged record, as might happen if
+            Natter was stopped while writing to it, the damaged record is
+            ignored and the journal is repaired.
+        """
+        conversation = ConversationData("Untitled", "llama3")
+        self._records = 0
+        self._since_details = 0
+        self._head = None
+        damaged = False
+        with self._path.open(encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    record = loads(line)
+                except JSONDecodeError:
+                    damaged = True
+                    break
+                self._records += 1
+                self._since_details += 1
+                if record.get("type") == "details":
+                    self._apply_details(conversation, record)
+                    self._since_details = 0
+                elif record.get("type") == "message":
+                    self._apply_message(conversation, record)
+                elif record.get("type") == "branches":
+                    self._apply_branches(conversation, record)
+        self._details = self._details_of(conversation)
+        self._signatures = [self._signature(message) for message in conversation]
+        self._branch = conversation.branch
+        if damaged:
+            self.snapshot(conversation)
+        return conversation
+
+    @staticmethod
+    def _apply_details(conversation: ConversationData, record: dict[str, Any]) -> None:
+        """Apply a record of the details of a conversation.
+
+        Args:
+            conversation: The conversation to apply the record to.
+            record: The record to apply.
+        """
+        conversation.title = record.get("title", conversation.title)
+        conversation.model = record.get("model", conversation.model)
+        conversation.host = record.get("host", conversation.host)
+        conversation.library_id = record.get("library_id")
+
+    @staticmethod
+    def _apply_message(conversation: ConversationData, record: dict[str, Any]) -> None:
+        """Apply a record of a message in a conversation.
+
+        Args:
+            conversation: The conversation to apply the record to.
+            record: The record to apply.
+        """
+        if (index := record["index"]) < len(conversation.history):
+            conversation.history[index] = ChatMessage.from_json(record)
+        else:
+            conversation.history.append(ChatMessage.from_json(record))
+
+    @staticmethod
+    def _apply_branches(conversation: ConversationData, record: dict[str, Any]) -> None:
+        """Apply a record of the other branches of a conversation.
+
+        Args:
+            conversation: The conversation to apply the record to.
+            record: The record to apply.
+        """
+        conversation.branch = record["branch"]
+        conversation.branches = {
+            branch["id"]: Branch(
+                branch["parent"],
+                branch["fork"],
+                [ChatMessage.from_json(message) for message in branch["messages"]],
+            )
+            for branch in record["branches"]
+        }
+
+    def _lines_backwards(self, journal: BinaryIO) -> Iterator[tuple[int, bytes]]:
+        """Read the lines of the journal from the end back to the start.
+
+        Args:
+            journal: The journal file to read.
+
+        Yields:
+            The offset of each line in the journal, and the line.
+        """
+        position = journal.seek(0, SEEK_END)
+        partial = b""
+        while position > 0:
+            size = min(self.READ_SIZE, position)
+            position -= size
+            journal.seek(position)
+            block = journal.read(size) + partial
+            partial, *lines = block.split(b"\n")
+            end = position + len(block)
+            for line in reversed(lines):
+                end -= len(line)
+                yield end, line
+                end -= 1
+        yield 0, partial
+
+    @property
+    def loading(self) -> bool:
+        """Is there older history still to be loaded with `load_head`?"""
+        return self._head is not None
+
+    def load_tail(self, messages: int) -> ConversationData:
+        """Load the details and the most recent messages of the conversation.
+
+        Args:
+            messages: The number of recent messages to load.
+
+        Returns:
+            The conversation, holding only the most recent messages.
+
+        Note:
+            The journal is read from the end, and only as much of it as is
+            needed is read. If there are older messages, they should be
+            loaded with `load_head`; the conversation must not be saved
+            until they have been.
+        """
+        conversation = ConversationData("Untitled", "llama3")
+        details: dict[str, Any] | None = None
+        branches: dict[str, Any] | None = None
+        recent: dict[int, ChatMessage] = {}
+        self._records = 0
+        self._since_details = 0
+        self._head = None
+        self._first = 0
+        self._damaged = False
+        with self._path.open("rb") as journal:
+            for offset, line in self._lines_backwards(journal):
+                if not line.strip():
+                    continue
+                try:
+                    record = loads(line)
+                except JSONDecodeError:
+                    self._damaged = True
+                    continue
+                if record.get("type") == "details":
+                    details = details or record
+                elif record.get("type") == "branches":
+                    branches = branches or record
+                elif record.get("type") == "message" and self._head is None:
+                    if (index := record["index"]) in recent:
+                        # Reading backwards, the first record we see for a
+                        # message is the latest version of it.
+                        pass
+                    elif len(recent) < messages:
+                        recent[index] = ChatMessage.from_json(record)
+                    else:
+                        self._head = offset + len(line) + 1
+                        self._first = index + 1
+                if self._head is None:
+                    self._records += 1
+                if details is None:
+                    self._since_details += 1
+                elif self._head is not None:
+                    break
+        if details is not None:
+            self._apply_details(conversation, details)
+        if branches is not None:
+            self._apply_branches(conversation, branches)
+        conversation.history = [recent[index] for index in sorted(recent)]
+        self._details = self._details_of(conversation)
+        if self._head is None:
+            self._loaded(conversation)
+        return conversation
+
+    def load_head(self, conversation: ConversationData) -> list[ChatMessage]:
+        """Load the older messages that `load_tail` didn't load.
+
+        Args:
+            conversation: The conversation that was loaded with `load_tail`.
+
+        Returns:
+            The older messages, which are also added to the start of the
+            conversation.
+        """
+        if self._head is None:
+            return []
+        older = ConversationData(conversation.title, conversation.model)
+        branches: dict[str, Any] | None = None
+        with self._path.open("rb") as journal:
+            read = 0
+            for line in journal:
+                if (read := read + len(line)) > self._head:
+                    break
+                try:
+                    record = loads(line)
+                except JSONDecodeError:
+                    self._damaged = True
+                    continue
+                self._records += 1
+                if record.get("type") == "message" and record["index"] < self._first:
+                    self._apply_message(older, record)
+                elif record.get("type") == "branches":
+                    branches = record
+        if branches is not None and not conversation.branches:
+            self._apply_branches(conversation, branches)
+        conversation.prepend(older.history)
+        self._head = None
+        self._loaded(conversation)
+        return older.history
+
+    def _loaded(self, conversation: ConversationData) -> None:
+        """Finish off loading a conversation.
+
+        Args:
+            conversation: The conversation that has been loaded.
+        """
+        self._signatures = [self._signature(message) for message in conversation]
+        self._branch = conversation.branch
+        if self._damaged:
+            self.snapshot(conversation)
+
+    def snapshot(self, conversation: ConversationData) -> None:
+        """Atomically replace the journal with a snapshot of a conversation.
+
+        Args:
+            conversation: The conversation to snapshot.
+        """
+        # The details go last, so they're close to the end of the journal
+        # for anything reading it from the end.
+        records = [
+            self._message_record(index, message)
+            for index, message in enumerate(conversation)
+        ]
+        if conversation.branches:
+            records.append(self._branches_record(conversation))
+        records.append(self._details_record(conversation))
+        working = self._path.with_suffix(f"{self._path.suffix}.tmp")
+        with working.open("w", encoding="utf-8") as journal:
+            self._write(journal, records)
+        replace(working, self._path)
+        self._details = self._details_of(conversation)
+        self._signatures = [self._signature(message) for message in conversation]
+        self._branch = conversation.branch
+        self._records = len(records)
+        self._since_details = 0
+
+    def save(self, conversation: ConversationData) -> None:
+        """Save any changes to a conversation to the journal.
+
+        Args:
+            conversation: The conversation to save.
+
+        Note:
+            Only messages that are new or changed since the last save are
+            written; if the conversation no longer follows on from what is
+            in the journal, or the journal is due to be compacted, a fresh
+            snapshot is taken instead. A fresh snapshot is also taken if the
+            conversation is now following a different branch.
+        """
+        history = list(conversation)
+        if (
+            not self._path.exists()
+            or conversation.branch != self._branch
+            or len(history) < len(self._signatures)
+            or self._records - (len(history) + 1 + bool(conversation.branches))
+            > self.COMPACT_SLACK
+        ):
+            self.snapshot(conversation)
+            return
+        # Only the last message we wrote can have changed since, so we start
+        # looking for changes from there.
+        start = max(len(self._signatures) - 1, 0)
+        records: list[dict[str, Any]] = []
+        for index in range(start, len(history)):
+            written = self._signatures[index] if index < len(self._signatures) else None
+            if written != self._signature(history[index]):
+                records.append(self._message_record(index, history[index]))
+        if (
+            self._details != self._details_of(conversation)
+            or self._since_details + len(records) >= self.DETAILS_INTERVAL
+        ):
+            records.append(self._details_record(conversation))
+            self._since_details = 0
+        else:
+            self._since_details += len(records)
+        if records:
+            with self._path.open("a", encoding="utf-8") as journal:
+                self._write(journal, records)
+            self._details = self._details_of(conversation)
+            del self._signatures[start:]
+            self._signatures.extend(
+                self._signature(message) for message in history[start:]
+            )
+            self._records += len(records)
+
+
+### journal.py ends here
@@ -0,0 +1,498 @@
+"""A library of stored conversations."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from json import dumps, loads
+from pathlib import Path
+from sqlite3 import Connection, connect
+from time import time
+from typing import Any, Final, Iterator
+
+##############################################################################
+# Local imports.
+from .chat_message import ChatMessage, GenerationStats
+from .conversation_data import Branch, ConversationData
+
+
+##############################################################################
+@dataclass(frozen=True)
+class LibraryEntry:
+    """The details of a conversation that is stored in the library."""
+
+    id: int
+    """The ID of the conversation in the library."""
+
+    title: str
+    """The title of the conversation."""
+
+    model: str
+    """The name of the model used with the conversation."""
+
+    host: str
+    """The host the conversation was held with."""
+
+    created: float
+    """When the conversation was first stored, as a timestamp."""
+
+    updated: float
+    """When the conversation was last stored, as a timestamp."""
+
+    messages: int
+    """The number of messages in the conversation."""
+
+    preview: str
+    """The start of the first message in the conversation."""
+
+    @property
+    def label(self) -> str:
+        """A label for the conversation.
+
+        This is the title of the conversation, unless it doesn't have one,
+        in which case it's the start of the first message.
+        """
+        if self.title == "Untitled" and self.preview:
+            return self.preview
+        return self.title
+
+    def __str__(self) -> str:
+        return (
+            f"{self.id}: {self.label} ({self.model}, {self.messages} "
+            f"message{'' if self.messages == 1 else 's'}, "
+            f"{datetime.fromtimestamp(self.updated):%Y-%m-%d %H:%M})"
+        )
+
+
+##############################################################################
+@dataclass(frozen=True)
+class SearchHit:
+    """A message in the library that matched a search."""
+
+    conversation: LibraryEntry
+    """The details of the conversation the message is in."""
+
+    position: int
+    """The position of the message in the conversation."""
+
+    role: str
+    """The role of the message."""
+
+    snippet: str
+    """The part of the message that matched."""
+
+
+##############################################################################
+class ConversationLibrary:
+    """A library of conversations, stored in a SQLite database.
+
+    The details of each conversation are kept apart from its messages, so
+    the library can be listed without reading any messages, and opening a
+    conversation only reads the messages of that conversation.
+
+    The messages are indexed for full-text search. The index is kept up to
+    date by the database itself as messages are stored, changed and
+    deleted, so it never needs rebuilding. Only the branch of each
+    conversation that was being followed is indexed; the other branches
+    are kept alongside it, each holding only the messages from where it
+    forks onwards.
+    """
+
+    SCHEMA: Final[str] = """
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        model TEXT NOT NULL,
+        host TEXT NOT NULL,
+        created REAL NOT NULL,
+        updated REAL NOT NULL,
+        messages INTEGER NOT NULL,
+        preview TEXT NOT NULL,
+        branch INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS conversations_by_update
+        ON conversations (updated);
+    CREATE TABLE IF NOT EXISTS messages (
+        conversation INTEGER NOT NULL
+            REFERENCES conversations (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        done_reason TEXT,
+        created REAL,
+        stats TEXT,
+        PRIMARY KEY (conversation, position)
+    );
+    CREATE TABLE IF NOT EXISTS branches (
+        conversation INTEGER NOT NULL
+            REFERENCES conversations (id) ON DELETE CASCADE,
+        id INTEGER NOT NULL,
+        parent INTEGER NOT NULL,
+        fork INTEGER NOT NULL,
+        messages TEXT NOT NULL,
+        PRIMARY KEY (conversation, id)
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS message_index USING fts5 (
+        content,
+        content = messages,
+        tokenize = "porter unicode61"
+    );
+    CREATE TRIGGER IF NOT EXISTS message_added AFTER INSERT ON messages BEGIN
+        INSERT INTO message_index (rowid, content)
+            VALUES (new.rowid, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS message_removed AFTER DELETE ON messages BEGIN
+        INSERT INTO message_index (message_index, rowid, content)
+            VALUES ('delete', old.rowid, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS message_changed AFTER UPDATE ON messages BEGIN
+        INSERT INTO message_index (message_index, rowid, content)
+            VALUES ('delete', old.rowid, old.content);
+        INSERT INTO message_index (rowid, content)
+            VALUES (new.rowid, new.content);
+    END;
+    """
+    """The schema of the library's database."""
+
+    ADDED_COLUMNS: Final[tuple[tuple[str, str, str], ...]] = (
+        ("conversations", "branch", "INTEGER NOT NULL DEFAULT 0"),
+        ("messages", "created", "REAL"),
+        ("messages", "stats", "TEXT"),
+    )
+    """The table, name and definition of each column added since the library began."""
+
+    SNIPPET_TOKENS: Final[int] = 16
+    """The number of tokens to show around a search match."""
+
+    PREVIEW_LENGTH: Final[int] = 60
+    """The most characters of the first message to keep as a preview."""
+
+    def __init__(self, path: Path) -> None:
+        """Initialise the library.
+
+        Args:
+            path: The path to the library's database.
+        """
+        self._path = path
+        """The path to the library's database."""
+        self._ready = False
+        """Has the schema of the database been set up?"""
+
+    @contextmanager
+    def _database(self) -> Iterator[Connection]:
+        """Open the library's database.
+
+        Yields:
+            A connection to the database.
+
+        Note:
+            Everything done with the connection is done within a single
+            transaction, which is committed when the connection is done
+            with, or rolled back if there's an error.
+        """
+        with closing(connect(self._path)) as database:
+            database.execute("PRAGMA foreign_keys = ON")
+            if not self._ready:
+                unindexed = not database.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'message_index'"
+                ).fetchone()
+                database.executescript(self.SCHEMA)
+                for table, column, definition in self.ADDED_COLUMNS:
+                    # The library may have been made before the column was
+                    # added to the schema, in which case it's added now.
+                    if not any(
+                        existing == column
+                        for _, existing, *_ in database.execute(
+                            f"PRAGMA table_info ({table})"
+                        )
+                    ):
+                        database.execute(
+                            f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+                        )
+                if unindexed:
+                    # The library was made before messages were indexed, so
+                    # bring the index up to date with what's already there.
+                    database.execute(
+                        "INSERT INTO message_index (message_index) VALUES ('rebuild')"
+                    )
+                self._ready = True
+            with database:
+                yield database
+
+    @classmethod
+    def _preview(cls, conversation: ConversationData) -> str:
+        """Make a preview of a conversation.
+
+        Args:
+            conversation: The conversation to make the preview of.
+
+        Returns:
+            The start of the first line of the first message.
+        """
+        for message in conversation:
+            if preview := message.content.strip().partition("\n")[0]:
+                return preview[: cls.PREVIEW_LENGTH]
+        return ""
+
+    @staticmethod
+    def _row(message: ChatMessage) -> tuple[Any, ...]:
+        """Get the columns of a message as they're stored in the library.
+
+        Args:
+            message: The message to get the columns of.
+
+        Returns:
+            The role, content, done reason, creation time and generation
+            statistics of the message.
+        """
+        return (
+            message.role,
+            message.content,
+            message.done_reason,
+            message.created,
+            None if message.stats is None else dumps(message.stats.json),
+        )
+
+    @staticmethod
+    def _message(
+        role: str,
+        content: str,
+        done_reason: str | None = None,
+        created: float | None = None,
+        stats: str | None = None,
+    ) -> ChatMessage:
+        """Make a message from its columns as they're stored in the library.
+
+        Args:
+            role: The role of the message.
+            content: The content of the message.
+            done_reason: Why the message finished, if it was cut short.
+            created: When the message was created, as a timestamp.
+            stats: The generation statistics of the message, as JSON.
+
+        Returns:
+            The message.
+        """
+        return ChatMessage(
+            role,
+            content,
+            done_reason,
+            created,
+            None if stats is None else GenerationStats(**loads(stats)),
+        )
+
+    def store(self, conversation: ConversationData) -> int:
+        """Store a conversation in the library.
+
+        Args:
+            conversation: The conversation to store.
+
+        Returns:
+            The ID of the conversation in the library.
+
+        Note:
+            If the conversation is already in the library it is replaced;
+            if not, it is added, and its library ID is set. Only messages
+            that have changed since the conversation was last stored are
+            written, so only they need indexing again.
+        """
+        history = list(conversation)
+        details = (
+            conversation.title,
+            conversation.model,
+            conversation.host,
+            time(),
+            len(history),
+            self._preview(conversation),
+            conversation.branch,
+        )
+        with self._database() as database:
+            if (
+                conversation.library_id is not None
+                and database.execute(
+                    "UPDATE conversations SET title = ?, model = ?, host = ?, "
+                    "updated = ?, messages = ?, preview = ?, branch = ? WHERE id = ?",
+                    (*details, conversation.library_id),
+                ).rowcount
+            ):
+                database.execute(
+                    "DELETE FROM messages WHERE conversation = ? AND position >= ?",
+                    (conversation.library_id, len(history)),
+                )
+            else:
+                conversation.library_id = database.execute(
+                    "INSERT INTO conversations "
+                    "(title, model, host, updated, messages, preview, branch, "
+                    "created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*details, details[3]),
+                ).lastrowid
+            database.executemany(
+                "INSERT INTO messages "
+                "(conversation, position, role, content, done_reason, created, stats) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (conversation, position) DO UPDATE SET "
+                "role = excluded.role, content = excluded.content, "
+                "done_reason = excluded.done_reason, created = excluded.created, "
+                "stats = excluded.stats "
+                "WHERE (role, content, done_reason, created, stats) IS NOT "
+                "(excluded.role, excluded.content, excluded.done_reason, "
+                "excluded.created, excluded.stats)",
+                (
+                    (conversation.library_id, position, *self._row(message))
+                    for position, message in enumerate(history)
+                ),
+            )
+            database.execute(
+                "DELETE FROM branches WHERE conversation = ? "
+                "AND id NOT IN (SELECT value FROM json_each(?))",
+                (conversation.library_id, dumps(list(conversation.branches))),
+            )
+            database.executemany(
+                "INSERT INTO branches (conversation, id, parent, fork, messages) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (conversation, id) DO UPDATE SET "
+                "parent = excluded.parent, fork = excluded.fork, "
+                "messages = excluded.messages "
+                "WHERE (parent, fork, messages) IS NOT "
+                "(excluded.parent, excluded.fork, excluded.messages)",
+                (
+                    (
+                        conversation.library_id,
+                        branch_id,
+                        branch.parent,
+                        branch.fork,
+                        dumps([self._row(message) for message in branch.messages]),
+                    )
+                    for branch_id, branch in conversation.branches.items()
+                ),
+            )
+        assert conversation.library_id is not None
+        return conversation.library_id
+
+    def entries(self) -> list[LibraryEntry]:
+        """Get the details of the conversations in the library.
+
+        Returns:
+            The details of the conversations, most recently stored first.
+        """
+        with self._database() as database:
+            return [
+                LibraryEntry(*row)
+                for row in database.execute(
+                    "SELECT id, title, model, host, created, updated, messages, "
+                    "preview FROM conversations ORDER BY updated DESC"
+                )
+            ]
+
+    def load(self, library_id: int) -> ConversationData | None:
+        """Load a conversation from the library.
+
+        Args:
+            library_id: The ID of the conversation to load.
+
+        Returns:
+            The conversation, or `None` if there isn't one with that ID.
+        """
+        with self._database() as database:
+            if (
+                details := database.execute(
+                    "SELECT title, model, host, branch FROM conversations WHERE id = ?",
+                    (library_id,),
+                ).fetchone()
+            ) is None:
+                return None
+            title, model, host, branch = details
+            return ConversationData(
+                title,
+                model,
+                [
+                    self._message(*row)
+                    for row in database.execute(
+                        "SELECT role, content, done_reason, created, stats "
+                        "FROM messages WHERE conversation = ? ORDER BY position",
+                        (library_id,),
+                    )
+                ],
+                host,
+                library_id,
+                branch,
+                {
+                    branch_id: Branch(
+                        parent,
+                        fork,
+                        [self._message(*row) for row in loads(messages)],
+                    )
+                    for branch_id, parent, fork, messages in database.execute(
+                        "SELECT id, parent, fork, messages FROM branches "
+                        "WHERE conversation = ?",
+                        (library_id,),
+                    )
+                },
+            )
+
+    @staticmethod
+    def _query(terms: list[str]) -> str:
+        """Turn search terms into a full-text query.
+
+        Args:
+            terms: The terms to search for.
+
+        Returns:
+            A query that matches messages that contain all of the terms.
+        """
+        return " ".join(
+            '"{}"'.format(term.replace('"', '""')) for term in terms if term
+        )
+
+    def search(self, terms: list[str], limit: int = 50) -> list[SearchHit]:
+        """Search the messages in the library.
+
+        Args:
+            terms: The terms to search for.
+            limit: The most hits to return.
+
+        Returns:
+            The messages that contain all of the terms, best matches first.
+        """
+        if not (query := self._query(terms)):
+            return []
+        with self._database() as database:
+            return [
+                SearchHit(LibraryEntry(*row[:8]), *row[8:])
+                for row in database.execute(
+                    "SELECT conversations.id, title, model, host, "
+                    "conversations.created, updated, messages, preview, "
+                    "position, role, "
+                    "snippet(message_index, 0, '', '', '...', ?) "
+                    "FROM message_index "
+                    "JOIN messages ON messages.rowid = message_index.rowid "
+                    "JOIN conversations ON conversations.id = messages.conversation "
+                    "WHERE message_index MATCH ? ORDER BY rank LIMIT ?",
+                    (self.SNIPPET_TOKENS, query, limit),
+                )
+            ]
+
+    def delete(self, library_id: int) -> bool:
+        """Delete a conversation from the library.
+
+        Args:
+            library_id: The ID of the conversation to delete.
+
+        Returns:
+            `True` if the conversation was deleted, `False` if there wasn't
+            one with that ID.
+        """
+        with self._database() as database:
+            return bool(
+                database.execute(
+                    "DELETE FROM conversations WHERE id = ?", (library_id,)
+                ).rowcount
+            )
+
+
+### library.py ends here
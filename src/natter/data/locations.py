@@ -6,7 +6,7 @@ from pathlib import Path
 
 ##############################################################################
 # XDG imports.
-from xdg_base_dirs import xdg_data_home
+from xdg_base_dirs import xdg_config_home, xdg_data_home
 
 
 ##############################################################################
@@ -24,6 +24,21 @@ def data_dir() -> Path:
     return save_to
 
 
+##############################################################################
+def config_dir() -> Path:
+    """The path to the configuration directory for the application.
+
+    Returns:
+        The path to the configuration directory for the application.
+
+    Note:
+        If the directory doesn't exist, it will be created as a side-effect
+        of calling this function.
+    """
+    (save_to := xdg_config_home() / "natter").mkdir(parents=True, exist_ok=True)
+    return save_to
+
+
 ##############################################################################
 def conversations_dir() -> Path:
     """The path to the conversations directory.
@@ -39,4 +54,52 @@ def conversations_dir() -> Path:
     return save_to
 
 
+##############################################################################
+def ongoing_journal() -> Path:
+    """The path to the journal that holds the ongoing conversation.
+
+    Returns:
+        The path to the journal that holds the ongoing conversation.
+    """
+    return conversations_dir() / "conversation.jsonl"
+
+
+##############################################################################
+def library_file() -> Path:
+    """The path to the database that holds the library of conversations.
+
+    Returns:
+        The path to the database that holds the library of conversations.
+    """
+    return data_dir() / "library.db"
+
+
+##############################################################################
+def cache_dir() -> Path:
+    """The path to the directory for cached replies.
+
+    Returns:
+        The path to the directory for cached replies.
+
+    Note:
+        If the directory doesn't exist, it will be created as a side-effect
+        of calling this function.
+    """
+    (save_to := data_dir() / "cache").mkdir(parents=True, exist_ok=True)
+    return save_to
+
+
+##############################################################################
+def recall_dir(model: str) -> Path:
+    """The path to the directory for the recall index of an embedding model.
+
+    Args:
+        model: The name of the embedding model.
+
+    Returns:
+        The path to the directory for the recall index.
+    """
+    return data_dir() / "recall" / model.replace("/", "_").replace(":", "_")
+
+
 ### locations.py ends here
@@ -0,0 +1,239 @@
+"""Performance metrics for interactions with a model."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from asyncio import Task, create_task, sleep
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from json import dumps
+from pathlib import Path
+from statistics import median, quantiles
+from time import monotonic
+from typing import Any, Final
+
+
+##############################################################################
+@dataclass
+class InteractionMetrics:
+    """Performance metrics for a single interaction with a model."""
+
+    model: str
+    """The model that was interacted with."""
+
+    host: str = ""
+    """The host that handled the interaction."""
+
+    started: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    """When the interaction started."""
+
+    time_to_first_token: float | None = None
+    """The time until the first token of the reply arrived, in seconds."""
+
+    connect_time: float | None = None
+    """The part of the time to first token spent connecting to the host, in seconds."""
+
+    duration: float = 0.0
+    """The time the whole interaction took, in seconds."""
+
+    parts: int = 0
+    """The number of parts of the reply that were received."""
+
+    eval_count: int | None = None
+    """The number of tokens the server reported generating."""
+
+    eval_duration: int | None = None
+    """The time the server reported spending generating, in nanoseconds."""
+
+    prompt_eval_count: int | None = None
+    """The number of prompt tokens the server reported evaluating."""
+
+    prompt_eval_duration: int | None = None
+    """The time the server reported evaluating the prompt, in nanoseconds."""
+
+    renders: list[float] = field(default_factory=list)
+    """The time taken by each render of the reply, in seconds."""
+
+    loop_lag: float = 0.0
+    """The worst event loop lag seen during the interaction, in seconds."""
+
+    @property
+    def tokens(self) -> int:
+        """The number of tokens in the reply."""
+        return self.parts if self.eval_count is None else self.eval_count
+
+    @property
+    def generation_rate(self) -> float | None:
+        """The rate the server reported generating tokens at, per second."""
+        if self.eval_count and self.eval_duration:
+            return self.eval_count / (self.eval_duration / 1e9)
+        return None
+
+    @property
+    def received_rate(self) -> float | None:
+        """The rate tokens were received at, per second."""
+        if self.time_to_first_token is None:
+            return None
+        if (streaming := self.duration - self.time_to_first_token) <= 0:
+            return None
+        return self.tokens / streaming
+
+    @property
+    def render_time(self) -> float:
+        """The total time spent rendering the reply, in seconds."""
+        return sum(self.renders)
+
+    @property
+    def render_summary(self) -> dict[str, float | int | None]:
+        """A summary of the time taken by the renders of the reply.
+
+        Has the number of renders, and the median, 95th percentile and
+        worst time taken by a render, in seconds.
+        """
+        renders = self.renders
+        return {
+            "count": len(renders),
+            "p50": median(renders) if renders else None,
+            "p95": (
+                quantiles(renders, n=20, method="inclusive")[-1]
+                if len(renders) > 1
+                else max(renders, default=None)
+            ),
+            "max": max(renders, default=None),
+        }
+
+    @property
+    def json(self) -> dict[str, Any]:
+        """The metrics as a JSON-friendly structure.
+
+        Note:
+            Rather than the time taken by every render, which for a long
+            reply would be a very long list, a summary of them is given.
+        """
+        return {
+            **asdict(self),
+            "renders": self.render_summary,
+            "tokens": self.tokens,
+            "generation_rate": self.generation_rate,
+            "received_rate": self.received_rate,
+            "render_time": self.render_time,
+        }
+
+    def record_final(self, part: Any) -> None:
+        """Record the statistics the server sends in the final part of a reply.
+
+        Args:
+            part: The final part of the reply.
+        """
+        self.eval_count = part.get("eval_count")
+        self.eval_duration = part.get("eval_duration")
+        self.prompt_eval_count = part.get("prompt_eval_count")
+        self.prompt_eval_duration = part.get("prompt_eval_duration")
+
+    def append_to(self, log: Path) -> None:
+        """Append the metrics to a log file.
+
+        Args:
+            log: The path to the log file.
+        """
+        with log.expanduser().open("a", encoding="utf-8") as metrics_log:
+            metrics_log.write(f"{dumps(self.json)}\n")
+
+    @staticmethod
+    def _milliseconds(seconds: float | None) -> str:
+        """Format a time for display, in milliseconds.
+
+        Args:
+            seconds: The time to format, in seconds, if known.
+
+        Returns:
+            The time, formatted for display.
+        """
+        return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+    @staticmethod
+    def _rate(rate: float | None) -> str:
+        """Format a rate of tokens for display.
+
+        Args:
+            rate: The rate to format, in tokens per second, if known.
+
+        Returns:
+            The rate, formatted for display.
+        """
+        return "-" if rate is None else f"{rate:.1f} tok/s"
+
+    @property
+    def speed(self) -> str:
+        """A short summary of how quickly the reply arrived."""
+        return (
+            f"TTFT {self._milliseconds(self.time_to_first_token)} │ "
+            f"{self._rate(self.generation_rate or self.received_rate)}"
+        )
+
+    @property
+    def summary(self) -> str:
+        """A one-line summary of the metrics."""
+        return (
+            f"{self.speed} │ "
+            f"render {self._milliseconds(max(self.renders, default=None))} │ "
+            f"lag {self._milliseconds(self.loop_lag)}"
+        )
+
+    def __str__(self) -> str:
+        return "\n".join(
+            [
+                f"Host: {self.host or 'default'}",
+                f"Time to first token: {self._milliseconds(self.time_to_first_token)}",
+                f"Connecting: {self._milliseconds(self.connect_time)}",
+                f"Total time: {self._milliseconds(self.duration)}",
+                f"Tokens: {self.tokens}",
+                f"Generation: {self._rate(self.generation_rate)}",
+                f"Received: {self._rate(self.received_rate)}",
+                f"Renders: {len(self.renders)}, "
+                f"{self._milliseconds(self.render_time)} in total, "
+                f"{self._milliseconds(max(self.renders, default=None))} at worst",
+                f"Worst event loop lag: {self._milliseconds(self.loop_lag)}",
+            ]
+        )
+
+
+##############################################################################
+class EventLoopLag:
+    """Context manager that measures how late the event loop runs work.
+
+    While active, the worst lag seen is recorded in the given metrics.
+    """
+
+    INTERVAL: Final[float] = 0.05
+    """How often to measure the lag, in seconds."""
+
+    def __init__(self, metrics: InteractionMetrics) -> None:
+        """Initialise the lag monitor.
+
+        Args:
+            metrics: The metrics to record the lag in.
+        """
+        self._metrics = metrics
+        self._monitor: Task[None] | None = None
+
+    async def _measure(self) -> None:
+        """Measure the lag of the event loop until cancelled."""
+        while True:
+            expected = monotonic() + self.INTERVAL
+            await sleep(self.INTERVAL)
+            self._metrics.loop_lag = max(self._metrics.loop_lag, monotonic() - expected)
+
+    def __enter__(self) -> InteractionMetrics:
+        self._monitor = create_task(self._measure())
+        return self._metrics
+
+    def __exit__(self, *_: object) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+
+
+### metrics.py ends here
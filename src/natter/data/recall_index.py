@@ -0,0 +1,219 @@
+"""An index of embedded messages, for recalling messages by meaning.
+
+Note:
+    This module needs NumPy, which is an optional dependency; check that
+    it's available before importing it.
+"""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from collections.abc import Sequence
+from dataclasses import dataclass
+from json import dumps, loads
+from pathlib import Path
+from typing import Any, Final
+
+##############################################################################
+# NumPy imports.
+import numpy as np
+from numpy.typing import NDArray
+
+
+##############################################################################
+@dataclass(frozen=True)
+class Recollection:
+    """A message recalled from the index."""
+
+    score: float
+    """How similar the message is to what was asked for, from -1 to 1."""
+
+    title: str
+    """The title of the conversation the message was in."""
+
+    library_id: int | None
+    """The ID of the conversation in the library, if it was in the library."""
+
+    role: str
+    """The role of the message."""
+
+    content: str
+    """The content of the message."""
+
+
+##############################################################################
+class RecallIndex:
+    """An index of embedded messages, for recalling messages by meaning.
+
+    The embedding of each message is normalised and appended to a file of
+    32-bit floats; searching memory-maps that file and works through it a
+    batch at a time, so the index never has to fit in memory. The messages
+    themselves are appended, as lines of JSON, to a file of their own, with
+    the offset of each line kept in a third file, so that only the messages
+    that are recalled ever need to be read.
+    """
+
+    VECTORS: Final[str] = "vectors.f32"
+    """The name of the file that holds the embeddings."""
+
+    MESSAGES: Final[str] = "messages.jsonl"
+    """The name of the file that holds the messages."""
+
+    OFFSETS: Final[str] = "offsets.i64"
+    """The name of the file that holds the offset of each message."""
+
+    DETAILS: Final[str] = "index.json"
+    """The name of the file that holds the details of the index."""
+
+    SEARCH_BATCH: Final[int] = 16_384
+    """The number of embeddings to compare with a query at a time."""
+
+    def __init__(self, directory: Path) -> None:
+        """Initialise the index.
+
+        Args:
+            directory: The directory the index is kept in.
+        """
+        self._directory = directory
+        """The directory the index is kept in."""
+        details = directory / self.DETAILS
+        self._dimensions: int | None = (
+            loads(details.read_text(encoding="utf-8"))["dimensions"]
+            if details.exists()
+            else None
+        )
+        """The number of dimensions of each embedding, once known."""
+
+    def __len__(self) -> int:
+        if self._dimensions is None:
+            return 0
+        try:
+            vectors = (self._directory / self.VECTORS).stat().st_size
+            offsets = (self._directory / self.OFFSETS).stat().st_size
+        except FileNotFoundError:
+            return 0
+        # Embeddings are written last, so any embedding is for a message
+        # that's been written; a partial write is ignored.
+        return min(vectors // (self._dimensions * 4), offsets // 8)
+
+    @staticmethod
+    def _normalised(vectors: NDArray[np.float32]) -> NDArray[np.float32]:
+        """Normalise embeddings, so that comparing them is a dot product.
+
+        Args:
+            vectors: The embeddings to normalise, one per row.
+
+        Returns:
+            The normalised embeddings.
+        """
+        norms: NDArray[np.float32] = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return (vectors / norms).astype(np.float32, copy=False)
+
+    def add(
+        self,
+        embeddings: Sequence[Sequence[float]] | NDArray[np.float32],
+        messages: Sequence[dict[str, Any]],
+    ) -> None:
+        """Add messages to the index.
+
+        Args:
+            embeddings: The embedding of each message.
+            messages: The messages, with the title and library ID of their
+                conversation.
+
+        Raises:
+            ValueError: If the embeddings don't match the messages, or the
+                embeddings already in the index.
+        """
+        if not messages:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(messages):
+            raise ValueError("There must be one embedding for each message")
+        if self._dimensions is None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            self._dimensions = int(vectors.shape[1])
+            (self._directory / self.DETAILS).write_text(
+                dumps({"dimensions": self._dimensions}), encoding="utf-8"
+            )
+        if vectors.shape[1] != self._dimensions:
+            raise ValueError(
+                f"Expected embeddings with {self._dimensions} dimensions, "
+                f"got {vectors.shape[1]}"
+            )
+        count = len(self)
+        with (self._directory / self.MESSAGES).open("ab") as store:
+            offset = store.tell()
+            offsets = []
+            for message in messages:
+                offsets.append(offset)
+                offset += store.write(f"{dumps(message)}\n".encode("utf-8"))
+        # Anything past the last complete entry is left over from a write
+        # that didn't finish, so it's dropped before adding to the end.
+        with (self._directory / self.OFFSETS).open("r+b" if count else "wb") as store:
+            store.truncate(count * 8)
+            store.seek(0, 2)
+            store.write(np.asarray(offsets, dtype=np.int64).tobytes())
+        with (self._directory / self.VECTORS).open("r+b" if count else "wb") as store:
+            store.truncate(count * self._dimensions * 4)
+            store.seek(0, 2)
+            store.write(self._normalised(vectors).tobytes())
+
+    def search(self, query: Sequence[float], limit: int = 5) -> list[Recollection]:
+        """Find the messages most similar to a query.
+
+        Args:
+            query: The embedding of the query.
+            limit: The most messages to find.
+
+        Returns:
+            The messages found, most similar first.
+        """
+        if not (count := len(self)) or limit < 1:
+            return []
+        assert self._dimensions is not None
+        vectors = np.memmap(
+            self._directory / self.VECTORS,
+            dtype=np.float32,
+            mode="r",
+            shape=(count, self._dimensions),
+        )
+        target = self._normalised(np.asarray(query, dtype=np.float32))
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for start in range(0, count, self.SEARCH_BATCH):
+            scores = np.concatenate(
+                (best_scores, vectors[start : start + self.SEARCH_BATCH] @ target)
+            )
+            rows = np.concatenate(
+                (best_rows, np.arange(start, start + len(scores) - len(best_rows)))
+            )
+            if len(scores) > limit:
+                keep = np.argpartition(scores, -limit)[-limit:]
+                scores, rows = scores[keep], rows[keep]
+            best_scores, best_rows = scores, rows
+        offsets = np.memmap(
+            self._directory / self.OFFSETS, dtype=np.int64, mode="r", shape=(count,)
+        )
+        recollections = []
+        with (self._directory / self.MESSAGES).open("rb") as store:
+            for index in np.argsort(-best_scores):
+                store.seek(int(offsets[best_rows[index]]))
+                message = loads(store.readline())
+                recollections.append(
+                    Recollection(
+                        float(best_scores[index]),
+                        message["title"],
+                        message["library_id"],
+                        message["role"],
+                        message["content"],
+                    )
+                )
+        return recollections
+
+
+### recall_index.py ends here
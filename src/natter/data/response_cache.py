@@ -0,0 +1,189 @@
+"""A content-addressed cache of replies from models."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from collections.abc import Mapping, Sequence
+from hashlib import sha256
+from json import JSONDecodeError, dumps, loads
+from os import replace, utime
+from pathlib import Path
+from time import time
+from typing import Any, Final
+
+##############################################################################
+# Ollama imports.
+from ollama import Message
+
+
+##############################################################################
+class ResponseCache:
+    """A content-addressed cache of replies from models.
+
+    Each reply is stored in its own file, named after a hash of everything
+    that was sent to get the reply. Entries expire once they are older than
+    the cache's time to live, and once the cache grows beyond its maximum
+    size the least-recently used entries are removed.
+    """
+
+    SUFFIX: Final[str] = ".json"
+    """The suffix of the files that hold the entries in the cache."""
+
+    def __init__(self, directory: Path, max_size: int, ttl: float) -> None:
+        """Initialise the cache.
+
+        Args:
+            directory: The directory to keep the cache in.
+            max_size: The maximum size of the cache, in bytes.
+            ttl: How long an entry stays in the cache, in seconds.
+        """
+        self._directory = directory
+        """The directory the cache is kept in."""
+        self._max_size = max_size
+        """The maximum size of the cache, in bytes."""
+        self._ttl = ttl
+        """How long an entry stays in the cache, in seconds."""
+        self.hits = 0
+        """The number of times a reply was found in the cache."""
+        self.misses = 0
+        """The number of times a reply wasn't found in the cache."""
+
+    @staticmethod
+    def key(
+        model: str, host: str, messages: Sequence[Mapping[str, Any] | Message]
+    ) -> str:
+        """Make the key for a request to a model.
+
+        Args:
+            model: The model the request is for.
+            host: The host, or hosts, the request is for.
+            messages: The exact messages sent in the request.
+
+        Returns:
+            The key for the request.
+        """
+        return sha256(
+            dumps(
+                {
+                    "model": model,
+                    "host": host,
+                    "messages": [
+                        {"role": message["role"], "content": message["content"]}
+                        for message in messages
+                    ],
+                },
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        """Get the path to the file for an entry in the cache.
+
+        Args:
+            key: The key of the entry.
+
+        Returns:
+            The path to the file that holds the entry.
+        """
+        return self._directory / f"{key}{self.SUFFIX}"
+
+    @property
+    def _entries(self) -> list[Path]:
+        """The files that hold the entries in the cache."""
+        return list(self._directory.glob(f"*{self.SUFFIX}"))
+
+    def get(self, key: str) -> str | None:
+        """Get a reply from the cache.
+
+        Args:
+            key: The key of the request to get the reply for.
+
+        Returns:
+            The reply, or `None` if there isn't one in the cache.
+        """
+        entry = self._entry(key)
+        try:
+            cached = loads(entry.read_text(encoding="utf-8"))
+        except (OSError, JSONDecodeError):
+            cached = None
+        if cached is not None and time() - cached.get("created", 0) > self._ttl:
+            entry.unlink(missing_ok=True)
+            cached = None
+        if cached is None:
+            self.misses += 1
+            return None
+        # The modification time of the entry records when it was last used,
+        # so that the least-recently used entries can be evicted first.
+        utime(entry)
+        self.hits += 1
+        return str(cached["reply"])
+
+    def put(self, key: str, reply: str) -> None:
+        """Put a reply into the cache.
+
+        Args:
+            key: The key of the request that got the reply.
+            reply: The reply.
+        """
+        entry = self._entry(key)
+        working = entry.with_suffix(".tmp")
+        working.write_text(dumps({"created": time(), "reply": reply}), encoding="utf-8")
+        replace(working, entry)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove expired entries, and the oldest entries if the cache is too big."""
+        now = time()
+        entries: list[tuple[float, int, Path]] = []
+        for entry in self._entries:
+            try:
+                details = entry.stat()
+            except FileNotFoundError:
+                continue
+            # Anything not used within the time to live can't be live, so
+            # there's no need to read it to know it can go.
+            if now - details.st_mtime > self._ttl:
+                entry.unlink(missing_ok=True)
+            else:
+                entries.append((details.st_mtime, details.st_size, entry))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry in sorted(entries, key=lambda details: details[0]):
+            if size <= self._max_size:
+                break
+            entry.unlink(missing_ok=True)
+            size -= entry_size
+
+    @property
+    def size(self) -> int:
+        """The size of the cache, in bytes."""
+        return sum(entry.stat().st_size for entry in self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float | None:
+        """The proportion of lookups that found a reply, if there have been any."""
+        if lookups := self.hits + self.misses:
+            return self.hits / lookups
+        return None
+
+    def clear(self) -> None:
+        """Remove everything from the cache."""
+        for entry in self._entries:
+            entry.unlink(missing_ok=True)
+        self.hits = self.misses = 0
+
+    def __str__(self) -> str:
+        return f"{len(self)} replies, {self.size / 1024:.0f}KiB; " + (
+            "no lookups yet"
+            if self.hit_rate is None
+            else f"{self.hits} of {self.hits + self.misses} lookups hit "
+            f"({self.hit_rate:.0%})"
+        )
+
+
+### response_cache.py ends here
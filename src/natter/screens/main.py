@@ -2,29 +2,67 @@
 
 ##############################################################################
 # Python imports.
-from json import dumps, loads
-from typing import Any, Coroutine, Final
+from asyncio import CancelledError, gather, to_thread
+from collections.abc import Sequence
+from contextlib import suppress
+from importlib.util import find_spec
+from json import loads
+from pathlib import Path
+from time import monotonic
+from typing import TYPE_CHECKING, Final, cast
 
 ##############################################################################
 # httpx imports.
-from httpx import ConnectError
+from httpx import TransportError
 
 ##############################################################################
 # Ollama imports.
-from ollama import AsyncClient, ResponseError
+from ollama import ResponseError
 
 ##############################################################################
 # Textual imports.
 from textual import on, work
 from textual.app import ComposeResult
+from textual.markup import escape
 from textual.reactive import var
 from textual.screen import Screen
+from textual.worker import Worker, WorkerCancelled, WorkerFailed
 
 ##############################################################################
 # Local imports.
-from ..data import ConversationData, conversations_dir
-from ..widgets import Conversation, User, UserInput
+from ..backend import (
+    CONNECTION_ERRORS,
+    ROUTING_STRATEGIES,
+    ChatStream,
+    ClientPool,
+    HostPool,
+    RoutingStrategy,
+    embed,
+)
+from ..data import (
+    ChatMessage,
+    ConversationData,
+    ConversationJournal,
+    ConversationLibrary,
+    EventLoopLag,
+    GenerationStats,
+    InteractionMetrics,
+    ResponseCache,
+    SearchHit,
+    cache_dir,
+    conversations_dir,
+    library_file,
+    load_configuration,
+    ongoing_journal,
+    recall_dir,
+    update_configuration,
+)
+from ..widgets import ComparisonColumn, Conversation, StatusBar, User, UserInput
 from .save_conversation import SaveConversation
+from .search_results import SearchResults
+
+if TYPE_CHECKING:
+    from ..data.recall_index import RecallIndex, Recollection
 
 
 ##############################################################################
@@ -50,10 +88,19 @@ class Main(Screen[None]):
     """The prefix for commands."""
 
     _CONVERSATION_FILE: Final[str] = "conversation.json"
-    """The name of the file to store the ongoing conversation in."""
+    """The name of the file the ongoing conversation used to be stored in."""
+
+    _RECENT_MESSAGES: Final[int] = 20
+    """The number of recent messages to load before the screen is shown."""
+
+    _LIST_LENGTH: Final[int] = 20
+    """The number of conversations in the library to list."""
+
+    _RECALL_LENGTH: Final[int] = 5
+    """The number of messages to show when recalling."""
 
-    _client: var[AsyncClient | None] = var(None)
-    """The Ollama client."""
+    _PREVIEW_LENGTH: Final[int] = 80
+    """The most characters of a message to show when previewing it."""
 
     _conversation: var[ConversationData] = var(ConversationData("Untitled", "llama3"))
     """The ongoing conversation."""
@@ -61,16 +108,309 @@ class Main(Screen[None]):
     def __init__(self) -> None:
         """Initialise the main screen."""
         super().__init__()
-        if (source := conversations_dir() / self._CONVERSATION_FILE).exists():
+        configuration = load_configuration()
+        self._clients = ClientPool(
+            max_clients=configuration.max_clients,
+            max_connections=configuration.max_connections,
+            max_keepalive_connections=configuration.max_keepalive_connections,
+            keepalive_expiry=configuration.keepalive_expiry,
+            http2=configuration.http2,
+        )
+        """The pool of clients for talking to Ollama hosts."""
+        self._cache = ResponseCache(
+            cache_dir(),
+            configuration.response_cache_size,
+            configuration.response_cache_ttl,
+        )
+        """The cache of replies from models."""
+        self._library = ConversationLibrary(library_file())
+        """The library of stored conversations."""
+        self._journal = ConversationJournal(ongoing_journal())
+        if self._journal.exists():
+            # Only the end of the conversation is loaded to start with; the
+            # rest is loaded in the background once the screen is up.
+            self._conversation = self._journal.load_tail(self._RECENT_MESSAGES)
+        elif (source := conversations_dir() / self._CONVERSATION_FILE).exists():
             self._conversation = ConversationData.from_json(loads(source.read_text()))
+            self._journal.snapshot(self._conversation)
+        self._hosts = self._host_pool()
+        """The pool of hosts to talk to."""
+        self._metrics: InteractionMetrics | None = None
+        """The metrics for the latest interaction."""
+        self._interaction: Worker[None] | None = None
+        """The worker for the current interaction, if there is one."""
+        self._queue: list[str] = []
+        """Input from the user that is waiting to be sent."""
+        self._history_loader: Worker[None] | None = None
+        """The worker loading the older history of the conversation."""
+        self._comparison: list[tuple[ConversationData, HostPool]] = []
+        """The conversations being compared, and the hosts for each, if comparing."""
+        self._editing: User | None = None
+        """The widget showing earlier input that the user is editing, if any."""
+
+    def _host_pool(self, host: str | None = None) -> HostPool:
+        """Create a pool of hosts.
+
+        Args:
+            host: The host, or space-separated hosts, to pool; the hosts of
+                the current conversation if not given.
+
+        Returns:
+            The pool of hosts.
+        """
+        strategy = load_configuration().routing
+        return HostPool(
+            (self._conversation.host if host is None else host).split(),
+            cast(RoutingStrategy, strategy)
+            if strategy in ROUTING_STRATEGIES
+            else "round-robin",
+        )
 
     def compose(self) -> ComposeResult:
         yield Conversation(self._conversation)
         yield UserInput()
+        status_bar = StatusBar()
+        status_bar.display = load_configuration().show_status_bar
+        yield status_bar
 
     async def on_mount(self) -> None:
         """Settle the UI on startup."""
         self.query_one(Conversation).scroll_end(animate=False)
+        if self._journal.loading:
+            self._history_loader = self._load_history()
+        self._warm_up()
+        self.set_interval(
+            load_configuration().health_check_interval, self._check_health
+        )
+
+    async def on_unmount(self) -> None:
+        """Tidy up when the screen is going away."""
+        await self._clients.close()
+
+    @work
+    async def _load_history(self) -> None:
+        """Load the older history of the conversation."""
+        self.query_one(Conversation).add_history(
+            await to_thread(self._journal.load_head, self._conversation)
+        )
+
+    async def _history_loaded(self) -> None:
+        """Wait for the whole of the history of the conversation to be loaded."""
+        if self._history_loader is not None:
+            await self._history_loader.wait()
+
+    _WARM_UP_GROUP: Final[str] = "--natter-warm-up"
+    """The name of the worker group for warming up the model."""
+
+    @work(exclusive=True, group=_WARM_UP_GROUP)
+    async def _warm_up(self) -> None:
+        """Get the servers to load the model so it is ready for use.
+
+        Note:
+            Warming up is only done to save time later, so a failure is
+            just logged; if a server can't be used, that will be reported
+            when it's actually asked for a reply.
+        """
+        model = self._conversation.model
+        for host in self._hosts.hosts:
+            try:
+                await (await self._clients.client(host)).generate(
+                    model, keep_alive=load_configuration().model_keep_alive
+                )
+            except (ResponseError, TransportError, *CONNECTION_ERRORS) as error:
+                self.log.warning(
+                    f"Unable to load {model} on {host or 'the default host'}: {error}"
+                )
+            else:
+                self.notify(
+                    f"{model} is ready on {host or 'the default host'}",
+                    title="Warmed up",
+                )
+
+    _RECALL_GROUP: Final[str] = "--natter-recall"
+    """The name of the worker group for remembering messages."""
+
+    def _recall_available(self, complain: bool = False) -> bool:
+        """Is recall available?
+
+        Args:
+            complain: Should the user be told if it isn't?
+
+        Returns:
+            `True` if recall can be used, `False` if not.
+
+        Note:
+            Recall needs NumPy, which is an optional dependency.
+        """
+        if find_spec("numpy") is None:
+            if complain:
+                self.notify(
+                    "Recall needs NumPy; install Natter with the recall extra",
+                    title="Recall unavailable",
+                    severity="error",
+                )
+            return False
+        return True
+
+    @staticmethod
+    def _recall_index() -> "RecallIndex":
+        """Get the recall index for the configured embedding model.
+
+        Returns:
+            The index.
+        """
+        # NumPy is optional, so the index is only imported once it's needed.
+        from ..data.recall_index import RecallIndex
+
+        return RecallIndex(recall_dir(load_configuration().recall_model))
+
+    async def _embed(self, texts: list[str]) -> list[Sequence[float]]:
+        """Embed some text with the configured embedding model.
+
+        Args:
+            texts: The pieces of text to embed.
+
+        Returns:
+            The embedding of each piece of text.
+        """
+        configuration = load_configuration()
+        return await embed(
+            self._hosts,
+            self._clients,
+            configuration.recall_model,
+            texts,
+            configuration.model_keep_alive,
+        )
+
+    @work(group=_RECALL_GROUP)
+    async def _remember(
+        self,
+        conversation: ConversationData,
+        messages: list[ChatMessage],
+    ) -> None:
+        """Embed messages, so that they can be recalled later.
+
+        Args:
+            conversation: The conversation the messages are from.
+            messages: The messages to remember.
+        """
+        if not (messages := [message for message in messages if message.content]):
+            return
+        try:
+            embeddings = await self._embed([message.content for message in messages])
+        except (ResponseError, *CONNECTION_ERRORS) as error:
+            self.notify(str(error), title="Unable to remember", severity="warning")
+            return
+        self._recall_index().add(
+            embeddings,
+            [
+                {
+                    "title": conversation.title,
+                    "library_id": conversation.library_id,
+                    "role": message.role,
+                    "content": message.content,
+                }
+                for message in messages
+            ],
+        )
+
+    async def _recollect(self, query: str, limit: int) -> "list[Recollection]":
+        """Recall the messages most like a query.
+
+        Args:
+            query: The query.
+            limit: The most messages to recall.
+
+        Returns:
+            The messages recalled, most similar first.
+        """
+        (embedding,) = await self._embed([query])
+        return await to_thread(self._recall_index().search, embedding, limit)
+
+    @work
+    async def _recall(self, query: str) -> None:
+        """Show the remembered messages most like a query.
+
+        Args:
+            query: The query.
+        """
+        if not self._recall_available(complain=True):
+            return
+        try:
+            recollections = await self._recollect(query, self._RECALL_LENGTH)
+        except (ResponseError, *CONNECTION_ERRORS) as error:
+            self.notify(str(error), title="Unable to recall", severity="error")
+            return
+        if not recollections:
+            self.notify("Nothing has been remembered yet")
+            return
+        self.notify(
+            "\n".join(
+                escape(
+                    f"{recollection.score:.2f} {recollection.title}"
+                    + (
+                        ""
+                        if recollection.library_id is None
+                        else f" ({recollection.library_id})"
+                    )
+                    + f", {recollection.role}: "
+                    + " ".join(recollection.content.split())[: self._PREVIEW_LENGTH]
+                )
+                for recollection in recollections
+            ),
+            title=f"Recalling {escape(query)}",
+            timeout=10,
+        )
+
+    async def _recalled_context(self, text: str) -> str:
+        """Get remembered messages to add to the context of a request.
+
+        Args:
+            text: The text from the user the request is for.
+
+        Returns:
+            The remembered messages most like the text, ready to add to the
+            context, or an empty string if there are none.
+
+        Note:
+            Messages that are already in the current conversation aren't
+            recalled, as the model may see them anyway.
+        """
+        configuration = load_configuration()
+        if not (
+            configuration.recall
+            and configuration.recall_context > 0
+            and self._recall_available()
+        ):
+            return ""
+        try:
+            recollections = await self._recollect(
+                text, configuration.recall_context * 2
+            )
+        except (ResponseError, *CONNECTION_ERRORS) as error:
+            self.notify(str(error), title="Unable to recall", severity="warning")
+            return ""
+        seen = {message.content for message in self._conversation}
+        if not (
+            recalled := [
+                f"{recollection.role}: {recollection.content}"
+                for recollection in recollections
+                if recollection.content not in seen
+            ][: configuration.recall_context]
+        ):
+            return ""
+        return "Messages from earlier conversations that may be relevant:\n\n" + (
+            "\n\n".join(recalled)
+        )
+
+    _HEALTH_CHECK_GROUP: Final[str] = "--natter-health-check"
+    """The name of the worker group for checking the health of the hosts."""
+
+    @work(exclusive=True, group=_HEALTH_CHECK_GROUP)
+    async def _check_health(self) -> None:
+        """Check the health of the hosts, if there's a choice of hosts."""
+        if len(self._hosts.hosts) > 1:
+            await self._hosts.check_health(self._clients)
 
     @on(UserInput.Submitted)
     async def handle_input(self, event: UserInput.Submitted) -> None:
@@ -82,38 +422,505 @@ class Main(Screen[None]):
         if event.value:
             self.query_one(UserInput).text = ""
             if event.value.startswith(self._COMMAND_PREFIX):
+                self._editing = None
                 await self.process_command(event.value[1:].lower().strip())
             else:
-                self.process_input(event.value)
+                if (editing := self._editing) is not None:
+                    self._editing = None
+                    await self._fork(editing)
+                await self._submit(event.value)
+
+    @property
+    def _interacting(self) -> bool:
+        """Is there an interaction with the model under way?"""
+        return self._interaction is not None and not self._interaction.is_finished
+
+    async def _submit(self, text: str) -> None:
+        """Submit input from the user to be sent to the model.
+
+        Args:
+            text: The input to submit.
+
+        Note:
+            If there's already an interaction under way, the input is
+            queued and sent once every interaction ahead of it is done.
+        """
+        if self._interacting or self._queue:
+            self._queue.append(text)
+            await self.query_one(Conversation).queue(text)
+        else:
+            self._interaction = self._send(text)
+
+    def _send(self, text: str, queued: bool = False) -> Worker[None]:
+        """Send input from the user.
+
+        Args:
+            text: The input to send.
+            queued: Was the input queued while another interaction was under way?
+
+        Returns:
+            The worker that is doing the interaction.
+        """
+        if self._comparison:
+            return self._compare(text, queued)
+        return self.process_input(text, queued)
+
+    def on_worker_state_changed(self, event: Worker.StateChanged) -> None:
+        """Send the next queued input once an interaction is done.
+
+        Args:
+            event: The event to handle.
+        """
+        if (
+            event.worker is self._interaction
+            and event.worker.is_finished
+            and self._queue
+        ):
+            self._interaction = self._send(self._queue.pop(0), queued=True)
+
+    async def _clear_queue(self) -> None:
+        """Clear any input that is waiting to be sent."""
+        self._queue.clear()
+        await self.query_one(Conversation).clear_queue()
 
     def _save_conversation(self) -> None:
         """Save the current conversation."""
-        (conversations_dir() / self._CONVERSATION_FILE).write_text(
-            dumps(self._conversation.json, indent=4)
+        self._journal.save(self._conversation)
+
+    async def _stop_interacting(self) -> None:
+        """Stop any interaction with the model, and wait for it to stop."""
+        await self._clear_queue()
+        if (interaction := self._interaction) is not None and (
+            not interaction.is_finished
+        ):
+            self.stop_interaction()
+            with suppress(WorkerCancelled, WorkerFailed):
+                await interaction.wait()
+
+    async def _store_conversation(self) -> None:
+        """Keep the current conversation in the library, if it has anything in it."""
+        await self._history_loaded()
+        if self._conversation.history:
+            self._library.store(self._conversation)
+            self._save_conversation()
+
+    async def _switch_to(
+        self,
+        conversation: ConversationData,
+        keep_current: bool = True,
+        position: int | None = None,
+    ) -> None:
+        """Switch to another conversation.
+
+        Args:
+            conversation: The conversation to switch to.
+            keep_current: Should the current conversation be kept in the library?
+            position: The position of the message to show, if not the end.
+        """
+        await self._history_loaded()
+        await self._stop_comparing()
+        if keep_current:
+            await self._store_conversation()
+        hosts_changed = conversation.host != self._conversation.host
+        self._conversation = conversation
+        self._journal.snapshot(conversation)
+        if hosts_changed:
+            self._hosts = self._host_pool()
+        await self.query_one(Conversation).show(conversation, position)
+
+    @staticmethod
+    def _branch_label(branch: ConversationData) -> str:
+        """Get the label for a conversation that is being compared.
+
+        Args:
+            branch: The conversation.
+
+        Returns:
+            The label, which is its model, and its host if it has one.
+        """
+        return f"{branch.model}@{branch.host}" if branch.host else branch.model
+
+    async def _start_comparing(self, targets: list[str]) -> None:
+        """Start comparing models.
+
+        Args:
+            targets: The models to compare, each optionally with `@<host>`.
+
+        Note:
+            Each model gets a conversation of its own, which starts with
+            the history of the current conversation.
+        """
+        if len(targets) < 2:
+            self.notify(
+                "Give at least two models to compare",
+                title="Nothing to compare",
+                severity="error",
+            )
+            return
+        await self._history_loaded()
+        await self._stop_comparing()
+        history = list(self._conversation)
+        for target in targets:
+            model, _, host = target.partition("@")
+            branch = ConversationData(
+                f"{self._conversation.title} ({target})",
+                model,
+                [message.copy() for message in history],
+                host or self._conversation.host,
+            )
+            self._comparison.append((branch, self._host_pool(branch.host)))
+        self.notify(
+            escape(
+                ", ".join(self._branch_label(branch) for branch, _ in self._comparison)
+            ),
+            title="Comparing models",
         )
 
+    async def _stop_comparing(self) -> list[ConversationData]:
+        """Stop comparing models.
+
+        Returns:
+            The conversations that were being compared.
+        """
+        await self._stop_interacting()
+        comparison, self._comparison = self._comparison, []
+        return [branch for branch, _ in comparison]
+
+    def _identity(self, identity: str, kind: str = "conversation") -> int | None:
+        """Get an ID from the user's input.
+
+        Args:
+            identity: The ID the user gave.
+            kind: The kind of thing the ID is for.
+
+        Returns:
+            The ID, or `None` if it isn't a valid ID.
+        """
+        try:
+            return int(identity)
+        except ValueError:
+            self.notify(
+                f"'[dim]{escape(identity)}[/]' is not a valid {kind} ID",
+                title="Invalid ID",
+                severity="error",
+            )
+            return None
+
+    async def _list_conversations(self) -> None:
+        """Show the most recent conversations in the library."""
+        await self._store_conversation()
+        if not (entries := self._library.entries()):
+            self.notify("There are no conversations in the library")
+            return
+        listed = "\n".join(
+            f"[b]{escape(str(entry))}[/]"
+            if entry.id == self._conversation.library_id
+            else escape(str(entry))
+            for entry in entries[: self._LIST_LENGTH]
+        )
+        if len(entries) > self._LIST_LENGTH:
+            listed += f"\n...and {len(entries) - self._LIST_LENGTH} more"
+        self.notify(
+            listed,
+            title=f"{len(entries)} conversation{'' if len(entries) == 1 else 's'}",
+            timeout=10,
+        )
+
+    async def _open_conversation(
+        self, library_id: int, position: int | None = None
+    ) -> None:
+        """Open a conversation from the library.
+
+        Args:
+            library_id: The ID of the conversation to open.
+            position: The position of the message to show, if not the end.
+        """
+        if library_id == self._conversation.library_id:
+            if position is None:
+                self.notify(f"Conversation {library_id} is already open")
+            else:
+                await self.query_one(Conversation).go_to(position)
+            return
+        if (conversation := self._library.load(library_id)) is None:
+            self.notify(
+                f"There is no conversation {library_id} in the library",
+                title="Unknown conversation",
+                severity="error",
+            )
+            return
+        warm_up = (conversation.model, conversation.host) != (
+            self._conversation.model,
+            self._conversation.host,
+        )
+        await self._switch_to(conversation, position=position)
+        self.notify(
+            f"Opened conversation {library_id}, with {conversation.model}",
+            title=escape(conversation.title),
+        )
+        if warm_up:
+            self._warm_up()
+
+    async def _delete_conversation(self, library_id: str) -> None:
+        """Delete a conversation from the library.
+
+        Args:
+            library_id: The ID of the conversation to delete.
+
+        Note:
+            If the conversation being deleted is the current conversation, a
+            new conversation is started.
+        """
+        if (identity := self._identity(library_id)) is None:
+            return
+        if not self._library.delete(identity):
+            self.notify(
+                f"There is no conversation {identity} in the library",
+                title="Unknown conversation",
+                severity="error",
+            )
+            return
+        if identity == self._conversation.library_id:
+            await self._switch_to(
+                ConversationData("Untitled", "llama3", host=self._conversation.host),
+                keep_current=False,
+            )
+        self.notify(f"Conversation {identity} deleted")
+
+    async def _fork(self, user: User) -> None:
+        """Start a new branch of the conversation, from earlier input.
+
+        Args:
+            user: The widget showing the input to branch from.
+
+        Note:
+            The input is left on the branch that was being followed; the
+            new branch carries on from just before it.
+        """
+        await self._history_loaded()
+        if (position := self.query_one(Conversation).position_of(user)) is None:
+            return
+        await self._stop_interacting()
+        previous = self._conversation.branch
+        self._conversation.fork(position)
+        if self._conversation.branch == previous:
+            return
+        self._save_conversation()
+        await self.query_one(Conversation).diverge(self._conversation, position)
+        self.notify(
+            f"Started branch {self._conversation.branch} from message "
+            f"{position + 1}; use /branch {previous} to go back",
+            title="Branched",
+        )
+
+    def _list_branches(self) -> None:
+        """Show the branches of the current conversation."""
+        conversation = self._conversation
+        if not conversation.branches:
+            self.notify("This conversation has no other branches")
+            return
+        listed = [f"[b]{conversation.branch}: {len(conversation.history)} messages[/]"]
+        for identity, branch in sorted(conversation.branches.items()):
+            preview = " ".join(
+                branch.messages[0].content.split() if branch.messages else []
+            )
+            listed.append(
+                f"{identity}: from message {branch.fork + 1}, "
+                f"{escape(preview[: self._PREVIEW_LENGTH])}"
+            )
+        self.notify(
+            "\n".join(listed),
+            title=f"{len(listed)} branches of {escape(conversation.title)}",
+            timeout=10,
+        )
+
+    async def _switch_branch(self, branch: str) -> None:
+        """Switch to following another branch of the current conversation.
+
+        Args:
+            branch: The ID of the branch to switch to.
+        """
+        if (identity := self._identity(branch, "branch")) is None:
+            return
+        await self._history_loaded()
+        if identity == self._conversation.branch:
+            self.notify(f"Already following branch {identity}")
+            return
+        if identity not in self._conversation.branches:
+            self.notify(
+                f"There is no branch {identity} in this conversation",
+                title="Unknown branch",
+                severity="error",
+            )
+            return
+        await self._stop_interacting()
+        position = self._conversation.switch(identity)
+        self._save_conversation()
+        await self.query_one(Conversation).diverge(self._conversation, position)
+        self.notify(f"Now following branch {identity}")
+
+    @work
+    async def _search(self, terms: list[str]) -> None:
+        """Search the library, and go to the result the user picks.
+
+        Args:
+            terms: The terms to search for.
+        """
+        await self._store_conversation()
+        if not (hits := self._library.search(terms)):
+            self.notify(
+                f"Nothing in the library mentions '[dim]{escape(' '.join(terms))}[/]'"
+            )
+            return
+        hit: SearchHit | None = await self.app.push_screen_wait(
+            SearchResults(terms, hits)
+        )
+        if hit is not None:
+            await self._open_conversation(hit.conversation.id, hit.position)
+
     async def process_command(self, command: str) -> None:
         """Process a command."""
         match command.split():
             case ["new"]:
-                self.stop_interaction()
-                self._conversation = ConversationData(
-                    "Untitled", "llama3", host=self._conversation.host
+                await self._switch_to(
+                    ConversationData("Untitled", "llama3", host=self._conversation.host)
                 )
-                self._save_conversation()
-                await self.query_one(Conversation).remove_children()
-                self.notify("Conversation cleared")
+                self.notify("Started a new conversation")
+            case ["list"]:
+                await self._list_conversations()
+            case ["open", library_id]:
+                if (identity := self._identity(library_id)) is not None:
+                    await self._open_conversation(identity)
+            case ["search", *terms] if terms:
+                self._search(terms)
+            case ["branches"]:
+                self._list_branches()
+            case ["branch", branch]:
+                await self._switch_branch(branch)
+            case ["delete", library_id]:
+                await self._delete_conversation(library_id)
             case ["save"]:
                 self._save_conversation_text()
             case ["host"]:
-                if self._conversation.host:
-                    self.notify(f"Currently connected to {self._conversation.host}")
+                self.notify(
+                    "\n".join(
+                        f"{state}; {self._clients.statistics(state.host)}"
+                        for state in self._hosts.states
+                    ),
+                    title=f"Currently using {self._hosts.strategy} routing",
+                )
+            case ["host", *hosts]:
+                self._conversation.host = " ".join(hosts)
+                self._hosts = self._host_pool()
+                self.notify(
+                    f"Host set to {self._conversation.host}"
+                    if len(hosts) == 1
+                    else f"Hosts set to {', '.join(hosts)}"
+                )
+                self._warm_up()
+            case ["routing"]:
+                self.notify(
+                    f"Currently using {self._hosts.strategy} routing; "
+                    f"available strategies are {', '.join(ROUTING_STRATEGIES)}"
+                )
+            case ["routing", strategy] if strategy in ROUTING_STRATEGIES:
+                with update_configuration() as configuration:
+                    configuration.routing = strategy
+                self._hosts.strategy = cast(RoutingStrategy, strategy)
+                self.notify(f"Now using {strategy} routing")
+            case ["context"]:
+                await self._show_context()
+            case ["context", budget]:
+                self._set_context_budget(budget)
+            case ["keepalive"]:
+                self.notify(
+                    f"Models are kept loaded for {load_configuration().keep_alive}"
+                )
+            case ["keepalive", keep_alive]:
+                with update_configuration() as configuration:
+                    configuration.keep_alive = keep_alive
+                self.notify(f"Models will be kept loaded for {keep_alive}")
+                self._warm_up()
+            case ["stats"]:
+                if self._metrics is None:
+                    self.notify("There have been no interactions yet")
+                else:
+                    self.notify(
+                        str(self._metrics), title=f"Stats for {self._metrics.model}"
+                    )
+            case ["cache"]:
+                self.notify(
+                    str(self._cache),
+                    title="Reply cache is "
+                    + ("on" if load_configuration().response_cache else "off"),
+                )
+            case ["cache", "clear"]:
+                self._cache.clear()
+                self.notify("Reply cache cleared")
+            case ["cache", ("on" | "off") as state]:
+                with update_configuration() as configuration:
+                    configuration.response_cache = state == "on"
+                self.notify(f"Reply cache turned {state}")
+            case ["stop" | "cancel"]:
+                self._stop_reply()
+            case ["queue"]:
+                self.notify(
+                    f"{len(self._queue)} prompt{'' if len(self._queue) == 1 else 's'} "
+                    "waiting to be sent"
+                    if self._queue
+                    else "Nothing is waiting to be sent"
+                )
+            case ["queue", "clear"]:
+                await self._clear_queue()
+                self.notify("Queue cleared")
+            case ["statusbar"]:
+                with update_configuration() as configuration:
+                    configuration.show_status_bar = not configuration.show_status_bar
+                self.query_one(StatusBar).display = configuration.show_status_bar
+            case ["recall"]:
+                configuration = load_configuration()
+                self.notify(
+                    f"Recall is {'on' if configuration.recall else 'off'}, using "
+                    f"{configuration.recall_model}"
+                    + (
+                        f"; {len(self._recall_index())} messages remembered"
+                        if self._recall_available()
+                        else "; it needs NumPy to be installed"
+                    )
+                )
+            case ["recall", ("on" | "off") as state]:
+                if state == "off" or self._recall_available(complain=True):
+                    with update_configuration() as configuration:
+                        configuration.recall = state == "on"
+                    self.notify(f"Recall turned {state}")
+            case ["recall", *query]:
+                self._recall(" ".join(query))
+            case ["compare"]:
+                self.notify(
+                    "Comparing "
+                    + escape(
+                        ", ".join(
+                            self._branch_label(branch) for branch, _ in self._comparison
+                        )
+                    )
+                    if self._comparison
+                    else "Not comparing models; use /compare <model>[@<host>] ..."
+                )
+            case ["compare", "off"]:
+                if not self._comparison:
+                    self.notify("Not comparing models")
+                elif stored := [
+                    str(branch.library_id)
+                    for branch in await self._stop_comparing()
+                    if branch.library_id is not None
+                ]:
+                    self.notify(
+                        f"The replies are kept in conversations {', '.join(stored)}",
+                        title="Stopped comparing models",
+                    )
                 else:
-                    self.notify("Currently connected to the default host")
-            case ["host", host]:
-                self._conversation.host = host
-                self._client = None
-                self.notify(f"Host set to {host}")
+                    self.notify("Stopped comparing models")
+            case ["compare", *targets]:
+                await self._start_comparing(targets)
             case ["quit"]:
                 self.app.exit()
             case _:
@@ -123,32 +930,266 @@ class Main(Screen[None]):
                     severity="error",
                 )
 
+    def _chat_context(self, recalled: str = "") -> list[ChatMessage]:
+        """Get the context to send to the model.
+
+        Args:
+            recalled: Remembered messages to add to the system prompt.
+
+        Returns:
+            The messages from the conversation that fit the context budget.
+        """
+        configuration = load_configuration()
+        return self._conversation.context(
+            configuration.context_budget(self._conversation.model),
+            "\n\n".join(
+                prompt for prompt in (configuration.system_prompt, recalled) if prompt
+            ),
+        )
+
+    async def _show_context(self) -> None:
+        """Show details of the context that will be sent to the model."""
+        # The budget can only be worked out against the whole history.
+        await self._history_loaded()
+        context = self._chat_context()
+        history = [message for message in context if message.role != "system"]
+        budget = load_configuration().context_budget(self._conversation.model)
+        tokens = sum(ConversationData.estimate_tokens(message) for message in context)
+        self.notify(
+            f"Sending {len(history)} of {len(list(self._conversation))} messages, "
+            f"about {tokens} of a budget of {budget} tokens"
+            + (", with a system prompt" if len(history) < len(context) else ""),
+            title=f"Context for {self._conversation.model}",
+        )
+
+    def _set_context_budget(self, budget: str) -> None:
+        """Set the context budget for the current model.
+
+        Args:
+            budget: The budget to set.
+        """
+        try:
+            tokens = int(budget)
+        except ValueError:
+            tokens = 0
+        if tokens <= 0:
+            self.notify(
+                f"'[dim]{budget}[/]' is not a valid number of tokens",
+                title="Invalid budget",
+                severity="error",
+            )
+            return
+        with update_configuration() as configuration:
+            configuration.context_budgets[self._conversation.model] = tokens
+        self.notify(
+            f"Context budget for {self._conversation.model} set to {tokens} tokens"
+        )
+
     _INTERACTION_GROUP: Final[str] = "--natter-interaction"
     """The name of the worker group for doing interaction with Ollama."""
 
     @work(exclusive=True, group=_INTERACTION_GROUP)
-    async def process_input(self, text: str) -> None:
+    async def process_input(self, text: str, queued: bool = False) -> None:
         """Process the input from the user.
 
         Args:
             text: The text to process.
+            queued: Was the input queued while another interaction was under way?
         """
-        if self._client is None:
-            self._client = AsyncClient(self._conversation.host)
-        self._conversation.record({"role": "user", "content": text})
-        chat: Coroutine[Any, Any, Any] = self._client.chat(
-            model=self._conversation.model,
-            messages=list(self._conversation),
-            stream=True,
+        await self._history_loaded()
+        conversation = self._conversation.record({"role": "user", "content": text})
+        first = len(conversation.history) - 1
+        self._metrics = metrics = InteractionMetrics(self._conversation.model)
+        status_bar = self.query_one(StatusBar)
+        started = monotonic()
+
+        def show_metrics() -> None:
+            metrics.duration = monotonic() - started
+            status_bar.show_metrics(metrics)
+
+        live_metrics = self.set_interval(0.25, show_metrics)
+        try:
+            with EventLoopLag(metrics):
+                await self._interact(text, metrics, queued)
+        finally:
+            live_metrics.stop()
+            show_metrics()
+        if load_configuration().recall and self._recall_available():
+            self._remember(conversation, list(conversation)[first:])
+        if log := load_configuration().metrics_log:
+            metrics.append_to(Path(log))
+
+    @work(exclusive=True, group=_INTERACTION_GROUP)
+    async def _compare(self, text: str, queued: bool = False) -> None:
+        """Send input from the user to all of the models being compared.
+
+        Args:
+            text: The text to send.
+            queued: Was the input queued while another interaction was under way?
+        """
+        comparison = self._comparison
+        columns = await self.query_one(Conversation).compare(
+            text, [self._branch_label(branch) for branch, _ in comparison], queued
         )
-        async with self.query_one(Conversation).interaction(text) as interaction:
+        metrics = [InteractionMetrics(branch.model) for branch, _ in comparison]
+
+        def show_metrics() -> None:
+            for column, branch_metrics in zip(columns, metrics):
+                column.show_metrics(branch_metrics)
+
+        live_metrics = self.set_interval(0.25, show_metrics)
+        try:
+            await gather(
+                *(
+                    self._compare_with(branch, hosts, text, column, branch_metrics)
+                    for (branch, hosts), column, branch_metrics in zip(
+                        comparison, columns, metrics
+                    )
+                )
+            )
+        finally:
+            live_metrics.stop()
+            show_metrics()
+        if log := load_configuration().metrics_log:
+            for branch_metrics in metrics:
+                branch_metrics.append_to(Path(log))
+
+    async def _compare_with(
+        self,
+        branch: ConversationData,
+        hosts: HostPool,
+        text: str,
+        column: ComparisonColumn,
+        metrics: InteractionMetrics,
+    ) -> None:
+        """Send input from the user to one of the models being compared.
+
+        Args:
+            branch: The conversation with the model.
+            hosts: The pool of hosts for the model.
+            text: The text to send.
+            column: The column to show the reply in.
+            metrics: The metrics to record for the reply.
+
+        Note:
+            Once the reply is done with, even if it was stopped, the
+            conversation is stored in the library.
+        """
+        configuration = load_configuration()
+        branch.record({"role": "user", "content": text})
+        started = monotonic()
+        async with column.reply() as reply:
+            metrics.renders = reply.renders
             try:
-                async for part in await chat:
-                    if part["message"]["content"]:
-                        await interaction.update_response(part["message"]["content"])
-                        self._conversation.record(part["message"])
-            except (ResponseError, ConnectError) as error:
+                async with ChatStream(
+                    hosts,
+                    self._clients,
+                    model=branch.model,
+                    messages=branch.context(
+                        configuration.context_budget(branch.model),
+                        configuration.system_prompt,
+                    ),
+                    keep_alive=configuration.model_keep_alive,
+                ) as chat:
+                    metrics.host = chat.host or ""
+                    metrics.time_to_first_token = chat.time_to_first_token
+                    metrics.connect_time = chat.connect_time
+                    async for part in chat:
+                        if part["message"]["content"]:
+                            metrics.parts += 1
+                            reply.update_response(part["message"]["content"])
+                            branch.record(part["message"])
+                        if part["done"]:
+                            metrics.record_final(part)
+                            branch.record_stats(GenerationStats.from_metrics(metrics))
+                        metrics.duration = monotonic() - started
+            except (ResponseError, TransportError, *CONNECTION_ERRORS) as error:
+                await reply.abandon(str(error))
+                branch.interrupt()
+            except CancelledError:
+                reply.interrupt()
+                branch.interrupt()
+                raise
+            finally:
+                self._library.store(branch)
+
+    async def _interact(
+        self, text: str, metrics: InteractionMetrics, queued: bool
+    ) -> None:
+        """Carry out an interaction with the model.
+
+        Args:
+            text: The text from the user that started the interaction.
+            metrics: The metrics to record for the interaction.
+            queued: Was the input queued while another interaction was under way?
+        """
+        conversation = self._conversation
+        async with self.query_one(Conversation).interaction(
+            text, queued
+        ) as interaction:
+            metrics.renders = interaction.renders
+            reply_parts: list[str] = []
+            try:
+                # Recalling earlier messages can take a while, so it's done
+                # in here, where stopping the reply is looked after.
+                messages = self._chat_context(await self._recalled_context(text))
+                cache_key = (
+                    ResponseCache.key(
+                        self._conversation.model, self._conversation.host, messages
+                    )
+                    if load_configuration().response_cache
+                    else None
+                )
+                if cache_key is not None and (reply := self._cache.get(cache_key)):
+                    # We've been asked exactly this before, so replay the
+                    # reply we got last time rather than have the model
+                    # generate it again.
+                    metrics.host = "cache"
+                    metrics.time_to_first_token = 0.0
+                    metrics.parts += 1
+                    interaction.update_response(reply)
+                    self._conversation.record({"role": "assistant", "content": reply})
+                    self._save_conversation()
+                    return
+                async with ChatStream(
+                    self._hosts,
+                    self._clients,
+                    model=self._conversation.model,
+                    messages=messages,
+                    keep_alive=load_configuration().model_keep_alive,
+                ) as chat:
+                    metrics.host = chat.host or ""
+                    metrics.time_to_first_token = chat.time_to_first_token
+                    metrics.connect_time = chat.connect_time
+                    async for part in chat:
+                        if part["message"]["content"]:
+                            metrics.parts += 1
+                            reply_parts.append(part["message"]["content"])
+                            interaction.update_response(part["message"]["content"])
+                            self._conversation.record(part["message"])
+                        if part["done"]:
+                            metrics.record_final(part)
+                            self._conversation.record_stats(
+                                GenerationStats.from_metrics(metrics)
+                            )
+                            if cache_key is not None:
+                                self._cache.put(cache_key, "".join(reply_parts))
+            except (ResponseError, TransportError, *CONNECTION_ERRORS) as error:
+                # Keep what we did get, as if the reply had been stopped, so
+                # that the history still has a reply for the input.
                 await interaction.abandon(str(error))
+                if conversation is self._conversation:
+                    conversation.interrupt()
+                    self._save_conversation()
+            except CancelledError:
+                # By now any stream has been closed, which lets the host
+                # stop generating the reply; keep what we did get, noting
+                # that it was cut short.
+                interaction.interrupt()
+                if conversation is self._conversation:
+                    conversation.interrupt()
+                    self._save_conversation()
+                raise
             else:
                 self._save_conversation()
 
@@ -156,6 +1197,14 @@ class Main(Screen[None]):
         """Stop any ongoing interaction."""
         self.workers.cancel_group(self, self._INTERACTION_GROUP)
 
+    def _stop_reply(self) -> None:
+        """Stop the reply that is being streamed, keeping what there is of it."""
+        if self._interacting:
+            self.stop_interaction()
+            self.notify("Reply stopped")
+        else:
+            self.notify("There is no reply to stop")
+
     @on(User.Edit)
     def edit_input(self, event: User.Edit) -> None:
         """Make user input available for editing.
@@ -164,10 +1213,24 @@ class Main(Screen[None]):
             event: The event to handle.
         """
         self.query_one(Conversation).scroll_end(animate=False)
+        # Sending edited input from earlier in the conversation branches the
+        # conversation; models being compared each have a history of their
+        # own, so there's nothing to branch while comparing.
+        self._editing = None if self._comparison else event.user
         user_input = self.query_one(UserInput)
         user_input.text = event.text
         user_input.focus()
 
+    @on(UserInput.Changed)
+    def input_changed(self, event: UserInput.Changed) -> None:
+        """Stop editing earlier input once the input has been cleared.
+
+        Args:
+            event: The event to handle.
+        """
+        if not event.text_area.text:
+            self._editing = None
+
     @work
     async def _save_conversation_text(self) -> None:
         """Save the conversation as a Markdown document."""
@@ -180,6 +1243,9 @@ class Main(Screen[None]):
         if not target.suffix:
             target = target.with_suffix(".md")
 
+        # Make sure all of the conversation is there to be saved.
+        await self._history_loaded()
+
         # Save the Markdown to the target file.
         target.write_text(self._conversation.markdown)
 
@@ -188,7 +1254,11 @@ class Main(Screen[None]):
 
     def action_escape(self) -> None:
         """Process the escape request based on current context."""
-        if self.focused != (user_input := self.query_one(UserInput)):
+        # Whatever else escape does, it stops any editing of earlier input.
+        self._editing = None
+        if self._interacting:
+            self._stop_reply()
+        elif self.focused != (user_input := self.query_one(UserInput)):
             user_input.focus()
             self.query_one(Conversation).scroll_end(animate=False)
         elif self.focused == user_input:
@@ -0,0 +1,90 @@
+"""Provides a modal dialog for picking from the results of a search."""
+
+##############################################################################
+# Rich imports.
+from rich.text import Text
+
+##############################################################################
+# Textual imports.
+from textual import on
+from textual.app import ComposeResult
+from textual.markup import escape
+from textual.screen import ModalScreen
+from textual.widgets import OptionList
+from textual.widgets.option_list import Option
+
+##############################################################################
+# Local imports.
+from ..data import SearchHit
+
+
+##############################################################################
+class SearchResults(ModalScreen[SearchHit | None]):
+    """Modal dialog for picking from the results of a search of the library."""
+
+    DEFAULT_CSS = """
+    SearchResults {
+        align: center middle;
+        OptionList {
+            width: 80%;
+            max-height: 80%;
+            border: round $primary;
+            border-title-color: $text;
+            & > .option-list--option {
+                padding: 0 1;
+            }
+        }
+    }
+    """
+
+    BINDINGS = [("escape", "dismiss")]
+
+    def __init__(self, terms: list[str], hits: list[SearchHit]) -> None:
+        """Initialise the dialog.
+
+        Args:
+            terms: The terms that were searched for.
+            hits: The results of the search.
+        """
+        super().__init__()
+        self._terms = terms
+        """The terms that were searched for."""
+        self._hits = hits
+        """The results of the search."""
+
+    def _prompt(self, hit: SearchHit) -> Text:
+        """Make the prompt for a search result.
+
+        Args:
+            hit: The result to make the prompt for.
+
+        Returns:
+            The prompt, with the terms that were searched for highlighted.
+        """
+        snippet = Text(" ".join(hit.snippet.split()), style="dim")
+        snippet.highlight_words(self._terms, "bold reverse", case_sensitive=False)
+        return Text.assemble(
+            (f"{hit.conversation.id}: {hit.conversation.label}", "bold"),
+            f" ({hit.role}, message {hit.position + 1})\n",
+            snippet,
+        )
+
+    def compose(self) -> ComposeResult:
+        results = OptionList(*[Option(self._prompt(hit)) for hit in self._hits])
+        results.border_title = (
+            f"{len(self._hits)} match{'' if len(self._hits) == 1 else 'es'} for "
+            f"{escape(' '.join(self._terms))}"
+        )
+        yield results
+
+    @on(OptionList.OptionSelected)
+    def _pick(self, event: OptionList.OptionSelected) -> None:
+        """Pick the selected result.
+
+        Args:
+            event: The event to handle.
+        """
+        self.dismiss(self._hits[event.option_index])
+
+
+### search_results.py ends here
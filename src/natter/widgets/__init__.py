@@ -2,11 +2,28 @@
 
 ##############################################################################
 # Local imports.
-from .output import Assistant, Conversation, Error, User
+from .output import (
+    Assistant,
+    Comparison,
+    ComparisonColumn,
+    Conversation,
+    Error,
+    User,
+)
+from .status_bar import StatusBar
 from .user_input import UserInput
 
 ##############################################################################
 # Exports.
-__all__ = ["Assistant", "Conversation", "Error", "User", "UserInput"]
+__all__ = [
+    "Assistant",
+    "Comparison",
+    "ComparisonColumn",
+    "Conversation",
+    "Error",
+    "StatusBar",
+    "User",
+    "UserInput",
+]
 
 ### __init__.py ends here
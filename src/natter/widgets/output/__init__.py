@@ -3,12 +3,20 @@
 ##############################################################################
 # Local imports.
 from .assistant import Assistant
+from .comparison import Comparison, ComparisonColumn
 from .conversation import Conversation
 from .error import Error
 from .user import User
 
 ##############################################################################
 # Exports.
-__all__ = ["Assistant", "Error", "Conversation", "User"]
+__all__ = [
+    "Assistant",
+    "Comparison",
+    "ComparisonColumn",
+    "Conversation",
+    "Error",
+    "User",
+]
 
 ### __init__.py ends here
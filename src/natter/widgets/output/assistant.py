@@ -1,24 +1,73 @@
 """Widget that shows the output from the assistant."""
 
 ##############################################################################
-# Ollama imports.
-from ollama import Message
+# Python imports.
+from asyncio import to_thread
+from re import Pattern, compile
+from typing import Final
+
+##############################################################################
+# Markdown-it imports.
+from markdown_it import MarkdownIt
+from markdown_it.token import Token
 
 ##############################################################################
 # Textual imports.
 from textual.await_complete import AwaitComplete
 from textual.widgets import Markdown
+from textual.widgets.markdown import MarkdownBlock
+
+##############################################################################
+# Local imports.
+from ...data import ChatMessage
+from .code import CodeFence, code_parser
+
+
+##############################################################################
+class LazyCodeMarkdown(Markdown):
+    """A Markdown widget that only highlights code when it's seen."""
+
+    def __init__(self, markdown: str | None = None) -> None:
+        """Initialise the widget.
+
+        Args:
+            markdown: The Markdown to show.
+        """
+        super().__init__(markdown, parser_factory=code_parser)
+
+    def unhandled_token(self, token: Token) -> MarkdownBlock | None:
+        """Process an unhandled token.
+
+        Args:
+            token: The MarkdownIt token to handle.
+
+        Returns:
+            Either a widget to be added to the output, or `None`.
+        """
+        return CodeFence.from_token(self, token)
+
+
+##############################################################################
+class ResponseBlock(LazyCodeMarkdown):
+    """A widget to show one part of a streamed assistant response."""
+
+    DEFAULT_CSS = """
+    ResponseBlock {
+        padding: 0;
+        background: transparent;
+    }
+    """
 
 
 ##############################################################################
-class Assistant(Markdown, can_focus=True):
+class Assistant(LazyCodeMarkdown, can_focus=True):
     """A widget to show assistant chat."""
 
     DEFAULT_CSS = """
     Assistant {
         background: $primary-background;
         margin: 0;
-        MarkdownFence {
+        CodeFence {
             margin: 1 2;
             max-height: initial;
         }
@@ -29,13 +78,32 @@ class Assistant(Markdown, can_focus=True):
         ("c", "copy"),
     ]
 
-    def __init__(self, output: Message | dict[str, str] | str = ""):
+    _TOP_LEVEL: Final[int] = 0
+    """The nesting level of tokens that are top-level blocks in a document."""
+
+    _LINE_END: Final[Pattern[str]] = compile(r"\r\n|\r|\n")
+    """The line endings that the Markdown parser counts lines by."""
+
+    BLOCKS_PER_MOUNT: Final[int] = 16
+    """The most top-level blocks of finished text to mount at once."""
+
+    def __init__(self, output: ChatMessage | str = ""):
         """Initialise the assistant output.
 
         Args:
             output: Any initial output.
         """
-        super().__init__(output if isinstance(output, str) else output["content"])
+        super().__init__(
+            (output if isinstance(output, str) else output.content) or None
+        )
+        self._parser = MarkdownIt("gfm-like")
+        """The parser used to find the blocks in appended text."""
+        self._finished = 0
+        """The length of the text that is in finished blocks."""
+        self._tail: ResponseBlock | None = None
+        """The block showing the text that may still be being added to."""
+        self._revision = 0
+        """The revision of the text; it goes up each time the text changes."""
 
     def update(self, markdown: str) -> AwaitComplete:
         """Update the document with new Markdown.
@@ -52,7 +120,101 @@ class Assistant(Markdown, can_focus=True):
         # doing it here too means that it can be used to access the raw text
         # later on.
         self._markdown = markdown
-        return super().update(markdown)
+        self._revision += 1
+        # Any blocks created by appending are going to be replaced too.
+        self._finished = 0
+        self._tail = None
+        blocks = self.query_children(ResponseBlock)
+
+        async def replace() -> None:
+            await blocks.remove()
+            await Markdown.update(self, markdown)
+
+        return AwaitComplete(replace())
+
+    def _finished_blocks(self, text: str) -> list[int]:
+        """Find how to split up the finished blocks in some text.
+
+        Args:
+            text: The text to look in.
+
+        Returns:
+            The offsets at which to split the finished text into runs of no
+            more than `BLOCKS_PER_MOUNT` top-level blocks. The last offset
+            is the start of the last, possibly still open, block. If the
+            text doesn't contain more than one block the list is empty.
+        """
+        starts = [
+            token.map[0]
+            for token in self._parser.parse(text)
+            if token.level == self._TOP_LEVEL
+            and token.nesting >= 0
+            and token.map is not None
+        ]
+        if len(starts) < 2:
+            return []
+        offsets = [0, *(line_end.end() for line_end in self._LINE_END.finditer(text))]
+        return [
+            offsets[line]
+            for line in starts[self.BLOCKS_PER_MOUNT : -1 : self.BLOCKS_PER_MOUNT]
+            + [starts[-1]]
+        ]
+
+    def append(self, markdown: str) -> AwaitComplete:
+        """Append Markdown to the end of the document.
+
+        Args:
+            markdown: A string containing the Markdown to append.
+
+        Returns:
+            An optionally awaitable object. Await this to ensure that all
+            children have been mounted.
+
+        Note:
+            Unlike `update`, this doesn't rebuild the whole document. Blocks
+            that can no longer be changed by further appends are left
+            mounted as they are, and only the last block of the document is
+            parsed and rebuilt. Newly-finished blocks are mounted a few at a
+            time, so that a lot of text arriving at once doesn't hold up
+            the event loop for long.
+
+            The text is parsed in a thread, so that the event loop is left
+            free; if more text is added, or the document is updated, while
+            the text is being parsed, the result is dropped and the later
+            change takes care of the text instead.
+        """
+        self._markdown = (self._markdown or "") + markdown
+        self._revision += 1
+        revision = self._revision
+
+        async def append() -> None:
+            async with self.lock:
+                if revision != self._revision:
+                    return
+                tail = (self._markdown or "")[self._finished :]
+                splits = await to_thread(self._finished_blocks, tail)
+                if revision != self._revision:
+                    return
+                finished = 0
+                for split in splits:
+                    await self.mount(
+                        ResponseBlock(tail[finished:split]), before=self._tail
+                    )
+                    finished = split
+                self._finished += finished
+                tail = tail[finished:]
+                if self._tail is None:
+                    self._tail = ResponseBlock(tail)
+                    await self.mount(self._tail)
+                else:
+                    await self._tail.update(tail)
+
+        return AwaitComplete(append())
+
+    def mark_interrupted(self) -> None:
+        """Mark the output as a reply that was interrupted."""
+        self.add_class("-interrupted")
+        self.border_subtitle = "Interrupted"
 
     @property
     def raw_text(self) -> str:
@@ -0,0 +1,280 @@
+"""Widgets for showing code in the output, highlighting it only when seen."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from asyncio import to_thread
+from typing import ClassVar, Final
+
+##############################################################################
+# Markdown-it imports.
+from markdown_it import MarkdownIt
+from markdown_it.rules_core import StateCore
+from markdown_it.token import Token
+
+##############################################################################
+# Rich imports.
+from rich.cells import cell_len
+from rich.padding import Padding
+from rich.style import Style
+from rich.syntax import Syntax
+from rich.text import Text
+
+##############################################################################
+# Textual imports.
+from textual import work
+from textual.app import ComposeResult, RenderResult
+from textual.cache import LRUCache
+from textual.geometry import Size
+from textual.widget import Widget
+from textual.widgets import Markdown
+from textual.widgets.markdown import MarkdownBlock
+
+##############################################################################
+CODE_TOKEN: Final[str] = "natter_code"
+"""The type given to Markdown tokens that should be shown as `CodeFence`s."""
+
+TAB_SIZE: Final[int] = 4
+"""The number of spaces a tab in code is expanded to."""
+
+
+##############################################################################
+def _claim_code(state: StateCore) -> None:
+    """Claim the code tokens in a document for `CodeFence`.
+
+    Args:
+        state: The state of the parser.
+
+    Note:
+        Textual's `Markdown` widget turns code tokens into its own fences,
+        highlighting them as they are made; giving the tokens a type it
+        doesn't know means they're handed to `unhandled_token` instead.
+    """
+    for token in state.tokens:
+        if token.type in ("fence", "code_block"):
+            token.type = CODE_TOKEN
+
+
+##############################################################################
+def code_parser() -> MarkdownIt:
+    """Make a Markdown parser that leaves code to `CodeFence`.
+
+    Returns:
+        The parser.
+    """
+    parser = MarkdownIt("gfm-like")
+    parser.core.ruler.push("natter_code", _claim_code)
+    return parser
+
+
+##############################################################################
+def _highlight(code: str, lexer: str, theme: str, indent_guides: bool) -> Text:
+    """Syntax-highlight some code.
+
+    Args:
+        code: The code to highlight.
+        lexer: The name of the lexer to use.
+        theme: The name of the theme to use.
+        indent_guides: Should indent guides be drawn?
+
+    Returns:
+        The highlighted code.
+    """
+    syntax_theme = Syntax.get_theme(theme)
+    highlighted = Syntax(code, lexer, theme=syntax_theme, tab_size=TAB_SIZE).highlight(
+        code
+    )
+    highlighted.remove_suffix("\n")
+    highlighted.no_wrap = True
+    if not indent_guides:
+        return highlighted
+    return highlighted.with_indent_guides(
+        TAB_SIZE,
+        style=syntax_theme.get_background_style() + Style(dim=True),
+    )
+
+
+##############################################################################
+class Listing(Widget):
+    """A widget that shows code, highlighting it once it has been seen.
+
+    Until the listing is first drawn the code is just plain text, which is
+    all that's needed to lay it out. Highlighting then happens in a thread,
+    and the result is kept in a cache shared by all listings, so the same
+    code is never highlighted twice with the same theme.
+    """
+
+    DEFAULT_CSS = """
+    Listing {
+        height: auto;
+    }
+    """
+
+    PADDING: Final[tuple[int, int]] = (1, 2)
+    """The padding around the code."""
+
+    _highlighted: ClassVar[LRUCache[tuple[str, str, str, bool], Text]] = LRUCache(256)
+    """The cache of highlighted code, keyed on the code, lexer, theme and guides."""
+
+    def __init__(
+        self, code: str, lexer: str, theme: str, indent_guides: bool = True
+    ) -> None:
+        """Initialise the listing.
+
+        Args:
+            code: The code to show.
+            lexer: The name of the lexer to highlight the code with.
+            theme: The name of the theme to highlight the code with.
+            indent_guides: Should indent guides be drawn?
+        """
+        super().__init__()
+        self._code = code.expandtabs(TAB_SIZE)
+        """The code being shown."""
+        self._lexer = lexer
+        """The name of the lexer to highlight the code with."""
+        self._theme = theme
+        """The name of the theme to highlight the code with."""
+        self._indent_guides = indent_guides
+        """Should indent guides be drawn?"""
+        self._requested: tuple[str, str, str, bool] | None = None
+        """The highlighting that has last been asked for."""
+        lines = self._code.split("\n")
+        self._size = Size(
+            max(cell_len(line) for line in lines) + (self.PADDING[1] * 2),
+            len(lines) + (self.PADDING[0] * 2),
+        )
+        """The size the code takes up, with its padding."""
+
+    @property
+    def _key(self) -> tuple[str, str, str, bool]:
+        """The key for the highlighted code in the cache."""
+        return (self._code, self._lexer, self._theme, self._indent_guides)
+
+    @property
+    def theme(self) -> str:
+        """The name of the theme to highlight the code with."""
+        return self._theme
+
+    @theme.setter
+    def theme(self, theme: str) -> None:
+        self._theme = theme
+        self.refresh()
+
+    def get_content_width(self, container: Size, viewport: Size) -> int:
+        # The size of the code is known without highlighting it, and asking
+        # for a render here would mean everything gets highlighted on layout.
+        return max(container.width, self._size.width)
+
+    def get_content_height(self, container: Size, viewport: Size, width: int) -> int:
+        return self._size.height
+
+    @work(exclusive=True)
+    async def _highlight(self, key: tuple[str, str, str, bool]) -> None:
+        """Highlight the code in the background.
+
+        Args:
+            key: The key of the highlighting to do.
+        """
+        self._highlighted[key] = await to_thread(_highlight, *key)
+        self.refresh()
+
+    def render(self) -> RenderResult:
+        if (code := self._highlighted.get(self._key)) is None:
+            code = Text(self._code, no_wrap=True)
+            if self._requested != self._key:
+                self._requested = self._key
+                self._highlight(self._key)
+        return Padding(
+            code,
+            self.PADDING,
+            style=Syntax.get_theme(self._theme).get_background_style(),
+        )
+
+
+##############################################################################
+class CodeFence(MarkdownBlock):
+    """A fence Markdown block that is only highlighted once it's seen.
+
+    This takes the place of Textual's own fence, which isn't part of its
+    public API, and is styled in the same way.
+    """
+
+    DEFAULT_CSS = """
+    CodeFence {
+        margin: 1 0;
+        overflow: auto;
+        width: 100%;
+        height: auto;
+        max-height: 20;
+        color: rgb(210,210,210);
+    }
+
+    CodeFence > * {
+        width: auto;
+    }
+    """
+
+    def __init__(self, markdown: Markdown, code: str, lexer: str) -> None:
+        """Initialise the fence.
+
+        Args:
+            markdown: The Markdown document the fence is in.
+            code: The code in the fence.
+            lexer: The name of the lexer to highlight the code with.
+        """
+        super().__init__(markdown)
+        self.code = code
+        """The code in the fence."""
+        self.lexer = lexer
+        """The name of the lexer to highlight the code with."""
+
+    @classmethod
+    def from_token(cls, markdown: Markdown, token: Token) -> CodeFence | None:
+        """Make a fence from a Markdown token, if it's one of ours.
+
+        Args:
+            markdown: The Markdown document the fence is for.
+            token: The token.
+
+        Returns:
+            The fence, or `None` if the token isn't for code.
+        """
+        if token.type == CODE_TOKEN:
+            return cls(markdown, token.content.rstrip(), token.info)
+        return None
+
+    @property
+    def theme(self) -> str:
+        """The name of the theme to highlight the code with."""
+        return (
+            self._markdown.code_dark_theme
+            if self.app.current_theme.dark
+            else self._markdown.code_light_theme
+        )
+
+    @property
+    def indent_guides(self) -> bool:
+        """Should indent guides be drawn in the code?
+
+        Note:
+            Only newer versions of Textual let the document say; otherwise
+            indent guides are always drawn, as Textual's own fences do.
+        """
+        return bool(getattr(self._markdown, "code_indent_guides", True))
+
+    def on_mount(self) -> None:
+        """Watch for the theme of the application changing."""
+        self.watch(self.app, "theme", self._retheme)
+
+    def _retheme(self) -> None:
+        """Rehighlight when the theme changes."""
+        self.query_one(Listing).theme = self.theme
+
+    def compose(self) -> ComposeResult:
+        yield Listing(self.code, self.lexer, self.theme, self.indent_guides)
+
+
+### code.py ends here
@@ -0,0 +1,98 @@
+"""Widgets for comparing the replies of several models to the same input."""
+
+##############################################################################
+# Textual imports.
+from textual.app import ComposeResult
+from textual.containers import Horizontal, Vertical
+from textual.widgets import Label
+
+##############################################################################
+# Local imports.
+from ...data import InteractionMetrics
+from .assistant import Assistant
+from .streamed_reply import StreamedReply
+from .user import User
+
+
+##############################################################################
+class ComparisonColumn(Vertical):
+    """A column that shows the reply of one of the models being compared."""
+
+    DEFAULT_CSS = """
+    ComparisonColumn {
+        width: 1fr;
+        height: auto;
+        Label {
+            width: 1fr;
+            padding: 0 1;
+            background: $panel;
+            color: $text-muted;
+        }
+    }
+    """
+
+    def __init__(self, title: str) -> None:
+        """Initialise the column.
+
+        Args:
+            title: The title of the column.
+        """
+        super().__init__()
+        self._title = title
+        """The title of the column."""
+        self.assistant = Assistant()
+        """The widget that shows the reply."""
+
+    def compose(self) -> ComposeResult:
+        yield Label(f"{self._title} │ waiting...")
+        yield self.assistant
+
+    def reply(self) -> StreamedReply:
+        """Create the context manager for showing the reply in the column.
+
+        Returns:
+            A `StreamedReply` context manager.
+        """
+        return StreamedReply(self, self.assistant)
+
+    def show_metrics(self, metrics: InteractionMetrics) -> None:
+        """Show the metrics of the reply.
+
+        Args:
+            metrics: The metrics to show.
+        """
+        self.query_one(Label).update(f"{self._title} │ {metrics.speed}")
+
+
+##############################################################################
+class Comparison(Vertical):
+    """Shows input from the user, with the replies of several models to it."""
+
+    DEFAULT_CSS = """
+    Comparison {
+        height: auto;
+        Horizontal {
+            height: auto;
+        }
+    }
+    """
+
+    def __init__(self, user: User, titles: list[str]) -> None:
+        """Initialise the comparison.
+
+        Args:
+            user: The widget showing the input from the user.
+            titles: The titles of the columns for the models being compared.
+        """
+        super().__init__()
+        self._user = user
+        """The widget showing the input from the user."""
+        self.columns = [ComparisonColumn(title) for title in titles]
+        """The columns that show the reply of each model."""
+
+    def compose(self) -> ComposeResult:
+        yield self._user
+        yield Horizontal(*self.columns)
+
+
+### comparison.py ends here
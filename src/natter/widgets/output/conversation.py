@@ -6,11 +6,15 @@ from __future__ import annotations
 
 ##############################################################################
 # Python imports.
+from collections.abc import Callable
 from types import TracebackType
+from typing import Final
 
 ##############################################################################
 # Textual imports.
+from textual import work
 from textual.containers import VerticalScroll
+from textual.widget import Widget
 from textual.widgets import LoadingIndicator
 
 ##############################################################################
@@ -19,56 +23,70 @@ from typing_extensions import Self
 
 ##############################################################################
 # Local imports.
-from ...data import ConversationData
+from ...data import ChatMessage, ConversationData
 from .assistant import Assistant
+from .comparison import Comparison, ComparisonColumn
 from .error import Error
+from .streamed_reply import StreamedReply
 from .user import User
 
 
 ##############################################################################
-class Interaction:
+class Interaction(StreamedReply):
     """Context manager for an instance of interaction in the conversation."""
 
-    def __init__(self, conversation: Conversation, user_input: str) -> None:
+    def __init__(self, conversation: Conversation, user: User) -> None:
         """Initialise the interaction.
 
         Args:
             conversation: The conversation that this interaction is part of.
-            user_input: The input from the user starting the interaction.
+            user: The widget showing the input that started the interaction.
         """
+        super().__init__(conversation, Assistant())
         self._conversation = conversation
-        self._user = User(user_input)
-        self._assistant = Assistant()
+        self._user = user
         self._loading = LoadingIndicator()
 
     async def __aenter__(self) -> Self:
         """Mount the widgets needed for the interaction.
 
         Mounts the user's input, the space for the assistant's reply, and
-        also the loading indicator.
+        also the loading indicator. If the user's input was queued, it is
+        already mounted, and is left where it is.
         """
-        await self._conversation.mount_all([self._user, self._assistant, self._loading])
+        if self._user.is_mounted:
+            self._user.remove_class("-queued")
+            await self._conversation.mount_all(
+                [self._assistant, self._loading], after=self._user
+            )
+        else:
+            await self._conversation.add(self._user, self._assistant, self._loading)
         self._loading.anchor()
-        return self
+        return await super().__aenter__()
 
-    async def update_response(self, response: str) -> None:
-        """Update the interaction with the assistant's response.
-
-        Args:
-            response: The response to update with.
-        """
-        await self._assistant.update(self._assistant.raw_text + response)
+    def _rendered(self) -> None:
         self._loading.anchor()
 
-    async def abandon(self, reason: str) -> None:
+    async def abandon(self, reason: str) -> Error:
         """Abandon the interaction.
 
         Args:
             reason: The reason to abandon the interaction.
+
+        Returns:
+            The widget showing the reason.
+
+        Note:
+            Unlike other replies, the reply is kept, marked as interrupted,
+            with the reason shown after it; that way every message in the
+            history of the conversation still has a widget showing it.
         """
-        await self._assistant.remove()
-        await self._conversation.mount(error := Error(reason))
+        await self._stop_rendering()
+        await self._flush()
+        self.interrupt()
+        await self._conversation.mount(error := Error(reason), after=self._assistant)
         error.anchor()
+        return error
 
     async def __aexit__(
         self,
@@ -78,12 +96,23 @@ class Interaction:
     ) -> None:
         """Clean up at the end of the interaction.
 
-        Removes the loading indicator.
+        Renders any outstanding response and removes the loading indicator.
         """
-        del exc_type, exc_val, exc_traceback
+        await super().__aexit__(exc_type, exc_val, exc_traceback)
         await self._loading.remove()
 
 
+##############################################################################
+class UnmountedHistory(Widget):
+    """A placeholder for the part of the history that isn't mounted yet."""
+
+    DEFAULT_CSS = """
+    UnmountedHistory {
+        height: 0;
+    }
+    """
+
+
 ##############################################################################
 class Conversation(VerticalScroll, can_focus=False):
     """Container for displaying a whole conversation."""
@@ -99,32 +128,364 @@ class Conversation(VerticalScroll, can_focus=False):
                 border-left: thick $primary;
             }
         }
+        User.-queued {
+            color: $text-muted;
+            text-style: italic;
+        }
+        Assistant.-interrupted {
+            border-bottom: dashed $warning;
+            border-subtitle-color: $warning;
+        }
     }
     """
 
+    BATCH_SIZE: Final[int] = 10
+    """The number of messages from the history to mount at a time."""
+
     def __init__(self, initial_conversation: ConversationData | None = None) -> None:
         """Initialise the conversation.
 
         Args:
             initial_conversation: The initial conversation to show.
+
+        Note:
+            Only the most recent messages in the conversation are mounted
+            to start with; older messages are mounted as the user scrolls
+            back towards them.
         """
+        history = list(initial_conversation or [])
+        self._unmounted = history[: max(0, len(history) - self.BATCH_SIZE)]
+        """The messages from the history that have yet to be mounted."""
+        self._history = UnmountedHistory()
+        """The placeholder that stands in for the unmounted history."""
+        self._mounting_history = False
+        """Are we in the middle of mounting more of the history?"""
+        self._queued: list[User] = []
+        """The widgets showing input that is waiting to be sent."""
         super().__init__(
-            *[
-                (User if ConversationData.is_user(part) else Assistant)(part)
-                for part in initial_conversation or []
-            ]
+            self._history,
+            *[self._widget_for(part) for part in history[len(self._unmounted) :]],
         )
 
-    def interaction(self, user_input: str) -> Interaction:
+    @staticmethod
+    def _widget_for(message: ChatMessage) -> User | Assistant:
+        """Create the widget to show a message from the history.
+
+        Args:
+            message: The message to create the widget for.
+
+        Returns:
+            The widget to show the message.
+        """
+        if ConversationData.is_user(message):
+            return User(message)
+        assistant = Assistant(message)
+        if ConversationData.is_interrupted(message):
+            assistant.mark_interrupted()
+        return assistant
+
+    def _estimated_height(self, message: ChatMessage) -> int:
+        """Estimate the height a message will take up once it is mounted.
+
+        Args:
+            message: The message to estimate the height of.
+
+        Returns:
+            The estimated height, in lines.
+        """
+        width = max(self.scrollable_content_region.width - 4, 20)
+        content = message.content
+        return 2 + content.count("\n") + (len(content) // width) + 1
+
+    def _size_history_placeholder(self) -> None:
+        """Size the unmounted history placeholder to its estimated height."""
+        self._history.styles.height = sum(
+            self._estimated_height(message) for message in self._unmounted
+        )
+
+    def on_mount(self) -> None:
+        """Configure the conversation once the DOM is ready."""
+        self._size_history_placeholder()
+
+    def on_resize(self) -> None:
+        """Handle the conversation being resized."""
+        self._size_history_placeholder()
+        self._mount_visible_history()
+
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        """React to the conversation being scrolled."""
+        super().watch_scroll_y(old_value, new_value)
+        self._mount_visible_history()
+
+    def _mount_visible_history(self) -> None:
+        """Mount more of the history if the user is getting close to it."""
+        if (
+            self._unmounted
+            and not self._mounting_history
+            and self.scroll_y
+            < self._history.outer_size.height + self.scrollable_content_region.height
+        ):
+            self._mounting_history = True
+            self._mount_history()
+
+    @work
+    async def _mount_history(self) -> None:
+        """Mount the next batch of messages from the history.
+
+        The scroll position of the conversation is adjusted so that what the
+        user is looking at stays where it is, even if the actual size of the
+        mounted messages differs from their estimated size.
+        """
+        batch = self._unmounted[-self.BATCH_SIZE :]
+        del self._unmounted[-self.BATCH_SIZE :]
+        restore_position = self._position_keeper()
+        await self.mount_all(
+            [self._widget_for(message) for message in batch], after=self._history
+        )
+        self._size_history_placeholder()
+
+        def finish_mounting() -> None:
+            restore_position()
+            self._mounting_history = False
+            self._mount_visible_history()
+
+        self.call_after_refresh(finish_mounting)
+
+    def _position_keeper(self) -> Callable[[], None]:
+        """Make a function that keeps what the user is looking at in place.
+
+        Returns:
+            A function that scrolls the conversation so that what the user
+            is looking at now is where it was, even if the height of what
+            is above it has changed. If the user is at the end of the
+            conversation, they're kept at the end.
+        """
+        anchor = self.children[1] if len(self.children) > 1 else None
+        offset = 0 if anchor is None else anchor.virtual_region.y - self.scroll_y
+        at_end = self.is_vertical_scroll_end
+
+        def restore_position() -> None:
+            if at_end:
+                self.scroll_end(animate=False, immediate=True)
+            elif anchor is not None:
+                self.scroll_to(
+                    y=anchor.virtual_region.y - offset,
+                    animate=False,
+                    force=True,
+                    immediate=True,
+                )
+
+        return restore_position
+
+    def add_history(self, messages: list[ChatMessage]) -> None:
+        """Add older messages to the start of the history.
+
+        Args:
+            messages: The messages to add.
+
+        Note:
+            Like the rest of the history, the messages are only mounted as
+            the user scrolls back towards them.
+        """
+        if not messages:
+            return
+        self._unmounted[:0] = messages
+        if self._mounting_history:
+            # Mounting more of the history will take care of the size of
+            # the placeholder and of keeping the user's place.
+            return
+        self._mounting_history = True
+        restore_position = self._position_keeper()
+        self._size_history_placeholder()
+
+        def finish_adding() -> None:
+            restore_position()
+            self._mounting_history = False
+            self._mount_visible_history()
+
+        self.call_after_refresh(finish_adding)
+
+    async def clear(self) -> None:
+        """Clear the conversation."""
+        self._unmounted = []
+        self._queued = []
+        await self.remove_children(self.children[1:])
+        self._size_history_placeholder()
+
+    async def show(
+        self, conversation: ConversationData, position: int | None = None
+    ) -> None:
+        """Show a different conversation.
+
+        Args:
+            conversation: The conversation to show.
+            position: The position of the message to show, if not the end.
+        """
+        await self.clear()
+        history = list(conversation)
+        self._unmounted = history[: max(0, len(history) - self.BATCH_SIZE)]
+        await self.mount_all(
+            [self._widget_for(message) for message in history[len(self._unmounted) :]]
+        )
+        self._size_history_placeholder()
+        if position is None:
+            self.scroll_end(animate=False)
+        else:
+            await self.go_to(position)
+
+    async def diverge(self, conversation: ConversationData, position: int) -> None:
+        """Show a different branch of the conversation being shown.
+
+        Args:
+            conversation: The conversation, now following the other branch.
+            position: The position in the history from which the branches
+                differ.
+
+        Note:
+            Only the messages from where the branches differ onwards are
+            replaced; everything before that is left as it is.
+        """
+        if position < len(self._unmounted):
+            await self.show(conversation)
+            return
+        await self.clear_queue()
+        messages = self._messages()
+        if (index := position - len(self._unmounted)) < len(messages):
+            await self.remove_children(
+                self.children[self.children.index(messages[index]) :]
+            )
+        await self.mount_all(
+            [self._widget_for(message) for message in list(conversation)[position:]]
+        )
+        self.scroll_end(animate=False)
+
+    def _messages(self) -> list[User | Assistant]:
+        """Get the widgets that show the mounted messages of the history.
+
+        Returns:
+            The widgets, in the order of their messages in the history.
+        """
+        return [
+            child
+            for child in self.children
+            if isinstance(child, (User, Assistant)) and not child.has_class("-queued")
+        ]
+
+    def position_of(self, message: User | Assistant) -> int | None:
+        """Get the position in the history of the message a widget shows.
+
+        Args:
+            message: The widget to get the position of.
+
+        Returns:
+            The position of the message, or `None` if the widget doesn't
+            show a message from the history.
+        """
+        try:
+            return len(self._unmounted) + self._messages().index(message)
+        except ValueError:
+            return None
+
+    async def go_to(self, position: int) -> None:
+        """Go to a message in the conversation.
+
+        Args:
+            position: The position of the message in the history.
+
+        Note:
+            If the message isn't mounted yet, it's mounted, along with
+            everything after it, so that the user can carry on reading
+            from there.
+        """
+        if position < len(self._unmounted):
+            batch = self._unmounted[position:]
+            del self._unmounted[position:]
+            await self.mount_all(
+                [self._widget_for(message) for message in batch], after=self._history
+            )
+            self._size_history_placeholder()
+        messages = self._messages()
+        if 0 <= (index := position - len(self._unmounted)) < len(messages):
+            self._mounting_history = True
+            message = messages[index]
+            message.focus(scroll_visible=False)
+
+            def finish_going() -> None:
+                self.scroll_to_widget(message, animate=False, top=True, immediate=True)
+                self._mounting_history = False
+                self._mount_visible_history()
+
+            self.call_after_refresh(finish_going)
+
+    async def add(self, *widgets: Widget) -> None:
+        """Add widgets to the end of the conversation.
+
+        Args:
+            widgets: The widgets to add.
+
+        Note:
+            The widgets are added ahead of any queued input.
+        """
+        await self.mount_all(widgets, before=self._queued[0] if self._queued else None)
+
+    async def queue(self, user_input: str) -> None:
+        """Show input from the user that is waiting to be sent.
+
+        Args:
+            user_input: The input from the user.
+        """
+        self._queued.append(queued := User(user_input))
+        await self.mount(queued.add_class("-queued"))
+        self.scroll_end(animate=False)
+
+    async def clear_queue(self) -> None:
+        """Remove all of the input that is waiting to be sent."""
+        queued, self._queued = self._queued, []
+        await self.remove_children(queued)
+
+    def _user(self, user_input: str, queued: bool) -> User:
+        """Get the widget to show input from the user.
+
+        Args:
+            user_input: The input from the user.
+            queued: Is the input the first of the queued input?
+
+        Returns:
+            The widget, which is the queued widget if the input was queued.
+        """
+        return self._queued.pop(0) if queued and self._queued else User(user_input)
+
+    async def compare(
+        self, user_input: str, titles: list[str], queued: bool = False
+    ) -> list[ComparisonColumn]:
+        """Add a comparison of the replies of several models to the conversation.
+
+        Args:
+            user_input: The input from the user.
+            titles: The titles of the columns for the models being compared.
+            queued: Is the input the first of the queued input?
+
+        Returns:
+            The columns that will show the reply of each model.
+        """
+        if (user := self._user(user_input, queued)).is_mounted:
+            await user.remove()
+            user = User(user_input)
+        await self.add(comparison := Comparison(user, titles))
+        comparison.anchor()
+        return comparison.columns
+
+    def interaction(self, user_input: str, queued: bool = False) -> Interaction:
         """Create an interaction within the conversation.
 
         Args:
             user_input: The input from the user.
+            queued: Is the input the first of the queued input?
 
         Returns:
             An `Interaction` context manager.
         """
-        return Interaction(self, user_input)
+        return Interaction(self, self._user(user_input, queued))
 
 
 ### conversation.py ends here
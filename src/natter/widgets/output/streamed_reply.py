@@ -0,0 +1,142 @@
+"""Provides for showing a reply as it streams in."""
+
+##############################################################################
+# Backward compatibility.
+from __future__ import annotations
+
+##############################################################################
+# Python imports.
+from asyncio import Event, Task, create_task, sleep
+from time import monotonic
+from types import TracebackType
+from typing import Final
+
+##############################################################################
+# Textual imports.
+from textual.widget import Widget
+
+##############################################################################
+# Typing extensions imports.
+from typing_extensions import Self
+
+##############################################################################
+# Local imports.
+from .assistant import Assistant
+from .error import Error
+
+
+##############################################################################
+class StreamedReply:
+    """Context manager for showing a reply in an `Assistant` as it streams in."""
+
+    FRAME_RATE: Final[float] = 30
+    """The maximum number of times per second the response will be rendered."""
+
+    BUFFER_SIZE: Final[int] = 256
+    """The number of parts of the response to buffer before coalescing them."""
+
+    def __init__(self, container: Widget, assistant: Assistant) -> None:
+        """Initialise the reply.
+
+        Args:
+            container: The widget that holds the assistant.
+            assistant: The widget to show the reply in.
+        """
+        self._container = container
+        self._assistant = assistant
+        self._pending: list[str] = []
+        """Response text that has been received but not yet rendered."""
+        self._received = Event()
+        """Event that is set when there is response text to render."""
+        self._receiving = True
+        """Is the response still being received?"""
+        self._renderer: Task[None] | None = None
+        """The task that renders the response as it is received."""
+        self.renders: list[float] = []
+        """The time taken by each render of the response."""
+
+    async def __aenter__(self) -> Self:
+        """Start rendering the reply as it is received."""
+        self._renderer = create_task(self._render(), name="natter-render")
+        return self
+
+    def update_response(self, response: str) -> None:
+        """Update the reply with more of the assistant's response.
+
+        Args:
+            response: The response to update with.
+
+        Note:
+            The response isn't rendered right away; instead it is buffered
+            and rendered, separately, no more than `FRAME_RATE` times a
+            second. Updating never waits on rendering, so the response can
+            be received as fast as it arrives however long rendering takes.
+        """
+        if len(self._pending) >= self.BUFFER_SIZE:
+            # Rendering is falling behind; rather than let the buffer grow
+            # without limit, or make the caller wait, coalesce it.
+            self._pending[:] = ["".join(self._pending)]
+        self._pending.append(response)
+        self._received.set()
+
+    async def _render(self) -> None:
+        """Render the response as it is received."""
+        while self._receiving:
+            await self._received.wait()
+            self._received.clear()
+            started = monotonic()
+            await self._flush()
+            await sleep(max(0, (1 / self.FRAME_RATE) - (monotonic() - started)))
+
+    async def _stop_rendering(self) -> None:
+        """Stop rendering the response as it is received."""
+        self._receiving = False
+        self._received.set()
+        if self._renderer is not None:
+            await self._renderer
+
+    def _rendered(self) -> None:
+        """Called after more of the response has been rendered."""
+
+    async def _flush(self) -> None:
+        """Render any response text that has yet to be shown."""
+        if self._pending:
+            response = "".join(self._pending)
+            self._pending.clear()
+            started = monotonic()
+            await self._assistant.append(response)
+            self.renders.append(monotonic() - started)
+            self._rendered()
+
+    def interrupt(self) -> None:
+        """Mark the reply as interrupted."""
+        self._assistant.mark_interrupted()
+
+    async def abandon(self, reason: str) -> Error:
+        """Abandon the reply.
+
+        Args:
+            reason: The reason to abandon the reply.
+
+        Returns:
+            The widget showing the reason, which takes the place of the reply.
+        """
+        await self._stop_rendering()
+        self._pending.clear()
+        await self._container.mount(error := Error(reason), before=self._assistant)
+        await self._assistant.remove()
+        return error
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        """Render any outstanding response."""
+        del exc_type, exc_val, exc_traceback
+        await self._stop_rendering()
+        await self._flush()
+
+
+### streamed_reply.py ends here
@@ -4,15 +4,15 @@
 # Python imports.
 from dataclasses import dataclass
 
-##############################################################################
-# Ollama imports.
-from ollama import Message
-
 ##############################################################################
 # Textual imports.
 from textual.message import Message as TextualMessage
 from textual.widgets import Label
 
+##############################################################################
+# Local imports.
+from ...data import ChatMessage
+
 
 ##############################################################################
 class User(Label, can_focus=True):
@@ -30,13 +30,13 @@ class User(Label, can_focus=True):
         ("c", "copy"),
     ]
 
-    def __init__(self, output: Message | dict[str, str] | str) -> None:
+    def __init__(self, output: ChatMessage | str) -> None:
         """Initialise the user's output.
 
         Args:
             output: The user's output.
         """
-        self._raw_text = output if isinstance(output, str) else output["content"]
+        self._raw_text = output if isinstance(output, str) else output.content
         super().__init__(self._raw_text)
 
     @property
@@ -51,9 +51,12 @@ class User(Label, can_focus=True):
         text: str
         """The text the user wants to edit."""
 
+        user: "User"
+        """The widget showing the input the user wants to edit."""
+
     def action_edit(self) -> None:
         """Post a message providing text to edit."""
-        self.post_message(self.Edit(self.raw_text))
+        self.post_message(self.Edit(self.raw_text, self))
 
     def action_copy(self) -> None:
         """Copy the raw text of this widget to the clipboard."""
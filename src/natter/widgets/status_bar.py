@@ -0,0 +1,35 @@
+"""A widget for showing the status of the latest interaction."""
+
+##############################################################################
+# Textual imports.
+from textual.widgets import Label
+
+##############################################################################
+# Local imports.
+from ..data import InteractionMetrics
+
+
+##############################################################################
+class StatusBar(Label):
+    """A status bar that shows performance metrics for the latest interaction."""
+
+    DEFAULT_CSS = """
+    StatusBar {
+        width: 1fr;
+        height: 1;
+        padding: 0 1;
+        background: $panel;
+        color: $text-muted;
+    }
+    """
+
+    def show_metrics(self, metrics: InteractionMetrics) -> None:
+        """Show the given metrics.
+
+        Args:
+            metrics: The metrics to show.
+        """
+        self.update(f"{metrics.model} │ {metrics.summary}")
+
+
+### status_bar.py ends here
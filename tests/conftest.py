@@ -0,0 +1,28 @@
+"""Shared fixtures for the tests."""
+
+##############################################################################
+# Python imports.
+from collections.abc import Iterator
+from pathlib import Path
+
+##############################################################################
+# Pytest imports.
+from pytest import MonkeyPatch, fixture
+
+##############################################################################
+# Local imports.
+from natter.data import load_configuration
+
+
+##############################################################################
+@fixture(autouse=True)
+def isolated_locations(tmp_path: Path, monkeypatch: MonkeyPatch) -> Iterator[None]:
+    """Give each test its own, empty, data and configuration directories."""
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    load_configuration.cache_clear()
+    yield
+    load_configuration.cache_clear()
+
+
+### conftest.py ends here
@@ -0,0 +1,90 @@
+"""Tests for interactions with the model from the main screen."""
+
+##############################################################################
+# Python imports.
+from asyncio import Event, run
+from collections.abc import Sequence
+
+##############################################################################
+# Pytest imports.
+from pytest import MonkeyPatch, importorskip
+
+##############################################################################
+# Textual imports.
+from textual.pilot import Pilot
+
+##############################################################################
+# Local imports.
+from natter.app import Natter
+from natter.data import (
+    ConversationData,
+    ConversationJournal,
+    ongoing_journal,
+    update_configuration,
+)
+from natter.screens import Main
+from natter.widgets import Assistant, Conversation, User
+
+
+##############################################################################
+def test_stop_while_recalling(monkeypatch: MonkeyPatch) -> None:
+    """Stopping a reply while recall is under way should interrupt it."""
+    importorskip("numpy")
+    with update_configuration() as configuration:
+        configuration.recall = True
+        configuration.recall_context = 2
+    embedding = Event()
+
+    async def embed(_: Main, __: list[str]) -> list[Sequence[float]]:
+        embedding.set()
+        await Event().wait()
+        return []
+
+    monkeypatch.setattr(Main, "_embed", embed)
+
+    async def stop_while_recalling(main: Main, pilot: Pilot[None], text: str) -> None:
+        embedding.clear()
+        await main._submit(text)
+        await embedding.wait()
+        main._stop_reply()
+        while main._interacting:
+            await pilot.pause()
+
+    async def interact() -> None:
+        async with (app := Natter()).run_test() as pilot:
+            assert isinstance(main := app.screen, Main)
+            await stop_while_recalling(main, pilot, "one")
+            await stop_while_recalling(main, pilot, "two")
+            await pilot.pause()
+            expected = [
+                ("user", "one", None),
+                ("assistant", "", ConversationData.INTERRUPTED),
+                ("user", "two", None),
+                ("assistant", "", ConversationData.INTERRUPTED),
+            ]
+            assert [
+                (message.role, message.content, message.done_reason)
+                for message in main._conversation
+            ] == expected
+            assert [
+                (message.role, message.content, message.done_reason)
+                for message in ConversationJournal(ongoing_journal()).load()
+            ] == expected
+            conversation = main.query_one(Conversation)
+            shown = [
+                widget
+                for widget in conversation.children
+                if isinstance(widget, (User, Assistant))
+            ]
+            assert [type(widget) for widget in shown] == [User, Assistant] * 2
+            assert [conversation.position_of(widget) for widget in shown] == [
+                0,
+                1,
+                2,
+                3,
+            ]
+
+    run(interact())
+
+
+### test_interaction.py ends here
@@ -0,0 +1,55 @@
+"""Tests for the journal that a conversation is saved in."""
+
+##############################################################################
+# Python imports.
+from pathlib import Path
+
+##############################################################################
+# Local imports.
+from natter.data import ConversationData, ConversationJournal, GenerationStats
+
+
+##############################################################################
+def _saved(path: Path) -> ConversationData:
+    """Save a conversation, part way through a reply, to a journal.
+
+    Args:
+        path: The path to the journal.
+
+    Returns:
+        The conversation.
+    """
+    conversation = ConversationData("Test", "model")
+    conversation.record({"role": "user", "content": "Hello"})
+    conversation.record({"role": "assistant", "content": "Hi there"})
+    ConversationJournal(path).save(conversation)
+    return conversation
+
+
+##############################################################################
+def test_save_interrupted(tmp_path: Path) -> None:
+    """Interrupting a reply that was already saved should be saved."""
+    journal = ConversationJournal(path := tmp_path / "journal.jsonl")
+    conversation = _saved(path)
+    journal.load()
+    journal.save(conversation.interrupt())
+    loaded = ConversationJournal(path).load()
+    assert [message.done_reason for message in loaded] == [
+        None,
+        ConversationData.INTERRUPTED,
+    ]
+
+
+##############################################################################
+def test_save_stats(tmp_path: Path) -> None:
+    """Statistics recorded for a reply that was already saved should be saved."""
+    journal = ConversationJournal(path := tmp_path / "journal.jsonl")
+    conversation = _saved(path)
+    journal.load()
+    stats = GenerationStats("model", "host", 3, 1_000, 2, 500)
+    journal.save(conversation.record_stats(stats))
+    loaded = ConversationJournal(path).load()
+    assert [message.stats for message in loaded] == [None, stats]
+
+
+### test_journal.py ends here